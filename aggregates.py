@@ -0,0 +1,314 @@
+import itertools
+import time
+import weakref
+import numpy as np
+import pandas as pd
+from anomaly_detector import power_columns
+from features import source_frame
+from metrics import REGISTRY
+
+#pyramid levels from finest to coarsest, each built by summing the level below
+RESOLUTIONS = ['minute', '30min', 'hour', 'day']
+STEP_NS = {
+    'minute': 60 * 10**9,
+    '30min':  30 * 60 * 10**9,
+    'hour':   60 * 60 * 10**9,
+    'day':    24 * 60 * 60 * 10**9,
+}
+NAT = np.iinfo(np.int64).min   #NaT viewed as int64
+FRAME_CHUNK_ROWS = 200_000   #raw rows folded into the pyramid per extend() by from_frame; bounds the transient float64 copies to a few tens of MB
+_versions = itertools.count()  #process-wide, so versions of different pyramids never collide
+
+REGROUP_SECONDS = REGISTRY.histogram("hem_regroup_seconds", "Time to materialise a grouped frame or window index from the pyramid", ["resolution", "kind"])
+EXTEND_SECONDS = REGISTRY.histogram("hem_pyramid_extend_seconds", "Time to fold new readings into every pyramid level")
+
+def _to_ns(when):   #datetime-like values as int64 nanoseconds since the epoch
+    return np.asarray(pd.to_datetime(when).to_numpy(dtype='datetime64[ns]')).view('int64')
+
+def _reduce(keys, values):   #sum values sharing a key; keys need not be sorted
+    if len(keys) and np.any(keys[1:] < keys[:-1]):
+        order = np.argsort(keys, kind='stable')
+        keys, values = keys[order], values[order]
+    if not len(keys):
+        return keys, values
+    starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    return keys[starts], np.add.reduceat(values, starts, axis=0)
+
+
+class _Level:   #one pyramid level held in growable arrays so appends are amortised O(1)
+
+    def __init__(self, step, n_cols, capacity=1024):
+        self.step = step
+        self.n = 0
+        self._keys = np.empty(capacity, dtype=np.int64)
+        self._values = np.empty((capacity, n_cols), dtype=np.float64)
+
+    @property
+    def keys(self):
+        return self._keys[:self.n]
+
+    @property
+    def values(self):
+        return self._values[:self.n]
+
+    @classmethod
+    def wrap(cls, step, keys, values):   #level over existing arrays, e.g. read-only memory maps; they are copied on first write
+        level = cls.__new__(cls)
+        level.step = step
+        level.n = len(keys)
+        level._keys = keys
+        level._values = values
+        return level
+
+    def reserve(self, capacity, keep=None):   #grow the arrays to hold at least capacity periods, keeping the first keep (default: all) of them
+        keep = self.n if keep is None else keep
+        grown_keys = np.empty(capacity, dtype=np.int64)
+        grown_values = np.empty((capacity, self._values.shape[1]), dtype=np.float64)
+        grown_keys[:keep] = self._keys[:keep]
+        grown_values[:keep] = self._values[:keep]
+        self._keys, self._values = grown_keys, grown_values
+
+    def replace_tail(self, cut, keys, values):   #overwrite everything from position cut onwards
+        needed = cut + len(keys)
+        if needed > len(self._keys) or not self._keys.flags.writeable:
+            self.reserve(max(needed, 2 * len(self._keys)), keep=cut)
+        self._keys[cut:needed] = keys
+        self._values[cut:needed] = values
+        self.n = needed
+
+    def merge(self, keys, values):   #fold already-floored (key, value) pairs in, returning the first key that changed
+        keys, values = _reduce(keys, values)
+        if not len(keys):
+            return None
+        cut = int(np.searchsorted(self.keys, keys[0]))
+        tail_keys, tail_values = _reduce(
+            np.concatenate((self.keys[cut:], keys)),
+            np.concatenate((self.values[cut:], values)),
+        )
+        self.replace_tail(cut, tail_keys, tail_values)
+        return int(keys[0])
+
+
+class _Lease:   #owner of the memory one published view exposes; numpy points every view derived from it back here, so it stays alive exactly as long as a reader can see that memory
+    __slots__ = ('__array_interface__', 'array', '__weakref__')
+
+    def __init__(self, array):
+        self.array = array
+        interface = dict(array.__array_interface__)
+        interface['data'] = (interface['data'][0], True)   #read-only
+        self.__array_interface__ = interface
+
+
+class SnapshotBuffer:   #growable arrays published as read-only views of their first n positions; double buffered, so appends go in place and a rewrite of a published position (an open period filling up) moves to the other generation, brought up to date from this one, instead of copying the whole history
+    #specs: (row shape, dtype, lead) per array; positions run along the first axis after lead leading slots that stay zero, such as a prefix sum's 0
+
+    def __init__(self, specs, capacity=1024, arrays=None, n=0):
+        self.specs = specs
+        self.n = n
+        self.arrays = arrays if arrays is not None else self._allocate(capacity)   #the generation written and published; read-only arrays (a shared pyramid level) are only ever copied from
+        self.published = 0                       #positions of it that published views may hold
+        self._spare = None                       #the other generation, matching this one up to _spare_valid
+        self._spare_valid = 0
+        self._leases = weakref.WeakSet()         #leases of the published views of each generation, alive while a reader holds one
+        self._spare_leases = weakref.WeakSet()
+        self.copied = 0                          #positions copied from one generation into another
+
+    def _allocate(self, capacity):
+        return [np.zeros((capacity + lead,) + shape, dtype) for shape, dtype, lead in self.specs]
+
+    def _capacity(self, arrays):
+        return len(arrays[0]) - self.specs[0][2]
+
+    def write(self, cut, n):   #the arrays to fill positions [cut, n) of, every position before cut already in place
+        cut = min(cut, self.n)
+        size = self._capacity(self.arrays)
+        if cut < self.published or n > size or not self._writable(self.arrays):
+            spare, valid, leases = self._spare, self._spare_valid, self._spare_leases
+            if spare is None or n > self._capacity(spare) or not self._writable(spare) or leases:
+                spare, valid, leases = self._allocate(max(n, 2 * size) if n > size else size), 0, weakref.WeakSet()   #a held spare is left to its readers
+            self._copy(self.arrays, spare, valid, cut)
+            self._spare, self._spare_valid, self._spare_leases = self.arrays, cut, self._leases
+            self.arrays, self.published, self._leases = spare, 0, leases
+        else:
+            self._spare_valid = min(self._spare_valid, cut)
+        self.n = n
+        return self.arrays
+
+    def publish(self):   #read-only views of the first n positions, left untouched by later writes
+        leases = [_Lease(array[:self.n + lead]) for array, (_, _, lead) in zip(self.arrays, self.specs)]
+        self._leases.update(leases)
+        self.published = self.n
+        return [np.asarray(lease) for lease in leases]
+
+    def _copy(self, source, target, start, stop):
+        for src, dst, (_, _, lead) in zip(source, target, self.specs):
+            dst[start + lead:stop + lead] = src[start + lead:stop + lead]
+        self.copied += max(stop - start, 0)
+
+    @staticmethod
+    def _writable(arrays):
+        return all(array.flags.writeable for array in arrays)
+
+
+class AggregatePyramid:   #minute sums rolled up into 30min, hour and day sums, so a resolution switch is a lookup instead of a regroup
+
+    def __init__(self, columns=('total_power',)):
+        self.columns = list(columns)
+        self.levels = {res: _Level(STEP_NS[res], len(self.columns)) for res in RESOLUTIONS}
+        self.version = next(_versions)   #changes on every update so callers can key caches on it
+        self._frames = {}
+        self._windows = {}
+
+    @classmethod
+    def from_levels(cls, levels, columns=('total_power',)):   #pyramid over existing (keys, values) arrays per resolution, without copying them
+        pyramid = cls(columns)
+        pyramid.levels = {res: _Level.wrap(STEP_NS[res], *levels[res]) for res in RESOLUTIONS}
+        return pyramid
+
+    @classmethod
+    def from_frame(cls, data, chunk_rows=FRAME_CHUNK_ROWS):   #build all four levels from a preprocessed raw frame, with the feature source columns when the frame has them; rows are folded in chunk_rows at a time so the float64 source columns never exist for the whole frame at once
+        return cls.from_chunks([data], chunk_rows)
+
+    @classmethod
+    def from_chunks(cls, frames, chunk_rows=FRAME_CHUNK_ROWS, rows=None):   #build the levels from preprocessed raw frames folded in one after another, such as the chunks of a streamed text export, which are then never held together; rows, the expected total when the frames are chunks of it, sizes the levels up front
+        pyramid = None
+        for data in frames:
+            when, power = power_columns(data)
+            for start in range(0, max(len(data), 1), chunk_rows):
+                part = slice(start, start + chunk_rows)
+                sources = source_frame(data.iloc[part], power.iloc[part])
+                if pyramid is None:
+                    pyramid = cls(sources.columns)
+                    pyramid._reserve(when, rows)
+                pyramid.extend(when.iloc[part], sources)
+        return pyramid if pyramid is not None else cls()
+
+    def _reserve(self, when, rows=None):   #size every level for the periods the readings can span, at most one per reading, so building never doubles and copies the arrays; given rows, when is only the first of that many readings and each level is extrapolated from it
+        ts = _to_ns(when)
+        ts = ts[ts != NAT]
+        if not len(ts):
+            return
+        lo, hi = int(ts.min()), int(ts.max())
+        scale = max(rows / len(ts), 1.0) if rows else 1.0
+        for level in self.levels.values():
+            level.reserve(int(min(hi // level.step - lo // level.step + 1, len(ts)) * scale))
+
+    def extend(self, when, values):   #append raw readings, as a frame of (some of) the pyramid's columns or a bare total_power array; only the buckets they touch are recomputed on every level. Returns the first changed position per resolution
+        start_time = time.perf_counter()
+        ts = _to_ns(when)
+        if isinstance(values, pd.DataFrame):
+            values = values.reindex(columns=self.columns, fill_value=0.0).to_numpy(dtype=np.float64)   #missing columns count as zero
+        else:
+            power = np.asarray(values, dtype=np.float64).reshape(len(ts), -1)
+            values = np.zeros((len(ts), len(self.columns)))
+            values[:, :power.shape[1]] = power
+        values = np.nan_to_num(values)
+        valid = ts != NAT
+        ts, values = ts[valid], values[valid]
+        if not len(ts):
+            return {}
+
+        minute = self.levels['minute']
+        changed_from = minute.merge(ts - ts % minute.step, values)
+        changed = {'minute': int(np.searchsorted(minute.keys, changed_from))}
+
+        #re-roll each coarser level from the first bucket the level below changed
+        below = minute
+        for res in RESOLUTIONS[1:]:
+            level = self.levels[res]
+            changed_from -= changed_from % level.step
+            start = int(np.searchsorted(below.keys, changed_from))
+            keys = below.keys[start:]
+            rolled_keys, rolled_values = _reduce(keys - keys % level.step, below.values[start:])
+            changed[res] = int(np.searchsorted(level.keys, changed_from))
+            level.replace_tail(changed[res], rolled_keys, rolled_values)
+            below = level
+
+        self.version = next(_versions)   #bumped last, so a cache entry built while the levels were changing is never reused
+        self._frames = {}
+        self._windows = {}
+        EXTEND_SECONDS.observe(time.perf_counter() - start_time)
+        return changed
+
+    def __len__(self):
+        return self.levels['minute'].n
+
+    def nbytes(self):   #bytes held by the level arrays, including spare capacity for appends
+        return sum(level._keys.nbytes + level._values.nbytes for level in self.levels.values())
+
+    def frame(self, resolution):   #grouped frame with 'group', 'total_power' and any feature source columns, as group_sources would return; unknown resolutions fall back to minute
+        resolution = resolution if resolution in self.levels else 'minute'
+        version = self.version
+        cached = self._frames.get(resolution)
+        if cached is None or cached[0] != version:
+            start = time.perf_counter()
+            level = self.levels[resolution]
+            #writable buffers get their tail rewritten by extend(), so only read-only (shared) levels are used without a copy
+            shared = not level.keys.flags.writeable
+            cols = {'group': (level.keys if shared else level.keys.copy()).view('datetime64[ns]')}
+            for i, name in enumerate(self.columns):
+                cols[name] = level.values[:, i] if shared else level.values[:, i].copy()
+            cached = self._frames[resolution] = (version, pd.DataFrame(cols, copy=False))
+            REGROUP_SECONDS.labels(resolution, "frame").observe(time.perf_counter() - start)
+        return cached[1]
+
+    def window_index(self, resolution):   #prefix-sum index aligned with frame(resolution), built once per version
+        resolution = resolution if resolution in self.levels else 'minute'
+        version = self.version
+        cached = self._windows.get(resolution)
+        if cached is None or cached[0] != version:
+            grouped = self.frame(resolution)
+            start = time.perf_counter()
+            cached = self._windows[resolution] = (version, WindowIndex.from_frame(grouped))
+            REGROUP_SECONDS.labels(resolution, "window_index").observe(time.perf_counter() - start)
+        return cached[1]
+
+    def column(self, resolution, name='total_power'):   #one column of a level as a view, without building a frame; only valid until the next extend()
+        return self.levels[resolution].values[:, self.columns.index(name)]
+
+
+def window_periods(window, resolution):   #number of periods in a window given as a count ("7") or a duration ("24h", "7D") at this resolution
+    window = str(window).strip()
+    if window.isdigit():
+        return max(int(window), 1)
+    step = STEP_NS.get(resolution, STEP_NS['minute'])
+    return max(int(pd.Timedelta(window).value // step), 1)
+
+
+class WindowIndex:   #prefix sums over one grouped series, so any trailing window sum, mean or change is O(1)
+
+    def __init__(self, power):
+        self.values = np.nan_to_num(np.asarray(power, dtype=np.float64))
+        self.cumsum = np.concatenate(([0.0], np.cumsum(self.values)))
+
+    @classmethod
+    def from_frame(cls, grouped):
+        return cls(grouped['total_power'].to_numpy())
+
+    @classmethod
+    def from_prefix(cls, values, cumsum):   #index over existing values and their prefix sums (with the leading 0), without recomputing or copying them
+        index = cls.__new__(cls)
+        index.values = values
+        index.cumsum = cumsum
+        return index
+
+    def __len__(self):
+        return len(self.values)
+
+    def window_sum(self, end, length):   #sum of the length periods ending just before position end
+        return float(self.cumsum[end] - self.cumsum[end - length])
+
+    def window_mean(self, end, length):
+        return self.window_sum(end, length) / length
+
+    def pct_change(self, end, length):   #percentage change of the last window against the one before it, 0.0 until both are full
+        if end < 2 * length:
+            return 0.0
+        last = self.window_sum(end, length)
+        prev = self.window_sum(end - length, length)
+        return round(((last - prev) / prev) * 100, 1) if prev else 0.0
+
+    def delta(self, end):   #change of the last period against the one before it, 0.0 until there are two
+        if end < 2:
+            return 0.0
+        return round(float(self.values[end - 1] - self.values[end - 2]), 3)
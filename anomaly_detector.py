@@ -1,23 +1,80 @@
+import argparse
+import importlib.util
+import os
+import sys
+from collections import namedtuple
+from functools import partial
+import numpy as np
 import pandas as pd
+from dateutil.tz import gettz, tzlocal
 from sklearn.ensemble import IsolationForest
+import data_cache
+from detectors import DEFAULT_DETECTOR, DETECTORS, make_detector, parse_detectors
+from features import source_frame, has_features, feature_matrix
 
-def load_and_preprocess(xlsx_path):
+NUMERIC_COLS = [
+    'Global_active_power', 'Global_reactive_power',
+    'Voltage', 'Global_intensity',
+    'Sub_metering_1', 'Sub_metering_2', 'Sub_metering_3'
+]
+#raw measurements a compact frame keeps next to datetime and total_power: what the feature matrix reads
+COMPACT_COLS = ['Global_active_power', 'Voltage', 'Sub_metering_1', 'Sub_metering_2', 'Sub_metering_3']
+DATETIME_FORMAT = '%d/%m/%Y %H:%M:%S'   #layout of the UCI "Date Time" strings, e.g. 16/12/2006 17:24:00
+UTC_OFFSET = r'\d:\d{2}(?::\d{2}(?:\.\d+)?)?\s*(?:[zZ]|[+-]\d{2}(?::?\d{2})?)$'   #a time of day followed by Z or +hh:mm, the end of an ISO 8601 timestamp with an offset
+LOCAL_TZ = gettz() or tzlocal()   #the server's zone from its zoneinfo file, which pandas converts with vectorized transitions
+TEXT_EXTENSIONS = ('.txt', '.csv')
+FIT_PARAMS = {'contamination': 0.10, 'n_estimators': 100, 'max_samples': 'auto'}   #fit_and_score hyperparameters of the app's fits and of the batch CLI, so both label the same way
+TEXT_CHUNK_ROWS = 100_000   #rows parsed per chunk of a text export
 
-    data = pd.read_excel(xlsx_path, na_values=['?']) #read the Excel file; '?' marks missing values
-    
+def load_and_preprocess(xlsx_path, use_cache=True, cache_dir=None, compact=False):   #load the dataset, reusing the columnar cache unless the source file changed; compact keeps only what grouping and the features need (see compact_frame)
+    if use_cache:
+        return data_cache.cached_frame(xlsx_path, lambda: _read_and_preprocess(xlsx_path, compact), cache_dir,
+                                       variant='compact' if compact else None)
+    return _read_and_preprocess(xlsx_path, compact)
+
+def load_chunks(path, use_cache=True, cache_dir=None, compact=False):   #the preprocessed dataset as an iterable of frames that are never joined: a text export is parsed TEXT_CHUNK_ROWS rows at a time (and cached as it goes), anything else is one frame
+    if not path.lower().endswith(TEXT_EXTENSIONS):
+        return [load_and_preprocess(path, use_cache, cache_dir, compact)]
+    chunks = iter_text_chunks(path, TEXT_CHUNK_ROWS, compact)
+    if use_cache:
+        return data_cache.cached_chunks(path, chunks, cache_dir, variant='compact' if compact else None)
+    return chunks
+
+def estimate_rows(path, sample_bytes=1 << 16):   #approximate row count of a text export from its size and the mean length of its first lines, to size what it is streamed into; None for other formats
+    if not path.lower().endswith(TEXT_EXTENSIONS):
+        return None
+    with open(path, 'rb') as f:
+        head = f.read(sample_bytes)
+    lines = head.count(b'\n')
+    return int(os.path.getsize(path) * lines / len(head) * 1.05) if lines else None   #a little over, as an estimate short by one row doubles the arrays
+
+def _read_and_preprocess(path, compact=False):   #parse the source file, xlsx or the raw semicolon-delimited UCI text export
+    if path.lower().endswith(TEXT_EXTENSIONS):
+        return pd.concat(iter_text_chunks(path, compact=compact), ignore_index=True)   #compact chunks are shrunk before they are joined
+
+    data = pd.read_excel(path, na_values=['?']) #read the Excel file; '?' marks missing values
+    return preprocess_frame(data, compact)
+
+def parse_datetime(date, time):   #combine the "Date" and "Time" columns in the fixed day-first UCI format; rows that do not match it are NaT rather than guessed month-first
+    if pd.api.types.is_datetime64_any_dtype(date):
+        date = date.dt.strftime('%d/%m/%Y')   #Excel cells already read as dates
+    stamps = date.astype(str) + ' ' + time.astype(str)
+    return pd.to_datetime(stamps, format=DATETIME_FORMAT, errors='coerce')
+
+def preprocess_frame(data, compact=False):   #clean columns and compute total_power for a raw frame or a single chunk of one
     data.columns = data.columns.str.strip() #clean column names by stripping extra whitespace
 
-    data['datetime'] = pd.to_datetime(data['Date'].astype(str) + ' ' + data['Time'].astype(str))  #combine the "Date" and "Time" columns into a datetime column
+    data['datetime'] = parse_datetime(data['Date'], data['Time'])  #combine the "Date" and "Time" columns into a datetime column
+    if data['datetime'].isna().any():
+        data = data[data['datetime'].notna()].reset_index(drop=True)   #malformed timestamps are dropped, as the pyramid drops NaT
 
     #convert energy measurement columns to numeric
-    numeric_cols = [
-        'Global_active_power', 'Global_reactive_power',
-        'Voltage', 'Global_intensity',
-        'Sub_metering_1', 'Sub_metering_2', 'Sub_metering_3'
-    ]
-    for col in numeric_cols:
+    for col in NUMERIC_COLS:
         data[col] = pd.to_numeric(data[col], errors='coerce')
 
+    if compact:
+        return compact_frame(data)
+
     #compute total power using two methods and average them for robustness
     data['recorded_power'] = data['Global_active_power'] + data['Global_reactive_power']  #recorded_power
     data['calc_power'] = (data['Voltage'] * data['Global_intensity']) / 1000.0             #calc_power in kW
@@ -25,79 +82,212 @@ def load_and_preprocess(xlsx_path):
 
     return data
 
-def group_power(data, resolution):   #group total_power by the chosen time resolution, supporting both real and test DataFrames
-    df = data.copy()
+def compact_frame(data):   #datetime (int64 epoch ns), float32 total_power and float32 COMPACT_COLS only: no Date/Time strings, no recorded_power/calc_power, no float64 measurements
+    col = lambda name: data[name].to_numpy(dtype=np.float64)
+    #same average of recorded and calculated power as preprocess_frame, in float64 and without the intermediate columns
+    power = ((col('Global_active_power') + col('Global_reactive_power'))
+             + col('Voltage') * col('Global_intensity') / 1000.0) / 2.0
+    compact = {
+        'datetime':    data['datetime'].to_numpy(dtype='datetime64[ns]'),
+        'total_power': power.astype(np.float32),
+    }
+    for name in COMPACT_COLS:
+        compact[name] = data[name].to_numpy(dtype=np.float32)
+    return pd.DataFrame(compact, copy=False)
+
+def iter_text_chunks(txt_path, chunksize=TEXT_CHUNK_ROWS, compact=False):   #stream the UCI text export in bounded-memory chunks, each one fully preprocessed
+    reader = pd.read_csv(
+        txt_path,
+        sep=';',
+        na_values=['?'],               #'?' marks missing values
+        dtype={'Date': str, 'Time': str},
+        chunksize=chunksize,
+    )
+    with reader:
+        for chunk in reader:
+            yield preprocess_frame(chunk, compact)
 
+FREQ_MAP = {'minute': 'min', '30min': '30min', 'hour': 'h', 'day': 'D'}   #map resolution to pandas freq
+
+def power_columns(data):   #find or build the datetime and total_power columns, supporting both real and test DataFrames
     #find or build a datetime column
-    if 'datetime' not in df.columns:
-        if 'Datetime' in df.columns:
-            df['datetime'] = pd.to_datetime(df['Datetime'])
-        else:
-            raise KeyError("No 'datetime' or 'Datetime' column found")
+    if 'datetime' in data.columns:
+        when = data['datetime']
+    elif 'Datetime' in data.columns:
+        when = pd.to_datetime(data['Datetime'])
+    else:
+        raise KeyError("No 'datetime' or 'Datetime' column found")
 
     #find or build a total_power column
-    if 'total_power' not in df.columns:
-        if 'Global_active_power' in df.columns:
-            df['total_power'] = df['Global_active_power']
-        else:
-            raise KeyError("No 'total_power' or 'Global_active_power' column found")
+    if 'total_power' in data.columns:
+        power = data['total_power']
+    elif 'Global_active_power' in data.columns:
+        power = data['Global_active_power']
+    else:
+        raise KeyError("No 'total_power' or 'Global_active_power' column found")
+
+    return when, power.rename('total_power')
+
+def readings_frame(records):   #live meter readings (dicts) as a frame with datetime and total_power columns next to the raw fields; each needs "datetime" (or UCI Date and Time) and total_power (or the UCI measurements)
+    data = pd.DataFrame.from_records(records)
+    data.columns = data.columns.str.strip()
+
+    if 'datetime' in data.columns:
+        when = local_wall_clock(data['datetime'])
+    elif {'Date', 'Time'} <= set(data.columns):
+        when = parse_datetime(data['Date'], data['Time'])
+    else:
+        raise ValueError("readings need a 'datetime' field or 'Date' and 'Time'")
+
+    if 'total_power' in data.columns:
+        power = pd.to_numeric(data['total_power'], errors='coerce')
+    elif set(NUMERIC_COLS[:4]) <= set(data.columns):
+        for col in NUMERIC_COLS[:4]:
+            data[col] = pd.to_numeric(data[col], errors='coerce')
+        #same average of recorded and calculated power as preprocess_frame
+        power = ((data['Global_active_power'] + data['Global_reactive_power'])
+                 + (data['Voltage'] * data['Global_intensity']) / 1000.0) / 2.0
+    else:
+        raise ValueError("readings need 'total_power' or the Global_active_power, Global_reactive_power, Voltage and Global_intensity fields")
 
-    #map resolution to pandas freq
-    freq_map = {'minute': 'min', '30min': '30T', 'hour': 'h', 'day': 'D'}
-    freq = freq_map.get(resolution, 'T')
+    data['datetime'] = when
+    data['total_power'] = power
+    return data
+
+def local_wall_clock(values):   #timestamps as naive server-local wall-clock time, like the dataset's and the server clock's: naive ones are kept, ones with Z or an offset are converted, even when a batch mixes offsets; unparseable ones are NaT
+    stamps = values.astype(str).str.strip()
+    try:
+        when = pd.to_datetime(stamps, format='ISO8601', errors='coerce')   #one pass for the usual batch: all naive, or all with the same offset
+        return when.dt.tz_convert(LOCAL_TZ).dt.tz_localize(None) if when.dt.tz is not None else when
+    except ValueError:   #mixed offsets, or offsets next to naive stamps
+        pass
+    when = pd.to_datetime(stamps, format='ISO8601', errors='coerce', utc=True)   #naive stamps parse as if UTC, which leaves their wall-clock time unchanged
+    aware = stamps.str.contains(UTC_OFFSET).to_numpy()
+    return when.dt.tz_localize(None).where(~aware, when.dt.tz_convert(LOCAL_TZ).dt.tz_localize(None))
 
-    #floor to that period and group the sum
-    df['group'] = df['datetime'].dt.floor(freq)
-    grouped = df.groupby('group')['total_power'].sum().reset_index()
+def group_power(data, resolution):   #group total_power by the chosen time resolution, supporting both real and test DataFrames
+    when, power = power_columns(data)
+    freq = FREQ_MAP.get(resolution, 'min')
+
+    #floor to that period and group the sum, working on the two columns only rather than a copy of the frame
+    grouped = power.groupby(when.dt.floor(freq).rename('group')).sum().reset_index()
 
     return grouped.sort_values('group').reset_index(drop=True)
 
 
-def fit_detector(grouped_df):         #fit an IsolationForest on the grouped power data
-    model = IsolationForest(contamination=0.10, random_state=42)
-    model.fit(grouped_df[['total_power']])
-    orig_predict = model.predict
-    model.predict = lambda df: orig_predict(df).tolist()
+def group_sources(data, resolution):   #like group_power, but summing every feature source column the raw frame has
+    when, power = power_columns(data)
+    sources = source_frame(data, power)
+    grouped = sources.groupby(when.dt.floor(FREQ_MAP.get(resolution, 'min')).rename('group').to_numpy()).sum()
+    return grouped.rename_axis('group').reset_index().sort_values('group').reset_index(drop=True)
+
+def detector_input(grouped_df):   #what the detector sees: the float32 feature matrix when the grouped frame has the source columns, else total_power alone
+    if has_features(grouped_df):
+        return feature_matrix(grouped_df)
+    return grouped_df[['total_power']]
+
+def fit_detector(grouped_df, contamination=0.10, n_estimators=100, max_samples='auto'):         #fit an IsolationForest on the grouped power data, or on a feature matrix already built from it
+    model = IsolationForest(contamination=contamination, n_estimators=n_estimators, max_samples=max_samples, random_state=42)
+    model.fit(grouped_df if isinstance(grouped_df, np.ndarray) else detector_input(grouped_df))
+    model.predict = partial(_predict_list, model.predict)   #a partial rather than a lambda, so the model can still be pickled
     return model
 
-def find_first_anomaly(grouped_df, model):   #iterate through grouped data to find the first anomaly
-    for _, row in grouped_df.iterrows():
-        #use a DataFrame with correct feature name to suppress warnings
-        prediction = model.predict(pd.DataFrame([[row['total_power']]], columns=['total_power']))
-        if prediction[0] == -1:
-            #return timestamp and power of first detected anomaly
-            return row['group'], row['total_power']
-    return None, None
-
-def run_anomaly_detection():             #standalone script for anomaly detection over the full dataset
-    xlsx_path = "../household_power_consumption.xlsx"  #path to Excel file
-    data = load_and_preprocess(xlsx_path)
-
-    #aggregate minute usage
-    data['minute'] = data['datetime'].dt.floor('min')
-    minute_power = data.groupby('minute')['total_power'].sum().reset_index()
-    minute_power = minute_power.sort_values(by='minute').reset_index(drop=True)
-
-    #debug prints
-    print("Columns:", data.columns.tolist())
-    print("Total rows in dataset:", len(data))
-    print("Number of minute groups:", len(minute_power))
-    print("Minute Aggregated Data (last 5 rows):")
-    print(minute_power.tail())
-
-    #fit model and detect anomaly
-    clf = fit_detector(minute_power)
-    current_minute, current_total = find_first_anomaly(minute_power, clf)
-
-    if current_minute is not None:
-        print(f"Anomaly detected at {current_minute}: Total power = {current_total:.3f} kW")
-        print("Status: Anomaly Detected!")
-        print("Border color should be: red")
+def _predict_list(predict, df):
+    return predict(df).tolist()
+
+ScoredSeries = namedtuple('ScoredSeries', ['model', 'labels', 'scores'])   #a fitted model with labels/scores aligned to the rows of the grouped frame it was fitted on
+
+def score_series(model, grouped_df, X=None):   #score the whole grouped series in one vectorized pass (X: its detector_input, if already built); label -1 marks an anomaly, lower scores are more anomalous
+    X = detector_input(grouped_df) if X is None else X
+    scores = np.asarray(model.decision_function(X), dtype=float)
+    labels = np.where(scores < 0, -1, 1)   #same rule IsolationForest.predict applies to decision_function
+    return labels, scores
+
+def fit_and_score(grouped_df, window=None, detector=DEFAULT_DETECTOR, **params):   #fit a detector (a name in detectors.DETECTORS) with params, on only the trailing window (e.g. "365D") if given, and precompute its labels and scores for every grouped period
+    X = detector_input(grouped_df)   #the feature matrix is built once per fit, for training and scoring alike
+    train = X
+    if window and len(grouped_df):
+        start = grouped_df['group'].iat[-1] - pd.Timedelta(window)
+        train = X[int(grouped_df['group'].searchsorted(start, side='right')):]
+    model = fit_model(train, detector, **params)
+    labels, scores = score_series(model, grouped_df, X)
+    return ScoredSeries(model, labels, scores)
+
+def fit_model(X, detector=DEFAULT_DETECTOR, **params):   #fit the named detector on a detector_input matrix (or a slice of one), as every full fit and cross-validation fold does
+    #the default stays the plain IsolationForest fit_detector builds, so fits already in the model store load as before
+    return fit_detector(X, **params) if detector == DEFAULT_DETECTOR else make_detector(detector, **params).fit(X)
+
+def find_all_anomalies(grouped_df, model, scored=None):   #score the whole grouped series in one call (or take its score_series labels and scores as scored) and return every anomaly with its timestamp, power and score
+    labels, scores = score_series(model, grouped_df) if scored is None else scored
+    mask = labels == -1
+    return pd.DataFrame({
+        'group':       grouped_df['group'].to_numpy()[mask],
+        'total_power': grouped_df['total_power'].to_numpy()[mask],
+        'score':       scores[mask],
+    })
+
+def find_first_anomaly(grouped_df, model):   #timestamp and power of the first detected anomaly, or (None, None)
+    anomalies = find_all_anomalies(grouped_df, model)
+    if anomalies.empty:
+        return None, None
+    return anomalies['group'].iloc[0], anomalies['total_power'].iloc[0]
+
+def parquet_engine():   #True when pandas can write parquet: pyarrow or fastparquet is installed
+    return any(importlib.util.find_spec(name) is not None for name in ('pyarrow', 'fastparquet'))
+
+def write_anomalies(anomalies, output, fmt):   #write the anomaly table as csv, parquet or jsonl; output '-' means stdout (not for parquet)
+    if fmt == 'parquet':
+        anomalies.to_parquet(output, index=False)
+        return
+    target = sys.stdout if output == '-' else output
+    if fmt == 'jsonl':
+        anomalies.to_json(target, orient='records', lines=True, date_format='iso')   #ends with its own newline
     else:
-        print("No anomalies detected across the entire dataset.")
-        print("Status: No Anomalies Detected!")
-        print("Border color should be: green")
+        anomalies.to_csv(target, index=False)
+
+def run_anomaly_detection(argv=None):             #batch CLI: audit the full history for anomalies at any resolution in one vectorized pass
+    parser = argparse.ArgumentParser(description="Find every anomaly in the household power dataset")
+    parser.add_argument('--data', default=os.getenv("HOUSEHOLD_DATA_PATH", "household_power_consumption.xlsx"),
+                        help="dataset path (.xlsx, or the UCI .txt/.csv export)")
+    parser.add_argument('--resolution', default='minute', choices=list(FREQ_MAP))
+    parser.add_argument('--detector', choices=list(DETECTORS), help="detector to fit (default: the app's DETECTOR setting for the resolution)")
+    parser.add_argument('--start', help="only report anomalies at or after this timestamp")
+    parser.add_argument('--end', help="only report anomalies before this timestamp")
+    parser.add_argument('--format', dest='fmt', default='csv', choices=['csv', 'parquet', 'jsonl'])
+    parser.add_argument('--output', default='-', help="output file, '-' for stdout")
+    parser.add_argument('--store', help="also record the anomalies in this SQLite anomaly store, as served by /anomalies")
+    args = parser.parse_args(argv)
+    if args.fmt == 'parquet' and args.output == '-':
+        parser.error("--format parquet needs --output PATH")
+    if args.fmt == 'parquet' and not parquet_engine():
+        parser.error("--format parquet needs pyarrow (pip install pyarrow), or use csv or jsonl")
+    try:
+        detector = args.detector or parse_detectors(os.getenv("DETECTOR"), list(FREQ_MAP))[args.resolution]
+    except ValueError as e:
+        parser.error(f"DETECTOR: {e}")
+
+    from aggregates import AggregatePyramid   #imported here, as aggregates imports this module
+    grouped = AggregatePyramid.from_frame(load_and_preprocess(args.data)).frame(args.resolution)
+
+    #the app's startup fit: same grouped frame, detector and parameters, on the whole history; then report only the requested range
+    fitted = fit_and_score(grouped, detector=detector, **FIT_PARAMS)
+    anomalies = find_all_anomalies(grouped, fitted.model, (fitted.labels, fitted.scores))
+    if args.start:
+        anomalies = anomalies[anomalies['group'] >= pd.Timestamp(args.start)]
+    if args.end:
+        anomalies = anomalies[anomalies['group'] < pd.Timestamp(args.end)]
+    anomalies = anomalies.reset_index(drop=True)
+
+    write_anomalies(anomalies, args.output, args.fmt)
+    if args.store:
+        from anomaly_store import AnomalyStore
+        AnomalyStore(args.store).write(
+            (args.resolution, ts, power, score)
+            for ts, power, score in zip(anomalies['group'], anomalies['total_power'], anomalies['score'])
+        )
+    print(f"{len(anomalies)} anomalies in {len(grouped)} {args.resolution} periods", file=sys.stderr)
+    return anomalies
 
 
 if __name__ == '__main__':
-    run_anomaly_detection()
\ No newline at end of file
+    run_anomaly_detection()
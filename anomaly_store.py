@@ -0,0 +1,189 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)   #timestamps are naive wall-clock times, like the dataset's, stored as epoch milliseconds
+MILLISECOND = timedelta(milliseconds=1)
+
+EVENTS = REGISTRY.counter("hem_anomaly_events_total", "Anomaly events by outcome: queued, written or dropped", ["outcome"])
+FLUSH_SECONDS = REGISTRY.histogram("hem_anomaly_store_flush_seconds", "Time to write one batch of anomaly events to SQLite")
+
+#one row per anomalous period and resolution, so every poll of the same period updates one row instead of adding another;
+#(resolution, ts) serves queries for one resolution and (ts, resolution) queries across all of them, both in keyset order
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS anomalies (
+    ts          INTEGER NOT NULL,
+    resolution  TEXT    NOT NULL,
+    power       REAL    NOT NULL,
+    score       REAL    NOT NULL,
+    source      TEXT    NOT NULL,
+    recorded_at INTEGER NOT NULL,
+    PRIMARY KEY (resolution, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS anomalies_ts ON anomalies (ts, resolution);
+"""
+UPSERT = """
+INSERT INTO anomalies (ts, resolution, power, score, source, recorded_at) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (resolution, ts) DO UPDATE SET power = excluded.power, score = excluded.score,
+    source = excluded.source, recorded_at = excluded.recorded_at
+"""
+
+def to_ms(timestamp):   #naive datetime (or pandas Timestamp) as epoch milliseconds; plain datetime arithmetic is ~40x faster than pandas' for a Timestamp
+    return datetime.__sub__(timestamp, EPOCH) // MILLISECOND
+
+def from_ms(ms):
+    return EPOCH + ms * MILLISECOND
+
+def _filters(since, until, resolution):   #WHERE clauses and arguments shared by query and count
+    where, args = [], []
+    if since is not None:
+        where.append("ts >= ?")
+        args.append(to_ms(since))
+    if until is not None:
+        where.append("ts < ?")
+        args.append(to_ms(until))
+    if resolution is not None:
+        where.append("resolution = ?")
+        args.append(resolution)
+    return where, args
+
+def connect(path):   #WAL lets readers run while the writer commits, from any thread or worker process
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class AnomalyStore:   #anomaly events in SQLite; record() only enqueues, one background writer commits them in batches
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0, max_queue=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval   #longest an event waits for its batch to fill
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = threading.local()        #one connection per thread
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with connect(path) as conn:
+            conn.executescript(SCHEMA)
+        conn.close()
+
+    def record(self, resolution, timestamp, power, score, source="live"):   #enqueue one anomaly without blocking; returns False if it was dropped
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((to_ms(timestamp), resolution, float(power), float(score), source, int(time.time() * 1000)))
+        except queue.Full:
+            EVENTS.labels("dropped").inc()
+            log.warning("Anomaly store queue full, dropping event")
+            return False
+        EVENTS.labels("queued").inc()
+        return True
+
+    def write(self, rows, source="scan"):   #write (resolution, timestamp, power, score) rows synchronously in one transaction, e.g. the result of a batch scan
+        now = int(time.time() * 1000)
+        self._write_batch([(to_ms(ts), res, float(p), float(s), source, now) for res, ts, p, s in rows])
+
+    def flush(self, timeout=None):   #block until every queued event is committed; True if that happened in time
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def query(self, since=None, until=None, resolution=None, limit=100, after=None):   #anomalies in [since, until) oldest first, at most limit; after is the cursor returned with the previous page. Returns (rows, next cursor or None)
+        where, args = _filters(since, until, resolution)
+        if resolution is not None:
+            order = "ts"
+            if after is not None:
+                where.append("ts > ?")
+                args.append(after[0])
+        else:
+            order = "ts, resolution"
+            if after is not None:
+                where.append("(ts, resolution) > (?, ?)")   #row values keep the keyset on the (ts, resolution) index
+                args.extend(after)
+        sql = "SELECT ts, resolution, power, score, source FROM anomalies"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order} LIMIT ?"
+        rows = self._connection().execute(sql, args + [limit + 1]).fetchall()   #one extra row tells whether there is a next page
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        cursor = (rows[-1][0], rows[-1][1]) if more else None
+        return [{
+            "datetime":     from_ms(ts).isoformat(),
+            "resolution":   res,
+            "power":        round(power, 3),
+            "anomalyScore": round(score, 4),
+            "source":       source,
+        } for ts, res, power, score, source in rows], cursor
+
+    def count(self, since=None, until=None, resolution=None):   #number of anomalies matching the same filters as query
+        where, args = _filters(since, until, resolution)
+        sql = "SELECT COUNT(*) FROM anomalies" + (" WHERE " + " AND ".join(where) if where else "")
+        return self._connection().execute(sql, args).fetchone()[0]
+
+    def queue_size(self):   #events waiting for the writer
+        return self._queue.qsize()
+
+    def after_fork(self):   #call in a forked worker: the parent's writer thread and connections do not carry over
+        self._local = threading.local()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _connection(self):   #per thread, so the writer, synchronous write() callers and request threads never share one
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="anomaly-writer", daemon=True)
+                self._worker.start()
+
+    def _run(self):   #wait for one event, then gather whatever else arrives within flush_interval, up to batch_size, and commit them together
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception:
+                log.exception("Anomaly store write failed, %d events lost", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        start = time.perf_counter()
+        conn = self._connection()
+        with conn:
+            conn.executemany(UPSERT, batch)
+        FLUSH_SECONDS.observe(time.perf_counter() - start)
+        EVENTS.labels("written").inc(len(batch))
@@ -1,10 +1,35 @@
+import gzip
+import hashlib
+import json
 import os
+import re
 import threading
-import requests
+import time
+import uuid
+from functools import partial
+import numpy as np
 import pandas as pd
-from flask import Flask, jsonify, request
+import requests
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-from anomaly_detector import load_and_preprocess, group_power, fit_detector
+from anomaly_detector import FIT_PARAMS, estimate_rows, load_chunks, fit_and_score, readings_frame
+from aggregates import AggregatePyramid, RESOLUTIONS, window_periods
+from detectors import parse_detectors
+from model_registry import ModelRegistry
+from model_store import ModelStore
+from anomaly_store import AnomalyStore
+from online_detector import LiveScoring
+from notifier import TelegramNotifier, MESSAGES as TELEGRAM_MESSAGES, SEND_SECONDS as TELEGRAM_SECONDS
+from downsample import lttb_indices
+from replay import ReplayClock, parse_speed
+from episodes import AlertGate, episode_start, find_episodes
+from seasonal import NO_INSIGHTS, seasonal_insights
+from data_cache import default_cache_root
+from features import source_frame
+from memstat import process_memory
+from metrics import REGISTRY, CONTENT_TYPE
+from shared_state import shared_pyramid
+from sessions import SessionStore
 
 #load environment variables from .env file
 try:
@@ -25,24 +50,97 @@ app = Flask(
 )
 CORS(app)  #enable CORS
 
-xlsx_path = os.getenv("HOUSEHOLD_DATA_PATH", "household_power_consumption.xlsx")  #path to the household power consumption Excel file (configurable via env)
-
-data = load_and_preprocess(xlsx_path)  #load and preprocess the raw data upon startup
+INSIGHT_WINDOW = os.getenv("INSIGHT_WINDOW", "7")  #trailing window compared by the insights: a period count ("7") or a duration ("24h", "7D")
+STREAM_INTERVAL = float(os.getenv("STREAM_INTERVAL", "1"))  #seconds between data points pushed on /stream, matching the old 1s polling
+#open /stream connections per worker process; each holds a thread for as long as it is open, so the default leaves half of gunicorn's threads to polls and readings, and later streams get a 503 that makes the dashboard poll instead
+MAX_STREAMS = int(os.getenv("MAX_STREAMS") or max(int(os.getenv("HEM_THREADS", "8")) // 2, 1))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))     #seconds before an idle client cursor is forgotten
+SESSION_COOKIE = "hem_session"
+DEFAULT_RESOLUTION = 'minute'
+SHARED_DIR = os.getenv("HEM_SHARED_DIR")       #directory of memory-mapped pyramid exports attached by every worker process
+PRELOAD = os.getenv("HEM_PRELOAD") == "1"     #set by gunicorn.conf.py: finish every fit before the master forks its workers
+DEFER_LOAD = os.getenv("HEM_DEFER_LOAD") == "1"   #import the routes without loading or fitting anything; the caller hands its own pyramid and fits to serve() (the benchmark does)
+REFIT_INTERVAL = float(os.getenv("REFIT_INTERVAL", "3600"))  #seconds between full background refits once readings are being ingested
+REFIT_WINDOW = os.getenv("REFIT_WINDOW", "365D")             #trailing window of history every periodic refit is trained on; the startup fits use the whole history
+MAX_READINGS = int(os.getenv("MAX_READINGS", "10000"))       #largest batch accepted by POST /readings
+MAX_CLOCK_SKEW = float(os.getenv("MAX_CLOCK_SKEW", "300"))   #seconds a reading may be dated past the server clock (or the replay clock) before it is rejected as mis-dated
+HISTORY_POINTS = 1000                                        #default max_points of /history, about one per chart pixel
+HISTORY_MAX_POINTS = int(os.getenv("HISTORY_MAX_POINTS", "10000"))  #upper bound on the max_points a client may ask for
+COMPACT_DATA = os.getenv("COMPACT_DATA", "1") != "0"          #load only what the pyramid needs, as float32 (set 0 to keep the full preprocessed frame)
+MODEL_STORE = os.getenv("MODEL_STORE", "1") != "0"            #persist fitted detectors so a restart on unchanged data loads them instead of refitting
+REPLAY_SPEED = parse_speed(os.getenv("REPLAY_SPEED"))           #replay the recording on a virtual clock (1x, 60x, 3600x, ...) instead of one row per poll
+REPLAY_START = os.getenv("REPLAY_START")                       #virtual time the replay starts at, default the first recorded minute
+EPISODE_GAP = int(os.getenv("EPISODE_GAP", "2"))             #normal periods allowed inside one anomaly episode before it counts as two
+ALERT_COOLDOWN = float(os.getenv("ALERT_COOLDOWN", "300"))    #seconds after a Telegram alert before the next episode may alert
+SEASONAL_TIP_PCT = 20.0                                       #change against a typical period, or last week, that earns its own tip
+ANOMALY_PAGE = 100                                            #default page size of /anomalies
+ANOMALY_MAX_PAGE = 1000                                       #largest page a client may ask for
+REFIT_PARAMS = dict(FIT_PARAMS, window=REFIT_WINDOW)   #fit_and_score arguments of the periodic refits, which follow recent usage; the startup fits use FIT_PARAMS alone
+DETECTOR = parse_detectors(os.getenv("DETECTOR"), RESOLUTIONS)   #detector per resolution: "mad" for all, or e.g. "minute=mad,30min=histogram" with the rest on iforest
 
-#group by minute and fit anomaly detection model
-current_resolution = 'minute'
-grouped_data = group_power(data, current_resolution)
-model = fit_detector(grouped_data)
+xlsx_path = os.getenv("HOUSEHOLD_DATA_PATH", "household_power_consumption.xlsx")  #path to the household power consumption Excel file (configurable via env)
 
-#track the current index in the grouped data for polling
-current_index = 0  
-index_lock = threading.Lock()  
+#stage latencies and counters exposed at /metrics; the pyramid, model registry and notifier report their own
+LOAD_SECONDS = REGISTRY.histogram("hem_data_load_seconds", "Dataset load and pyramid build (or shared attach) time",
+                                  buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+REQUEST_SECONDS = REGISTRY.histogram("hem_http_request_duration_seconds", "Time to build each route's response; for /stream only until streaming starts", ["route", "method"])
+REQUESTS = REGISTRY.counter("hem_http_requests_total", "Requests by route, method and status code", ["route", "method", "status"])
+PREDICT_SECONDS = REGISTRY.histogram("hem_predict_seconds", "Time to look up the next data point with its anomaly label, score and insights", ["resolution"])
+INGEST_SECONDS = REGISTRY.histogram("hem_ingest_seconds", "Time to append and score one POST /readings batch")
+READINGS = REGISTRY.counter("hem_readings_ingested_total", "Ingested readings by outcome: accepted or rejected", ["outcome"])
+STREAMS = REGISTRY.gauge("hem_streams_open", "Server-Sent Events connections currently held open by this worker")
+
+def load_pyramid(path):   #load and preprocess the raw data, then sum it into the pyramid chunk by chunk; in shared mode attach an existing export instead
+    build = lambda: AggregatePyramid.from_chunks(load_chunks(path, compact=COMPACT_DATA), rows=estimate_rows(path))
+    with LOAD_SECONDS.time():
+        if SHARED_DIR:
+            return shared_pyramid(path, SHARED_DIR, build)
+        return build()
+
+#fit a detector for every resolution in the background, starting with the default one
+#fits for unchanged data and parameters are read back from the model store (HOUSEHOLD_CACHE_DIR, or .hem_cache next to the dataset)
+def fit_registry(params, max_entries):   #registry fitting every resolution's detector with these fit_and_score parameters, kept in the model store under them
+    store = ModelStore(os.path.join(default_cache_root(xlsx_path), "models"), params=dict(params, detector=DETECTOR)) if MODEL_STORE else None
+    return ModelRegistry({res: partial(fit_and_score, detector=DETECTOR[res], **params) for res in RESOLUTIONS},
+                         max_entries=max_entries, store=store)
+
+def serve(data, registry, refits):   #serve this pyramid with these first fits and periodic refits: sets every global that depends on the data
+    global pyramid, model_registry, refit_registry, scoring, replay_clock
+    pyramid, model_registry, refit_registry = data, registry, refits
+
+    #live readings are scored online against the fits until the next periodic refit
+    scoring = LiveScoring(pyramid, model_registry, refit_interval=REFIT_INTERVAL, refits=refit_registry)
+
+    #in replay mode every client sees the point at the same virtual time, however often it polls
+    replay_clock = ReplayClock(
+        pyramid, REPLAY_SPEED, pd.Timestamp(REPLAY_START).value if REPLAY_START else None
+    ) if REPLAY_SPEED > 0 else None
+
+pyramid = model_registry = refit_registry = scoring = replay_clock = None   #until serve()
+if not DEFER_LOAD:
+    pyramid = load_pyramid(xlsx_path)  #minute/30min/hour/day sums computed once upon startup, so resolution switches never regroup the raw data
+    model_registry = fit_registry(FIT_PARAMS, 2 * len(RESOLUTIONS))
+    warm_fits = model_registry.warm(pyramid, [DEFAULT_RESOLUTION] + [r for r in RESOLUTIONS if r != DEFAULT_RESOLUTION])
+    warm_fits[DEFAULT_RESOLUTION].result()  #wait only for the default model so the first poll can be served
+    if PRELOAD:
+        for fit in warm_fits.values():
+            fit.result()   #workers inherit these models; fits still running at fork time would be lost
+    serve(pyramid, model_registry, fit_registry(REFIT_PARAMS, len(RESOLUTIONS)))   #only the latest refit of each resolution is kept
+
+#every anomaly served or ingested is recorded in SQLite by a background writer, for /anomalies
+anomaly_store = AnomalyStore(os.getenv("ANOMALY_DB") or os.path.join(default_cache_root(xlsx_path), "anomalies.sqlite3"))
+
+#every client gets its own cursor and resolution over the shared, read-only series
+sessions = SessionStore(ttl=SESSION_TTL, default_resolution=DEFAULT_RESOLUTION)
 
 @app.route("/")
 def index():
     return app.send_static_file("index.html")  #serve the main HTML page
 
-def send_telegram(msg: str):   #function to send a message via Telegram bot
+telegram = TelegramNotifier()  #background alert queue; current_status only enqueues, so Telegram latency never reaches a request
+alert_gate = AlertGate(cooldown=ALERT_COOLDOWN)   #one alert per anomaly episode across every client, at most one per cooldown
+
+def send_telegram(msg: str):   #function to send a message via Telegram bot synchronously, bypassing the queue
     bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
     chat_id   = os.getenv("TELEGRAM_CHAT_ID")
     #only do if both token and chat ID are set
@@ -54,213 +152,264 @@ def send_telegram(msg: str):   #function to send a message via Telegram bot
         "text":       msg,
         "parse_mode": "Markdown"  #use Markdown for text formatting
     }
+    start = time.perf_counter()
     try:
         #send the HTTP POST to Telegram
         requests.post(url, json=payload, timeout=5)
     except Exception as e:
+        TELEGRAM_MESSAGES.labels("failed").inc()
         app.logger.error("Telegram send failed: %s", e)
+    else:
+        TELEGRAM_MESSAGES.labels("sent").inc()
+    finally:
+        TELEGRAM_SECONDS.observe(time.perf_counter() - start)
+
+
+def series_for(resolution):   #immutable Snapshot of the grouped series, prefix sums and labels/scores for a resolution; None while its detector is still fitting
+    return scoring.series(resolution)
+
+def client_session():   #session for the calling client, identified by ?client= (one per browser tab) or else a cookie
+    session_id = request.args.get("client") or request.cookies.get(SESSION_COOKIE)
+    if not session_id or not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", session_id):
+        session_id = uuid.uuid4().hex
+        g.new_session_id = session_id   #handed back as a cookie once the response is built
+    return sessions.get(session_id)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):   #latency and status per route template, so /static/<path> is one series rather than one per file
+    start = g.pop("request_start", None)
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    if start is not None:
+        REQUEST_SECONDS.labels(route, request.method).observe(time.perf_counter() - start)
+    REQUESTS.labels(route, request.method, response.status_code).inc()
+    return response
+
+@app.after_request
+def set_session_cookie(response):
+    session_id = g.pop("new_session_id", None)
+    if session_id:
+        response.set_cookie(SESSION_COOKIE, session_id, max_age=int(SESSION_TTL), httponly=True, samesite="Lax")
+    return response
+
+def window_insights(windows, end, resolution):   #percentage change of the trailing window and last-period delta for the points served before position end; shared by /insights and alerts
+    periods = window_periods(INSIGHT_WINDOW, resolution)
+    return windows.pct_change(end, periods), windows.delta(end), periods
+
+def point_insights(series, end, resolution):   #insights payload for the points served before position end: the window change and delta, plus the last point against the same time last week and a typical period at its weekday and time of day
+    sevenPctChange, deltaKw, periods = window_insights(series.windows, end, resolution)
+    insight = {
+        "sevenPctChange": sevenPctChange,
+        "deltaKw":        deltaKw,
+        "windowPeriods":  periods
+    }
+    end = min(end, len(series.grouped))
+    if end > 0:
+        #O(1) lookups in the seasonal profile, and at most a binary search for last week's period
+        insight.update(seasonal_insights(series.seasonal, series.grouped, end - 1))
+    else:
+        insight.update(NO_INSIGHTS)
+    return insight
 
 
-@app.route("/current_status", methods=["GET"])    #polling endpoint for the latest aggregated power usage, returns JSON with timestamp, power, anomaly status, and optional Telegram notification
-def current_status():
-    global current_resolution, grouped_data, model, current_index
-
-    #handle resolution change if requested
-    requested_resolution = request.args.get("resolution")
-    if requested_resolution and requested_resolution != current_resolution:
-        last_ts = None
-        #save the timestamp of the last retrieved data point
-        if grouped_data is not None and 0 <= current_index - 1 < len(grouped_data):
-            last_ts = grouped_data.iloc[current_index - 1]['group']
-
-        #update grouping and model
-        current_resolution = requested_resolution
-        grouped_data = group_power(data, current_resolution)
-        model = fit_detector(grouped_data)
-
-        #find the new index corresponding to the previously used timestamp
-        if last_ts is not None:
-            inds = grouped_data[grouped_data['group'] >= last_ts].index
-            current_index = int(inds[0]) if len(inds) > 0 else 0
+def build_alert(response, sevenPctChange, deltaKw, periods, seasonal=None):   #Telegram message for an anomalous data point, with insights and tips; seasonal is the point's seasonal insight fields
+    tips = []
+    #default placeholder tips when insufficient insight data
+    if sevenPctChange == 0.0 and deltaKw == 0.0:
+        tips.append(
+            "Gathering data on your usage - more detailed insights will appear "
+            "once we have a full week of readings."
+        )
+        tips.append(
+            "Your usage is steady. Unused devices can still draw phantom power. "
+            "Try unplugging what you're not using."
+        )
+    else:
+        #personalised tips based on computed metrics
+        if sevenPctChange < 0:
+            tips.append(
+                f"Nice work cutting your average usage by {abs(sevenPctChange):.1f}% - "
+                "keep it up by scheduling your heating off 30 minutes earlier each evening."
+            )
         else:
-            current_index = 0
-
-    with index_lock:
-        #loop back to start if end is reached
-        if current_index >= len(grouped_data):
-            current_index = 0
-
-        #extract the current data point
-        row = grouped_data.iloc[current_index]
-        timestamp = row['group']
-        power = row['total_power']
-
-        #prepare a DataFrame for the model prediction
-        df = pd.DataFrame({'total_power': [power]})
-        pred = model.predict(df)[0]
-        anomaly = bool(pred == -1)
-
-        #format date and time strings
-        time_str = timestamp.strftime("%H:%M")
-        date_str = timestamp.strftime("%d/%m") + "/2025"
-
-        #build the base JSON response
-        response = {
-            "anomalyFound": anomaly,
-            "time":         time_str,
-            "date":         date_str,
-            "latestPower":  round(power, 3),
-            "status":       "Anomaly Detected!" if anomaly else "No Anomalies Detected!",
-            "resolution":   current_resolution
-        }
+            tips.append(
+                f"Your average usage rose by {sevenPctChange:.1f}% - "
+                "try lowering your thermostat by 1°C during off-peak hours."
+            )
 
-        current_index += 1  #move to the next data point for subsequent polls
-
-        #if anomaly detected, compute deltas, insights, tips, and notify Telegram
-        if response["anomalyFound"]:
-            idx = current_index - 1
-
-            #compute deltaKw vs previous period
-            if idx >= 1:
-                last_val = grouped_data['total_power'].iat[idx]
-                prev_val = grouped_data['total_power'].iat[idx - 1]
-                deltaKw  = round(last_val - prev_val, 3)
-            else:
-                deltaKw = 0.0
-
-            #compute seven period percentage change if enough data available
-            if idx >= 14:
-                last7 = grouped_data['total_power'].iloc[idx-6:idx+1].sum()
-                prev7 = grouped_data['total_power'].iloc[idx-13:idx-6].sum()
-                sevenPctChange = round(((last7 - prev7) / prev7) * 100, 1) if prev7 else 0.0
-            else:
-                sevenPctChange = 0.0
-
-            tips = []
-            #default placeholder tips when insufficient insight data
-            if sevenPctChange == 0.0 and deltaKw == 0.0:
-                tips.append(
-                    "Gathering data on your usage - more detailed insights will appear "
-                    "once we have a full week of readings."
-                )
-                tips.append(
-                    "Your usage is steady. Unused devices can still draw phantom power. "
-                    "Try unplugging what you're not using."
-                )
-            else:
-                #personalised tips based on computed metrics
-                if sevenPctChange < 0:
-                    tips.append(
-                        f"Nice work cutting your average usage by {abs(sevenPctChange):.1f}% - "
-                        "keep it up by scheduling your heating off 30 minutes earlier each evening."
-                    )
-                else:
-                    tips.append(
-                        f"Your average usage rose by {sevenPctChange:.1f}% - "
-                        "try lowering your thermostat by 1°C during off-peak hours."
-                    )
-
-                if deltaKw > 0.5:
-                    tips.append(
-                        "We saw a spike this period. Check if any high-draw appliances (e.g. dryer) are still running."
-                    )
-                elif deltaKw < -0.2:
-                    tips.append(
-                        "Good job smoothing out that spike in usage - consider running washing/dishwashers "
-                        "in eco-mode to save even more."
-                    )
-                else:
-                    tips.append(
-                        "Your usage is steady. Unused devices can still draw phantom power. "
-                        "Try unplugging what you're not using."
-                    )
-
-            #ensure at least two tips
-            if len(tips) < 2:
-                tips.append("Try turning off any devices that are not currently in use.")
-
-            #prepare insight lines for Telegram message
-            insight_lines = []
-            if sevenPctChange != 0.0:
-                insight_lines.append(f"• 7-period Δ: {sevenPctChange:.1f}%")
-            insight_lines.append(f"• Last-window Δ: {deltaKw:.3f} kW")
-
-            #cleanup placeholder tips if no real insight
-            if sevenPctChange == 0.0 and tips:
-                tips.pop(0)
-
-            #construct the alert message
-            msg = (
-                "⚠️ *Anomaly Detected!* ⚠️\n\n"
-                f"*When:* {date_str} {time_str}\n"
-                f"*Power:* {response['latestPower']} kW\n\n"
-                "*Insights:*\n"
+        if deltaKw > 0.5:
+            tips.append(
+                "We saw a spike this period. Check if any high-draw appliances (e.g. dryer) are still running."
+            )
+        elif deltaKw < -0.2:
+            tips.append(
+                "Good job smoothing out that spike in usage - consider running washing/dishwashers "
+                "in eco-mode to save even more."
             )
-            for line in insight_lines:
-                msg += line + "\n"
+        else:
+            tips.append(
+                "Your usage is steady. Unused devices can still draw phantom power. "
+                "Try unplugging what you're not using."
+            )
+
+    #ensure at least two tips
+    if len(tips) < 2:
+        tips.append("Try turning off any devices that are not currently in use.")
+
+    #prepare insight lines for Telegram message
+    insight_lines = []
+    if sevenPctChange != 0.0:
+        insight_lines.append(f"• {periods}-period Δ: {sevenPctChange:.1f}%")
+    insight_lines.append(f"• Last-window Δ: {deltaKw:.3f} kW")
+    if seasonal and seasonal["typicalPower"] is not None:
+        insight_lines.append(f"• vs typical {seasonal['typicalLabel']}: {seasonal['typicalPctChange']:+.1f}% ({seasonal['seasonalZ']:+.1f} sd)")
+    if seasonal and seasonal["lastWeekPower"] is not None:
+        insight_lines.append(f"• vs same time last week: {seasonal['lastWeekPctChange']:+.1f}%")
+
+    #cleanup placeholder tips if no real insight
+    if sevenPctChange == 0.0 and tips:
+        tips.pop(0)
+
+    #construct the alert message
+    msg = (
+        "⚠️ *Anomaly Detected!* ⚠️\n\n"
+        f"*When:* {response['date']} {response['time']}\n"
+        f"*Power:* {response['latestPower']} kW\n\n"
+        "*Insights:*\n"
+    )
+    for line in insight_lines:
+        msg += line + "\n"
+
+    msg += "\n*Tips:*\n"
+    for t in tips:
+        msg += f"• {t}\n"
+
+    return msg
+
+
+def warming_status(resolution):   #placeholder status while the detector for a resolution is still fitting in the background
+    return {
+        "warming":    True,
+        "status":     "Warming up...",
+        "resolution": resolution
+    }
+
+def advance(session, requested_resolution):   #serve the session's next data point; returns (status, insights, alert message or None), insights is None while warming
+    if requested_resolution not in RESOLUTIONS:
+        requested_resolution = None
+
+    #handle resolution change if requested, keeping this client's place in time
+    if requested_resolution and requested_resolution != session.resolution:
+        series = series_for(requested_resolution)
+        if series is None:
+            return warming_status(requested_resolution), None, None
+        #the first period of the new resolution at or after the last retrieved data point
+        session.seek(requested_resolution, int(series.grouped['group'].searchsorted(session.last_ts)) if session.last_ts is not None else 0)
+
+    #one immutable snapshot for the whole request, so ingestion or a refit can swap in a new one meanwhile without locking readers out
+    resolution = session.resolution
+    start = time.perf_counter()
+    series = series_for(resolution)
+    if series is None:
+        return warming_status(resolution), None, None
+    grouped, windows, fitted, seasonal = series
+
+    if replay_clock is not None:
+        idx = replay_clock.position(grouped['group'].to_numpy())   #the period containing the virtual now
+        session.index = idx + 1
+    else:
+        idx = session.step(len(grouped))   #loops back to start if end is reached
+
+    #extract the current data point and its precomputed label and score
+    timestamp = grouped['group'].iat[idx]
+    power = float(grouped['total_power'].iat[idx])
+    anomaly = bool(fitted.labels[idx] == -1)
+    score = float(fitted.scores[idx])
+    episode = grouped['group'].iat[episode_start(fitted.labels, idx, EPISODE_GAP)] if anomaly else None
+    PREDICT_SECONDS.labels(resolution).observe(time.perf_counter() - start)
+    session.last_ts = timestamp
+
+    if anomaly:
+        anomaly_store.record(resolution, timestamp, power, score)   #only enqueued; the writer thread commits it
+
+    #format date and time strings
+    time_str = timestamp.strftime("%H:%M")
+    date_str = timestamp.strftime("%d/%m") + "/2025"
+
+    #build the base JSON response
+    response = {
+        "anomalyFound": anomaly,
+        "time":         time_str,
+        "date":         date_str,
+        "latestPower":  round(power, 3),
+        "status":       "Anomaly Detected!" if anomaly else "No Anomalies Detected!",
+        "anomalyScore": round(score, 4),
+        "resolution":   resolution
+    }
+
+    #window change and delta over every point served so far, and this point against its seasonal baseline, the same source /insights uses
+    insight = point_insights(series, idx + 1, resolution)
+
+    #on the first anomaly of an episode, build the alert with deltas, insights and tips for Telegram; the caller enqueues it
+    alert = build_alert(
+        response, insight["sevenPctChange"], insight["deltaKw"], insight["windowPeriods"], insight
+    ) if anomaly and alert_gate.allow(resolution, episode) else None
+
+    return response, insight, alert
 
-            msg += "\n*Tips:*\n"
-            for t in tips:
-                msg += f"• {t}\n"
 
-            send_telegram(msg)  #send the alert to Telegram bot
+@app.route("/current_status", methods=["GET"])    #polling endpoint for the latest aggregated power usage, returns JSON with timestamp, power, anomaly status, and optional Telegram notification
+def current_status():
+    return status_response(client_session())
+
+def status_response(session):   #advance the session one data point and return it as JSON
+    response, _, alert = advance(session, request.args.get("resolution"))
+
+    if alert:
+        telegram.submit(alert)  #queue the alert for the Telegram bot; the notifier thread sends it, so the poll never waits on the network
 
     #return JSON response to client
     return jsonify(response)
 
 @app.route("/anomaly", methods=["GET"])    #alias endpoint to step back one index and return the previous status, useful for UI "back" behavior on detection
 def anomaly_endpoint():
-    global current_index
-    with index_lock:
-        if current_index > 0:
-            current_index -= 1
-    return current_status()
+    session = client_session()
+    session.step_back()
+    return status_response(session)
 
 @app.route("/insights", methods=["GET"])   #returns a JSON payload with seven period percentage change and delta kW, used for chart annotations and summary
 def insights():
-    global grouped_data, current_index
-    with index_lock:
-        idx = current_index
-
-    #compute deltaKw vs one period ago
-    if idx >= 2:
-        last_val = grouped_data['total_power'].iat[idx - 1]
-        prev_val = grouped_data['total_power'].iat[idx - 2]
-        deltaKw  = round(last_val - prev_val, 3)
-    else:
-        deltaKw = 0.0
-
-    #compute seven period percentage change if enough data
-    if idx >= 14:
-        last7 = grouped_data['total_power'].iloc[idx - 7 : idx].sum()
-        prev7 = grouped_data['total_power'].iloc[idx - 14: idx - 7].sum()
-        sevenPctChange = round(((last7 - prev7) / prev7) * 100, 1) if prev7 else 0.0
-    else:
-        sevenPctChange = 0.0
-
-    return jsonify({
-        "sevenPctChange": sevenPctChange,
-        "deltaKw":        deltaKw
-    })
-
-@app.route("/tips", methods=["GET"])   
-def tips():   #returns JSON array of tips based on query params "sevenPctChange" and "deltaKw", falls back to default guidance if not enough data
-    try:
-        pct = float(request.args.get("sevenPctChange", 0))
-        dk  = float(request.args.get("deltaKw",  0))
-    except ValueError:
-        pct, dk = 0.0, 0.0
-
+    session = client_session()
+    idx, resolution = session.index, session.resolution
+
+    #seven period percentage change and delta kW vs one period ago, both O(1) from the prefix sums, and the last point against same time last week and a typical period
+    return jsonify(point_insights(series_for(resolution) or scoring.snapshot(resolution), idx, resolution))
+
+def seasonal_tip(seasonal):   #tip comparing the latest point with a typical period at the same weekday and time, else with the same time last week; None when neither stands out
+    typical, label, week = seasonal.get("typicalPctChange", 0.0), seasonal.get("typicalLabel"), seasonal.get("lastWeekPctChange", 0.0)
+    if label and typical >= SEASONAL_TIP_PCT:
+        return f"You're using {typical:.0f}% more than on a typical {label}. Check for appliances left running."
+    if label and typical <= -SEASONAL_TIP_PCT:
+        return f"You're using {abs(typical):.0f}% less than on a typical {label} - great job."
+    if week >= SEASONAL_TIP_PCT:
+        return f"Usage is {week:.0f}% higher than at this time last week."
+    if week <= -SEASONAL_TIP_PCT:
+        return f"Usage is {abs(week):.0f}% lower than at this time last week - keep it up."
+    return None
+
+def usage_tips(pct, dk, seasonal=None):   #tips based on the seven period percentage change and deltaKw, led by a seasonal comparison when one stands out; falls back to default guidance if not enough data
+    tip = seasonal_tip(seasonal or {})
     #default tips when no real data
     if pct == 0.0 and dk == 0.0:
-        return jsonify({
-            "tips": [
-                "Gathering data on your usage - more detailed insights will appear once we have a full week of readings.",
-                "Your usage is steady. Unused devices can still draw phantom power. Try unplugging what you're not using."
-            ]
-        })
+        return [
+            tip or "Gathering data on your usage - more detailed insights will appear once we have a full week of readings.",
+            "Your usage is steady. Unused devices can still draw phantom power. Try unplugging what you're not using."
+        ]
 
-    tips = []
+    tips = [tip] if tip else []
     #compose personalised tips
     if pct < 0:
         tips.append(
@@ -284,7 +433,274 @@ def tips():   #returns JSON array of tips based on query params "sevenPctChange"
     if len(tips) < 2:
         tips.append("Try turning off any devices that are not currently in use.")
 
-    return jsonify({"tips": tips})
+    return tips
+
+@app.route("/tips", methods=["GET"])   
+def tips():   #returns JSON array of tips based on query params "sevenPctChange" and "deltaKw"
+    try:
+        pct = float(request.args.get("sevenPctChange", 0))
+        dk  = float(request.args.get("deltaKw",  0))
+    except ValueError:
+        pct, dk = 0.0, 0.0
+    #optional seasonal comparisons, as returned by /insights
+    try:
+        seasonal = {
+            "typicalPctChange":  float(request.args.get("typicalPctChange", 0)),
+            "lastWeekPctChange": float(request.args.get("lastWeekPctChange", 0)),
+            "typicalLabel":      request.args.get("typicalLabel"),
+        }
+    except ValueError:
+        seasonal = None
+
+    return jsonify({"tips": usage_tips(pct, dk, seasonal)})
+
+def sse_event(event, payload):   #format one Server-Sent Events message
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)   #one per open /stream connection of this worker
+
+def release_stream():
+    STREAMS.dec()
+    stream_slots.release()
+
+@app.route("/stream", methods=["GET"])   #Server-Sent Events feed replacing per-second polling: one "status" event per data point carrying its anomaly flag, insights and tips, plus "resolution" events
+def stream():
+    session = client_session()
+    if not stream_slots.acquire(blocking=False):
+        #every stream thread is taken: the EventSource fails on a non-200 answer and the dashboard falls back to polling
+        resp = jsonify({"error": f"at most {MAX_STREAMS} open streams per worker, poll /current_status instead"})
+        resp.headers["Retry-After"] = "60"
+        return resp, 503
+    STREAMS.inc()
+    requested_resolution = request.args.get("resolution")
+
+    def events():
+        pending_resolution = requested_resolution   #asked for until the switch succeeds, after that the stream follows the session
+        sent_resolution = None
+        yield "retry: 2000\n\n"   #browser reconnect delay if the connection drops
+        while True:
+            sessions.touch(session)   #an open stream keeps its session alive, so a reconnect or poll with the same id resumes here
+            response, insight, alert = advance(session, pending_resolution)
+            if alert:
+                telegram.submit(alert)
+
+            if insight is not None:
+                if response["resolution"] == pending_resolution:
+                    pending_resolution = None
+                if response["resolution"] != sent_resolution:
+                    sent_resolution = response["resolution"]
+                    yield sse_event("resolution", {"resolution": sent_resolution})
+                response = dict(
+                    response,
+                    insights=insight,
+                    tips=usage_tips(insight["sevenPctChange"], insight["deltaKw"], insight)
+                )
+
+            yield sse_event("status", response)
+            time.sleep(STREAM_INTERVAL)
+
+    resp = Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  #stop reverse proxies from buffering the stream
+    )
+    resp.call_on_close(release_stream)   #the server closes the response once the client disconnects
+    return resp
+
+@app.route("/readings", methods=["POST"])   #bulk ingestion of live meter readings: a JSON list (or {"readings": [...]}) appended to every resolution and scored online
+def ingest_readings():
+    payload = request.get_json(silent=True)
+    records = payload.get("readings") if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        return jsonify({"error": "expected a JSON list of readings"}), 400
+    if len(records) > MAX_READINGS:
+        return jsonify({"error": f"at most {MAX_READINGS} readings per request"}), 413
+    if not records:
+        return jsonify({"accepted": 0, "rejected": 0, "anomalies": [], "resolution": DEFAULT_RESOLUTION})
+
+    try:
+        readings = readings_frame(records)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    valid = (readings['datetime'].notna() & readings['total_power'].notna()).to_numpy()
+    readings = readings[valid].reset_index(drop=True)
+    with INGEST_SECONDS.time():
+        changed, accepted = scoring.ingest(readings['datetime'], source_frame(readings, readings['total_power']),   #sub-meters and voltage too, when the meter sends them
+                                           latest=latest_reading())
+    late = int((~accepted).sum())   #older than the newest minute already held, or dated in the future
+    READINGS.labels("accepted").inc(int(accepted.sum()))
+    READINGS.labels("rejected").inc(int((~valid).sum()) + late)
+
+    #anomalies among the periods this batch touched at the default resolution
+    anomalies = []
+    series = series_for(DEFAULT_RESOLUTION)
+    if series is not None and DEFAULT_RESOLUTION in changed:
+        grouped, live = series.grouped, series.fitted
+        start = changed[DEFAULT_RESOLUTION]
+        for pos in start + np.flatnonzero(live.labels[start:] == -1)[:MAX_READINGS]:
+            timestamp, power, score = grouped['group'].iat[pos], float(grouped['total_power'].iat[pos]), float(live.scores[pos])
+            anomaly_store.record(DEFAULT_RESOLUTION, timestamp, power, score, source="ingest")
+            anomalies.append({
+                "datetime":     timestamp.isoformat(),
+                "latestPower":  round(power, 3),
+                "anomalyScore": round(score, 4)
+            })
+
+    return jsonify({
+        "accepted":   int(accepted.sum()),
+        "rejected":   int((~valid).sum()) + late,
+        "anomalies":  anomalies,
+        "resolution": DEFAULT_RESOLUTION
+    })
+
+@app.route("/history", methods=["GET"])   #any time range of the grouped series downsampled with LTTB to at most max_points, as parallel arrays: t (epoch ms), v (kW) and a (positions flagged as anomalies)
+def history():
+    resolution = request.args.get("resolution", DEFAULT_RESOLUTION)
+    if resolution not in RESOLUTIONS:
+        return jsonify({"error": f"resolution must be one of {', '.join(RESOLUTIONS)}"}), 400
+    try:
+        start = naive_timestamp(request.args.get("start"))
+        end = naive_timestamp(request.args.get("end"))
+        max_points = min(max(int(request.args.get("max_points", HISTORY_POINTS)), 2), HISTORY_MAX_POINTS)
+    except ValueError:
+        return jsonify({"error": "start and end must be timestamps and max_points an integer"}), 400
+
+    #labels and scores come with the series once the detector is fitted; until then the values are served alone
+    series = series_for(resolution) or scoring.snapshot(resolution)
+    grouped = series.grouped
+    keys = grouped['group'].to_numpy()
+
+    #binary search the sorted periods for the half-open range [start, end)
+    lo = int(np.searchsorted(keys, start.to_datetime64())) if start is not None else 0
+    hi = int(np.searchsorted(keys, end.to_datetime64())) if end is not None else len(keys)
+    hi = max(hi, lo)
+    times = keys[lo:hi].astype('datetime64[ms]').astype(np.int64)
+    values = grouped['total_power'].to_numpy()[lo:hi]
+    kept = lttb_indices(times, values, max_points)
+
+    payload = {
+        "resolution": resolution,
+        "count":      hi - lo,          #periods in the range before downsampling
+        "t":          times[kept].tolist(),
+        "v":          np.round(values[kept], 3).tolist(),
+    }
+    if series.fitted is not None:
+        payload["a"] = np.flatnonzero(series.fitted.labels[lo:hi][kept] == -1).tolist()
+    return compact_json(payload)
+
+@app.route("/anomalies", methods=["GET"])   #recorded anomalies in [since, until), oldest first, one page of at most limit at a time; pass the returned "next" as after to get the following page
+def anomalies():
+    resolution = request.args.get("resolution") or None
+    if resolution is not None and resolution not in RESOLUTIONS:
+        return jsonify({"error": f"resolution must be one of {', '.join(RESOLUTIONS)}"}), 400
+    try:
+        since = naive_timestamp(request.args.get("since"))
+        until = naive_timestamp(request.args.get("until"))
+        limit = min(max(int(request.args.get("limit", ANOMALY_PAGE)), 1), ANOMALY_MAX_PAGE)
+        after = request.args.get("after")
+        if after:
+            ts, _, res = after.partition(":")
+            after = (int(ts), res)
+    except ValueError:
+        return jsonify({"error": "since and until must be timestamps, limit an integer and after a cursor from a previous page"}), 400
+
+    rows, cursor = anomaly_store.query(since, until, resolution, limit, after or None)
+    return jsonify({
+        "anomalies": rows,
+        "next":      f"{cursor[0]}:{cursor[1]}" if cursor else None,
+    })
+
+@app.route("/episodes", methods=["GET"])   #anomaly episodes overlapping [since, until): runs of anomalous periods merged across at most gap normal ones, with start, end, peak and energy above the median of the normal periods
+def episodes():
+    resolution = request.args.get("resolution", DEFAULT_RESOLUTION)
+    if resolution not in RESOLUTIONS:
+        return jsonify({"error": f"resolution must be one of {', '.join(RESOLUTIONS)}"}), 400
+    try:
+        since = naive_timestamp(request.args.get("since"))
+        until = naive_timestamp(request.args.get("until"))
+        gap = max(int(request.args.get("gap", EPISODE_GAP)), 0)
+        limit = min(max(int(request.args.get("limit", ANOMALY_PAGE)), 1), ANOMALY_MAX_PAGE)
+    except ValueError:
+        return jsonify({"error": "since and until must be timestamps, gap and limit integers"}), 400
+
+    series = series_for(resolution)
+    if series is None:
+        return jsonify(dict(warming_status(resolution), episodes=[])), 503
+    grouped, fitted = series.grouped, series.fitted
+    keys = grouped['group'].to_numpy()
+    values = grouped['total_power'].to_numpy()
+    found = find_episodes(fitted.labels, values, gap)
+
+    #episodes over the whole series, so one straddling since or until is reported whole
+    starts, ends = keys[found['start_pos'].to_numpy()], keys[found['end_pos'].to_numpy()]
+    keep = np.ones(len(found), dtype=bool)
+    if since is not None:
+        keep &= ends >= since.to_datetime64()
+    if until is not None:
+        keep &= starts < until.to_datetime64()
+    found, starts, ends = found[keep].head(limit), starts[keep][:limit], ends[keep][:limit]
+    count = int(keep.sum())
+
+    return jsonify({
+        "resolution": resolution,
+        "gap":        gap,
+        "count":      count,   #episodes in the range, of which at most limit are listed
+        "episodes":   [{
+            "start":      pd.Timestamp(start).isoformat(),
+            "end":        pd.Timestamp(end).isoformat(),
+            "periods":    int(e - s + 1),
+            "anomalies":  int(n),
+            "peakPower":  round(float(peak), 3),
+            "energyKwh":  round(float(energy), 3),
+        } for start, end, s, e, n, peak, energy in zip(
+            starts, ends, found['start_pos'], found['end_pos'], found['anomalies'], found['peak'], found['energy_kwh'])],
+    })
+
+def latest_reading():   #newest reading time /readings accepts, in ns: the server's wall clock, or the replay clock when that runs ahead of it, plus MAX_CLOCK_SKEW
+    now = pd.Timestamp.now().value
+    virtual = replay_clock.now() if replay_clock is not None else None
+    return max(now, virtual or now) + int(MAX_CLOCK_SKEW * 1e9)
+
+def naive_timestamp(value):   #query-string timestamp as naive wall-clock time, like the dataset's; None when absent
+    if not value:
+        return None
+    ts = pd.Timestamp(value)
+    return ts.tz_localize(None) if ts.tzinfo is not None else ts
+
+def compact_json(payload):   #minified JSON with a content-hash ETag, answered with 304 when unchanged and gzipped when the client accepts it
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+    compress = request.accept_encodings["gzip"] > 0
+    if compress:
+        etag += "-gz"   #each encoding is a different representation, so it gets its own strong ETag
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(gzip.compress(body, compresslevel=6) if compress else body, content_type="application/json")
+        if compress:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"   #cache, but revalidate: ingestion can change the range
+    return response
+
+#gauges read at scrape time from whatever objects the app is currently using
+REGISTRY.callback("hem_pyramid_periods", "Periods held at each resolution", lambda: {(r,): pyramid.levels[r].n for r in RESOLUTIONS}, labelnames=["resolution"])
+REGISTRY.callback("hem_models_cached", "Fitted detectors held by the model registry", lambda: len(model_registry) + (len(refit_registry) if refit_registry is not model_registry else 0))
+REGISTRY.callback("hem_sessions_active", "Client cursor sessions currently held", lambda: len(sessions))
+REGISTRY.callback("hem_telegram_queue_size", "Alerts waiting for the Telegram worker", lambda: telegram.queue_size())
+REGISTRY.callback("hem_anomaly_queue_size", "Anomaly events waiting for the SQLite writer", lambda: anomaly_store.queue_size())
+REGISTRY.callback("hem_refit_pending", "1 while ingested readings are scored online only, until the next full refit", lambda: int(scoring.fit_version != pyramid.version))
+
+@app.route("/metrics", methods=["GET"])   #Prometheus text format; each worker process reports its own figures
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route("/memory", methods=["GET"])   #memory of the worker that served this request, to size multi-worker deployments
+def memory():
+    return jsonify(dict(process_memory() or {"pid": os.getpid()}, pyramid=pyramid.nbytes(), compact=COMPACT_DATA))
 
 #method for tests to create the Flask app instance
 def create_app(test_config=None):
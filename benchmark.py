@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+import sklearn
+from aggregates import AggregatePyramid, RESOLUTIONS
+from anomaly_detector import NUMERIC_COLS, load_and_preprocess, group_power, fit_detector, score_series, fit_and_score, detector_input
+from detectors import DEFAULT_DETECTOR, DETECTORS, make_detector
+
+SIZES = {'10k': 10_000, '1M': 1_000_000, '10M': 10_000_000}
+START = np.datetime64('2006-12-16T17:24', 'm')   #first reading of the real UCI dataset
+MISSING_RATE = 0.0125                            #share of '?' rows, about as many as the real dataset has
+TIME_LABELS = np.array([f"{h:02d}:{m:02d}:00" for h in range(24) for m in range(60)], dtype=object)
+
+def generate_uci(rows, seed=0, offset=0):   #UCI-shaped readings, one per minute from START + offset: a daily cycle, noise, appliance spikes and missing rows
+    rng = np.random.default_rng([seed, offset])
+    minutes = START + offset + np.arange(rows)
+    days = minutes.astype('datetime64[D]')
+    first_day = days[0]
+    day_labels = pd.DatetimeIndex(np.arange(first_day, days[-1] + 1)).strftime('%d/%m/%Y').to_numpy()   #one label per day, looked up per row
+    minute_of_day = (minutes - days).astype(np.int64)
+
+    daily = 0.6 + 0.5 * np.sin(2 * np.pi * (minute_of_day - 7 * 60) / 1440.0).clip(0)
+    active = daily * rng.gamma(2.0, 0.5, rows)
+    spikes = rng.random(rows) < 0.02
+    active[spikes] += rng.uniform(2.0, 6.0, spikes.sum())   #kettle, oven and dryer spikes
+    voltage = 240.0 + rng.normal(0.0, 2.0, rows)
+    data = pd.DataFrame({
+        'Date':                  day_labels[(days - first_day).astype(np.int64)],
+        'Time':                  TIME_LABELS[minute_of_day],
+        'Global_active_power':   active.round(3),
+        'Global_reactive_power': (active * rng.uniform(0.05, 0.15, rows)).round(3),
+        'Voltage':               voltage.round(2),
+        'Global_intensity':      (active * 1000.0 / voltage).round(1),
+        'Sub_metering_1':        rng.integers(0, 3, rows).astype(float),
+        'Sub_metering_2':        rng.integers(0, 3, rows).astype(float),
+        'Sub_metering_3':        rng.integers(0, 19, rows).astype(float),
+    })
+    data.loc[rng.random(rows) < MISSING_RATE, NUMERIC_COLS] = np.nan
+    return data
+
+def write_uci_text(path, rows, seed=0, chunk_rows=1_000_000):   #semicolon-delimited UCI export written in bounded-memory chunks, identical for the same rows and seed
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w", newline="") as f:
+        for offset in range(0, rows, chunk_rows):
+            chunk = generate_uci(min(chunk_rows, rows - offset), seed, offset)
+            chunk.to_csv(f, sep=';', index=False, header=offset == 0, na_rep='?')
+    os.replace(tmp, path)
+    return path
+
+def dataset_path(workdir, rows, seed):   #generate the dataset for this size and seed once, reusing it on later runs
+    path = os.path.join(workdir, f"uci_{rows}_{seed}.txt")
+    if not os.path.exists(path):
+        write_uci_text(path, rows, seed)
+    return path
+
+def best_time(fn, repeat):   #fastest of repeat runs, and the last result
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def bench_stages(path, repeat=3, cache_dir=None):   #seconds per pipeline stage: parsing, the columnar cache, grouping, the pyramid, fitting and scoring at every resolution
+    stages = {}
+    stages['load_text_seconds'], data = best_time(lambda: load_and_preprocess(path, use_cache=False), repeat)
+    load_and_preprocess(path, cache_dir=cache_dir)   #populate the cache
+    stages['load_cached_seconds'], _ = best_time(lambda: load_and_preprocess(path, cache_dir=cache_dir), repeat)
+    stages['pyramid_build_seconds'], pyramid = best_time(lambda: AggregatePyramid.from_frame(data), repeat)
+
+    for res in RESOLUTIONS:
+        stages[f'group_power/{res}_seconds'], grouped = best_time(lambda: group_power(data, res), repeat)
+        stages[f'fit_detector/{res}_seconds'], model = best_time(lambda: fit_detector(grouped), repeat)
+        stages[f'score_series/{res}_seconds'], _ = best_time(lambda: score_series(model, grouped), repeat)
+    return stages, pyramid
+
+def bench_detectors(pyramid, names=tuple(DETECTORS), repeat=3, single=1000, **params):   #every detector at every resolution, fitted on the same input the app serves: fit time, batch predict throughput, one-row predict latency and label agreement with IsolationForest
+    results = {}
+    for res in RESOLUTIONS:
+        X = np.asarray(detector_input(pyramid.frame(res)))
+        rows = X[np.random.default_rng(0).integers(0, len(X), single)] if len(X) else X
+        reference = None
+        for name in [DEFAULT_DETECTOR] + [n for n in names if n != DEFAULT_DETECTOR]:
+            fit_seconds, model = best_time(lambda: make_detector(name, **params).fit(X), repeat)
+            predict_seconds, labels = best_time(lambda: model.predict(X), repeat)
+
+            start = time.perf_counter()
+            for i in range(len(rows)):
+                model.predict(rows[i:i + 1])   #a single period, as scored live
+            one_ms = (time.perf_counter() - start) * 1000.0 / max(len(rows), 1)
+
+            flagged = labels == -1
+            if reference is None:
+                reference = flagged
+            both, either = int((flagged & reference).sum()), int((flagged | reference).sum())
+            if name in names:
+                results[f"{res}/{name}"] = {
+                    'fit_seconds':         fit_seconds,
+                    'predict_rows_per_second': float(len(X) / predict_seconds) if predict_seconds else 0.0,
+                    'predict_one_ms':      one_ms,
+                    'anomaly_share':       float(flagged.mean()) if len(X) else 0.0,
+                    'agreement':           float((flagged == reference).mean()) if len(X) else 1.0,   #share of periods labelled as IsolationForest labels them
+                    'anomaly_overlap':     both / either if either else 1.0,                         #Jaccard index of the two anomaly sets
+                }
+    return results
+
+def bench_endpoints(pyramid, clients=8, requests_per_client=200, paths=('/current_status', '/insights'), data_path=None):   #per-request latency of each endpoint with clients threads polling it concurrently through the Flask test client
+    if data_path:
+        os.environ.setdefault("HOUSEHOLD_DATA_PATH", data_path)   #where app.py keeps its anomaly store
+    os.environ["HEM_DEFER_LOAD"] = "1"   #the pyramid is already built: importing app must not load and fit the dataset a second time
+    import app as app_module
+    from model_registry import ModelRegistry
+    from sessions import SessionStore
+
+    #serve this dataset, with every resolution fitted up front so no request sees a warming placeholder
+    registry = ModelRegistry(fit_and_score, max_entries=2 * len(RESOLUTIONS))
+    for fit in registry.warm(pyramid, RESOLUTIONS).values():
+        fit.result()
+    app_module.serve(pyramid, registry, registry)   #the benchmark ingests nothing, so there are no refits
+    app_module.sessions = SessionStore()
+
+    results = {}
+    for path in paths:
+        latencies = [[] for _ in range(clients)]
+        barrier = threading.Barrier(clients)
+
+        def poll(i):
+            client = app_module.app.test_client()
+            url = f"{path}?client=bench{i}"
+            barrier.wait()
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                client.get(url)
+                latencies[i].append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=poll, args=(i,)) for i in range(clients)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        ms = np.concatenate(latencies) * 1000.0
+        results[path.strip('/')] = {
+            'p50_ms':             float(np.percentile(ms, 50)),
+            'p95_ms':             float(np.percentile(ms, 95)),
+            'p99_ms':             float(np.percentile(ms, 99)),
+            'mean_ms':            float(ms.mean()),
+            'requests_per_second': float(len(ms) / elapsed),
+        }
+    return results
+
+def run_benchmark(sizes, seed=0, repeat=3, clients=8, requests_per_client=200, workdir=None, detectors=()):   #stage timings and endpoint latency for every dataset size, plus the detector comparison when detectors are named
+    workdir = workdir or os.path.join(tempfile.gettempdir(), "hem_bench")
+    os.makedirs(workdir, exist_ok=True)
+    report = {
+        'meta': {
+            'seed':     seed,
+            'repeat':   repeat,
+            'clients':  clients,
+            'requests_per_client': requests_per_client,
+            'python':   platform.python_version(),
+            'numpy':    np.__version__,
+            'pandas':   pd.__version__,
+            'sklearn':  sklearn.__version__,
+            'machine':  platform.machine(),
+            'cpus':     os.cpu_count(),
+            'started':  time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': {},
+    }
+    for size in sizes:
+        rows = SIZES.get(size) or int(size)
+        path = dataset_path(workdir, rows, seed)
+        stages, pyramid = bench_stages(path, repeat, cache_dir=os.path.join(workdir, "cache"))
+        report['results'][str(size)] = {
+            'rows':      rows,
+            'stages':    stages,
+            'endpoints': bench_endpoints(pyramid, clients, requests_per_client, data_path=path),
+        }
+        if detectors:
+            report['results'][str(size)]['detectors'] = bench_detectors(pyramid, detectors, repeat)
+    return report
+
+def timings(report):   #flatten a report into {"size/section/name": value} for every time or latency figure, where lower is better
+    flat = {}
+    for size, result in report['results'].items():
+        for section in ('stages', 'endpoints', 'detectors'):
+            for name, value in result.get(section, {}).items():
+                if isinstance(value, dict):
+                    for metric, v in value.items():
+                        if metric.endswith(('_ms', '_seconds')):
+                            flat[f"{size}/{section}/{name}/{metric}"] = v
+                elif name.endswith('_seconds'):
+                    flat[f"{size}/{section}/{name}"] = value
+    return flat
+
+def compare(baseline, current, threshold=0.2, min_delta=0.001):   #figures more than threshold (relative) slower than the baseline; min_delta (seconds, or ms for latencies) ignores timer noise on tiny stages
+    regressions = []
+    old, new = timings(baseline), timings(current)
+    for key in sorted(old.keys() & new.keys()):
+        floor = min_delta * 1000.0 if key.endswith('_ms') else min_delta
+        if new[key] > old[key] * (1 + threshold) and new[key] - old[key] > floor:
+            regressions.append({'metric': key, 'baseline': old[key], 'current': new[key], 'ratio': new[key] / old[key] if old[key] else float('inf')})
+    return regressions
+
+def main(argv=None):   #benchmark CLI: write the JSON report and, given a baseline, list regressions and exit non-zero if there are any
+    parser = argparse.ArgumentParser(description="Benchmark loading, grouping, fitting and endpoint latency on synthetic UCI data")
+    parser.add_argument('--sizes', nargs='+', default=['10k', '1M'], help="dataset sizes: 10k, 1M, 10M or a row count")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage, the fastest is kept")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients polling each endpoint")
+    parser.add_argument('--requests', type=int, default=200, help="requests per client")
+    parser.add_argument('--detectors', nargs='+', choices=list(DETECTORS), default=[],
+                        help="also compare these detectors with IsolationForest at every resolution")
+    parser.add_argument('--workdir', help="where generated datasets are kept between runs")
+    parser.add_argument('--output', default='-', help="JSON report path, '-' for stdout")
+    parser.add_argument('--compare', help="baseline JSON report to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.2, help="relative slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    #alerts would reach a real chat, and their queue is not what is being measured
+    os.environ.pop("TELEGRAM_BOT_TOKEN", None)
+    os.environ.pop("TELEGRAM_CHAT_ID", None)
+
+    report = run_benchmark(args.sizes, args.seed, args.repeat, args.clients, args.requests, args.workdir, args.detectors)
+    text = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['metric']}: {r['baseline']:.4f} -> {r['current']:.4f} ({r['ratio']:.2f}x)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("no regressions", file=sys.stderr)
+    return report
+
+
+if __name__ == '__main__':
+    main()
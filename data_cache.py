@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+CACHE_FORMAT = 2          #bump whenever the preprocessing or the on-disk layout changes
+META_FILE = "meta.json"
+
+def default_cache_root(source_path):   #cache lives next to the source file unless HOUSEHOLD_CACHE_DIR overrides it
+    root = os.getenv("HOUSEHOLD_CACHE_DIR")
+    if root:
+        return root
+    return os.path.join(os.path.dirname(os.path.abspath(source_path)), ".hem_cache")
+
+def file_digest(path, block_size=1 << 20):   #content hash of the source, read in blocks so memory stays flat
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def source_fingerprint(path):   #key identifying one exact version of the source file
+    st = os.stat(path)
+    return {
+        "format": CACHE_FORMAT,
+        "path":   os.path.abspath(path),
+        "size":   st.st_size,
+        "mtime":  st.st_mtime_ns,
+        "digest": file_digest(path),
+    }
+
+def _entry_dir(cache_root, source_path, variant=None):   #one entry per source path and variant, replaced in place when the source changes
+    name = os.path.abspath(source_path) + (f"#{variant}" if variant else "")
+    name = hashlib.blake2b(name.encode(), digest_size=8).hexdigest()
+    return os.path.join(cache_root, name)
+
+def read_cached_frame(entry_dir, fingerprint):   #return the cached frame if its key matches the fingerprint, else None
+    meta_path = os.path.join(entry_dir, META_FILE)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("key") != fingerprint:
+        return None
+
+    columns = {}
+    try:
+        for col in meta["columns"]:
+            arr = np.load(os.path.join(entry_dir, col["file"]), mmap_mode="r", allow_pickle=False)
+            if col["kind"] == "datetime":
+                columns[col["name"]] = arr.view(col["dtype"])
+            elif col["kind"] == "str":
+                columns[col["name"]] = arr.astype(object)
+            else:
+                columns[col["name"]] = arr
+    except (OSError, ValueError, KeyError):
+        return None
+    return pd.DataFrame(columns)
+
+def write_cached_frame(entry_dir, fingerprint, df):   #store every column as its own .npy; meta.json is written last so a partial write is never picked up
+    os.makedirs(entry_dir, exist_ok=True)
+    meta_path = os.path.join(entry_dir, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        kind, arr = _column_array(df[name])
+        fname = f"col{i}.npy"
+        np.save(os.path.join(entry_dir, fname), arr, allow_pickle=False)
+        columns.append({"name": str(name), "kind": kind, "file": fname, "dtype": str(df[name].dtype)})
+    _write_meta(meta_path, fingerprint, columns)
+
+def _column_array(series):   #(kind, array) of one column as it is stored on disk
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime", series.to_numpy().view("int64")
+    if pd.api.types.is_numeric_dtype(series):
+        return "numeric", series.to_numpy()
+    return "str", series.astype(str).to_numpy(dtype=str)
+
+def _write_meta(meta_path, fingerprint, columns):   #written last and renamed into place, so a partial entry is never picked up
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"key": fingerprint, "columns": columns}, f)
+    os.replace(tmp_path, meta_path)
+
+def _join_parts(path, part_paths):   #concatenate per-chunk .npy files into one, a part at a time; strings take the widest part's width
+    parts = [np.load(p, mmap_mode="r", allow_pickle=False) for p in part_paths]
+    joined = np.lib.format.open_memmap(path, mode="w+", dtype=np.result_type(*parts), shape=(sum(len(p) for p in parts),))
+    pos = 0
+    for part in parts:
+        joined[pos:pos + len(part)] = part
+        pos += len(part)
+    joined.flush()
+    del joined, parts
+    for p in part_paths:
+        os.remove(p)
+
+def cached_frame(source_path, build, cache_root=None, variant=None):   #load the preprocessed frame from cache, rebuilding it with build() only when the source changed; variant keeps e.g. the compact frame apart from the full one
+    cache_root = cache_root or default_cache_root(source_path)
+    entry_dir = _entry_dir(cache_root, source_path, variant)
+    fingerprint = source_fingerprint(source_path)
+
+    df = read_cached_frame(entry_dir, fingerprint)
+    if df is not None:
+        return df
+
+    df = build()
+    try:
+        write_cached_frame(entry_dir, fingerprint, df)
+    except OSError as e:
+        #a read-only deploy directory should not stop the app from starting
+        log.warning("Could not write dataset cache to %s: %s", entry_dir, e)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+    return df
+
+def cached_chunks(source_path, chunks, cache_root=None, variant=None):   #cached_frame for a source read in chunks: yields the cached frame when the source is unchanged, else passes the chunks through while saving each one, so the whole frame is never built in memory; the entry is complete once the chunks are exhausted
+    cache_root = cache_root or default_cache_root(source_path)
+    entry_dir = _entry_dir(cache_root, source_path, variant)
+    fingerprint = source_fingerprint(source_path)
+
+    df = read_cached_frame(entry_dir, fingerprint)
+    if df is not None:
+        yield df
+        return
+
+    columns, parts, writing = [], [], True
+    try:
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.makedirs(entry_dir)
+    except OSError as e:
+        log.warning("Could not write dataset cache to %s: %s", entry_dir, e)
+        writing = False
+    for n, chunk in enumerate(chunks):
+        if writing:
+            try:
+                if not columns:
+                    columns = [{"name": str(name), "file": f"col{i}.npy", "dtype": str(chunk[name].dtype)} for i, name in enumerate(chunk.columns)]
+                    parts = [[] for _ in columns]
+                for i, name in enumerate(chunk.columns):
+                    columns[i]["kind"], arr = _column_array(chunk[name])
+                    parts[i].append(os.path.join(entry_dir, f"col{i}.part{n}.npy"))
+                    np.save(parts[i][-1], arr, allow_pickle=False)
+            except OSError as e:
+                log.warning("Could not write dataset cache to %s: %s", entry_dir, e)
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                writing = False
+        yield chunk
+
+    if writing and columns:
+        try:
+            for col, part_paths in zip(columns, parts):
+                _join_parts(os.path.join(entry_dir, col["file"]), part_paths)
+            _write_meta(os.path.join(entry_dir, META_FILE), fingerprint, columns)
+        except OSError as e:
+            log.warning("Could not write dataset cache to %s: %s", entry_dir, e)
+            shutil.rmtree(entry_dir, ignore_errors=True)
@@ -0,0 +1,140 @@
+from abc import ABC, abstractmethod
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+DEFAULT_DETECTOR = 'iforest'
+MAD_TO_STD = 1.4826   #turns a median absolute deviation into a normal standard deviation
+
+def as_matrix(X):   #2-D float array (periods x features) from a frame, a matrix or a single series
+    X = np.asarray(X)
+    if X.dtype.kind != 'f':
+        X = X.astype(np.float64)
+    return X.reshape(-1, 1) if X.ndim == 1 else X
+
+
+class Detector(ABC):   #fit on an array of periods x features, then score (lower is more anomalous, negative is an anomaly, like decision_function) and predict (-1 anomaly, 1 normal)
+    PARAMS = ('contamination',)   #keyword arguments make_detector passes on; the rest of a shared parameter set is ignored
+
+    @abstractmethod
+    def fit(self, X):   #returns self, so a detector is fitted in one expression
+        ...
+
+    @abstractmethod
+    def score(self, X):
+        ...
+
+    def predict(self, X):
+        return np.where(self.score(X) < 0, -1, 1)
+
+    def decision_function(self, X):   #sklearn's name for score, so score_series scores any detector like an IsolationForest
+        return self.score(X)
+
+    def _calibrate(self, outlier):   #threshold on the training outlier scores that flags the contamination share of them
+        self.threshold = float(np.quantile(outlier, 1.0 - self.contamination)) if len(outlier) else 0.0
+        if self.threshold <= 0:
+            self.threshold = float(outlier.max()) if len(outlier) and outlier.max() > 0 else 1.0   #mostly identical periods: only flag values beyond all of them
+        return self
+
+    def _scale(self, outlier):   #1 for a typical period, 0 at the threshold, negative beyond it
+        return 1.0 - outlier / self.threshold
+
+
+class IsolationForestDetector(Detector):   #sklearn's IsolationForest behind the common interface
+
+    PARAMS = ('contamination', 'n_estimators', 'max_samples')
+
+    def __init__(self, contamination=0.10, n_estimators=100, max_samples='auto'):
+        self.model = IsolationForest(contamination=contamination, n_estimators=n_estimators, max_samples=max_samples, random_state=42)
+
+    def fit(self, X):
+        self.model.fit(as_matrix(X))
+        return self
+
+    def score(self, X):
+        return self.model.decision_function(as_matrix(X))
+
+
+class MadDetector(Detector):   #robust z-score per feature from the training median and MAD; a period's outlier score is its largest one
+
+    def __init__(self, contamination=0.10):
+        self.contamination = contamination
+
+    def fit(self, X):
+        X = as_matrix(X)
+        columns = X.T   #one row per feature, copied contiguous so each median partitions memory in order and may overwrite it
+        self.center = np.median(np.array(columns, order='C'), axis=1, overwrite_input=True)
+        spread = np.median(np.abs(columns - self.center[:, None]), axis=1, overwrite_input=True) * MAD_TO_STD
+        if not (spread > 0).all():
+            spread = np.where(spread > 0, spread, columns.std(axis=1))   #a feature that is mostly one value has a zero MAD
+        self.spread = np.where(spread > 0, spread, 1.0)
+        return self._calibrate(self._outlier(X))
+
+    def score(self, X):
+        return self._scale(self._outlier(as_matrix(X)))
+
+    def _outlier(self, X):
+        return (np.abs(X - self.center) / self.spread).max(axis=1)
+
+
+class HistogramDetector(Detector):   #histogram-based outlier score (HBOS): the summed negative log density of each feature's bin, from equal-width training histograms
+
+    PARAMS = ('contamination', 'bins')
+
+    def __init__(self, contamination=0.10, bins=64):
+        self.contamination = contamination
+        self.bins = bins
+
+    def fit(self, X):
+        X = as_matrix(X)
+        n, k = X.shape
+        self.lower = X.min(axis=0) if n else np.zeros(k)
+        self.upper = X.max(axis=0) if n else np.zeros(k)
+        width = (self.upper - self.lower) / self.bins
+        self.width = np.where(width > 0, width, 1.0)
+        #counts per (feature, bin) plus an always empty last bin for values outside the training range; one pseudo-count keeps every density finite
+        pos = self._bins(X)
+        counts = np.stack([np.bincount(pos[:, j], minlength=self.bins + 1) for j in range(k)]).astype(np.float64)
+        self.log_density = -np.log((counts + 1.0) / (n + self.bins + 1.0))
+        return self._calibrate(self._outlier(X))
+
+    def score(self, X):
+        return self._scale(self._outlier(as_matrix(X)))
+
+    def _bins(self, X):   #bin of every value per feature, or the extra last bin when outside the training range (or NaN)
+        pos = (X - self.lower) / self.width
+        outside = ~((pos >= 0) & (X <= self.upper))
+        np.minimum(pos, self.bins - 1, out=pos)   #the training maximum closes the last bin
+        pos[outside] = self.bins
+        return pos.astype(np.intp)   #truncation is floor for the non-negative positions left
+
+    def _outlier(self, X):
+        return self.log_density[np.arange(X.shape[1]), self._bins(X)].sum(axis=1)
+
+
+#selectable by name per resolution; register new detectors here
+DETECTORS = {
+    'iforest':   IsolationForestDetector,
+    'mad':       MadDetector,
+    'histogram': HistogramDetector,
+}
+
+def make_detector(name, **params):   #an unfitted detector by registry name, given whichever of params it takes
+    try:
+        cls = DETECTORS[name]
+    except KeyError:
+        raise ValueError(f"unknown detector {name!r}, expected one of {', '.join(DETECTORS)}") from None
+    return cls(**{k: v for k, v in params.items() if k in cls.PARAMS})
+
+def parse_detectors(value, resolutions, default=DEFAULT_DETECTOR):   #detector name per resolution from "mad" (every resolution) or "minute=mad,30min=histogram" (the rest keep default)
+    chosen = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(','))):
+        resolution, sep, name = item.rpartition('=')
+        if name not in DETECTORS:
+            raise ValueError(f"unknown detector {name!r}, expected one of {', '.join(DETECTORS)}")
+        if not sep:
+            default = name
+        elif resolution in resolutions:
+            chosen[resolution] = name
+        else:
+            raise ValueError(f"unknown resolution {resolution!r}, expected one of {', '.join(resolutions)}")
+    return {res: chosen.get(res, default) for res in resolutions}
@@ -0,0 +1,32 @@
+import numpy as np
+
+def lttb_indices(x, y, max_points):   #positions kept by Largest-Triangle-Three-Buckets: the first and last point, plus per bucket the one spanning the largest triangle with its neighbours
+    n = len(x)
+    if max_points >= n or n <= 2:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1])[:max(max_points, 1)]
+
+    #relative float coordinates, so nanosecond epochs keep their precision in the area products
+    x = np.asarray(x, dtype=np.float64) - float(x[0])
+    y = np.asarray(y, dtype=np.float64)
+    edges = (np.arange(max_points - 1) * ((n - 2) / (max_points - 2))).astype(np.int64) + 1   #max_points - 2 buckets between the fixed first and last point
+    edges[-1] = n - 1
+
+    #average point of every bucket from prefix sums, so the loop below only searches; the final bucket is followed by the last point
+    starts, stops = np.append(edges[1:-1], n - 1), np.append(edges[2:], n)
+    cx, cy = np.concatenate(([0.0], np.cumsum(x))), np.concatenate(([0.0], np.cumsum(y)))
+    avg_x = ((cx[stops] - cx[starts]) / (stops - starts)).tolist()
+    avg_y = ((cy[stops] - cy[starts]) / (stops - starts)).tolist()
+    edges = edges.tolist()
+
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - avg_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (avg_y[i] - ay))
+        a = lo + int(area.argmax())
+        kept[i + 1] = a
+    return kept
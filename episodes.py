@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from metrics import REGISTRY
+
+ALERTS = REGISTRY.counter("hem_alerts_total", "Anomalous points by alert decision: sent (first of an episode), coalesced (same episode) or cooldown (a new episode too soon after the last alert)", ["outcome"])
+
+READINGS_PER_HOUR = 60.0   #one reading a minute, as in the UCI data: a period's total_power (a sum of kW readings) / 60 is its energy in kWh
+
+def find_episodes(labels, values, gap=1, baseline=None):   #runs of anomalies (label -1) merged across at most gap normal periods, in one vectorized pass; baseline (scalar or per period) defaults to the median of the normal periods
+    labels = np.asarray(labels)
+    values = np.asarray(values, dtype=np.float64)
+    pos = np.flatnonzero(labels == -1)
+    if not len(pos):
+        return pd.DataFrame({
+            'start_pos': np.empty(0, np.int64), 'end_pos': np.empty(0, np.int64), 'anomalies': np.empty(0, np.int64),
+            'peak': np.empty(0), 'energy_kwh': np.empty(0),
+        })
+
+    #a new episode starts wherever the next anomaly is more than gap normal periods after the previous one
+    breaks = np.flatnonzero(np.diff(pos) > gap + 1)
+    first = np.concatenate(([0], breaks + 1))
+    last = np.concatenate((breaks, [len(pos) - 1]))
+    starts, ends = pos[first], pos[last]   #inclusive, the normal periods inside the gaps belong to the episode
+
+    if baseline is None:
+        normal = values[labels != -1]
+        baseline = float(np.median(normal)) if len(normal) else 0.0
+    excess = np.concatenate(([0.0], np.cumsum(np.clip(values - baseline, 0.0, None))))
+
+    #maximum over each [start, end] span: reduceat over interleaved bounds, keeping every other result; the padding keeps end + 1 a valid index
+    bounds = np.empty(2 * len(starts), dtype=np.int64)
+    bounds[0::2], bounds[1::2] = starts, ends + 1
+    peaks = np.maximum.reduceat(np.append(values, -np.inf), bounds)[0::2]
+
+    return pd.DataFrame({
+        'start_pos':  starts,
+        'end_pos':    ends,
+        'anomalies':  last - first + 1,
+        'peak':       peaks,
+        'energy_kwh': (excess[ends + 1] - excess[starts]) / READINGS_PER_HOUR,
+    })
+
+def episode_start(labels, pos, gap=1, window=1024):   #position of the first anomaly of the episode that the anomaly at pos belongs to, looking back over a doubling window
+    while True:
+        lo = max(pos + 1 - window, 0)
+        anomalies = np.flatnonzero(np.asarray(labels[lo:pos + 1]) == -1) + lo
+        breaks = np.flatnonzero(np.diff(anomalies) > gap + 1)
+        start = int(anomalies[breaks[-1] + 1]) if len(breaks) else int(anomalies[0])
+        #done once a break is seen, or the episode cannot continue before the window
+        if len(breaks) or lo == 0 or start - lo > gap:
+            return start
+        window *= 2
+
+
+class AlertGate:   #one alert per episode, and none within cooldown seconds of the last one; shared by every client so several tabs never repeat an alert
+
+    def __init__(self, cooldown=300.0, remember=1024, clock=time.monotonic):
+        self.cooldown = cooldown
+        self._remember = remember      #episodes kept to recognise their later points
+        self._seen = OrderedDict()     #(resolution, episode start) -> None, oldest first
+        self._last_sent = None
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def allow(self, resolution, episode):   #True if an alert should go out for this point of the episode (keyed by its start)
+        key = (resolution, episode)
+        with self._lock:
+            if key in self._seen:
+                ALERTS.labels("coalesced").inc()
+                return False
+            self._seen[key] = None
+            while len(self._seen) > self._remember:
+                self._seen.popitem(last=False)
+            now = self._clock()
+            if self._last_sent is not None and now - self._last_sent < self.cooldown:
+                ALERTS.labels("cooldown").inc()
+                return False
+            self._last_sent = now
+        ALERTS.labels("sent").inc()
+        return True
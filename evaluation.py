@@ -0,0 +1,208 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import sklearn
+from sklearn.metrics import precision_score, recall_score
+from sklearn.model_selection import TimeSeriesSplit
+import data_cache
+from aggregates import AggregatePyramid, RESOLUTIONS
+from anomaly_detector import detector_input, fit_model, load_and_preprocess, score_series
+from detectors import DEFAULT_DETECTOR, DETECTORS
+
+#hyperparameters swept by default; every combination is cross-validated at every resolution
+DEFAULT_GRID = {
+    'resolution':    ['hour'],
+    'detector':      [DEFAULT_DETECTOR],
+    'contamination': [0.05, 0.10, 0.15],
+    'n_estimators':  [100, 200],
+    'max_samples':   ['auto', 256],
+}
+ANOMALY_PERCENTILE = 95   #periods above this percentile of their resolution count as true anomalies, as in tests/test_cv.py
+
+_series = {}   #resolution -> grouped frame, set once per worker process by _init_worker
+_inputs = {}   #resolution -> (detector input matrix, total_power), built on first use in each worker
+
+def _init_worker(series):
+    _series.clear()
+    _inputs.clear()
+    _series.update(series)
+
+def fold_inputs(resolution):   #the same detector_input the app fits on (the feature matrix when the frame has the source columns), with the total_power the true labels come from
+    if resolution not in _inputs:
+        grouped = _series[resolution]
+        _inputs[resolution] = (np.asarray(detector_input(grouped)), grouped['total_power'].to_numpy())
+    return _inputs[resolution]
+
+def iter_configs(grid):   #every combination of the grid as a dict, in a stable order
+    keys = list(grid)
+    for values in itertools.product(*(grid[k] for k in keys)):
+        yield dict(zip(keys, values))
+
+def true_labels(values, percentile=ANOMALY_PERCENTILE):   #1 for periods above the percentile, 0 otherwise
+    return (values > np.percentile(values, percentile)).astype(int)
+
+def evaluate_fold(config, train_idx, test_idx, percentile=ANOMALY_PERCENTILE):   #fit on one fold's training slice and score its test slice; runs in a worker process
+    X, values = fold_inputs(config['resolution'])
+    y_true = true_labels(values, percentile)[test_idx]
+    params = {k: v for k, v in config.items() if k not in ('resolution', 'detector')}
+
+    start = time.perf_counter()
+    model = fit_model(X[train_idx], config.get('detector', DEFAULT_DETECTOR), **params)
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    labels, _ = score_series(model, None, X[test_idx])
+    predict_seconds = time.perf_counter() - start
+
+    y_pred = (labels == -1).astype(int)
+    return {
+        'precision':       precision_score(y_true, y_pred, zero_division=0),
+        'recall':          recall_score(y_true, y_pred, zero_division=0),
+        'fit_seconds':     fit_seconds,
+        'predict_seconds': predict_seconds,
+    }
+
+def summarise(config, folds):   #mean and spread of the fold metrics for one configuration
+    result = dict(config)
+    for metric in ('precision', 'recall'):
+        scores = [f[metric] for f in folds]
+        result[metric] = float(np.mean(scores))
+        result[f'{metric}_std'] = float(np.std(scores))
+    result['fit_seconds'] = float(sum(f['fit_seconds'] for f in folds))
+    result['predict_seconds'] = float(sum(f['predict_seconds'] for f in folds))
+    result['folds'] = len(folds)
+    return result
+
+def config_key(config, data_key, n_splits, percentile):   #cache key of one configuration on one exact dataset and library version
+    blob = json.dumps({
+        'config':     config,
+        'data':       data_key,
+        'splits':     n_splits,
+        'percentile': percentile,
+        'sklearn':    sklearn.__version__,
+        'numpy':      np.__version__,   #the MAD and histogram detectors are pure NumPy
+    }, sort_keys=True, default=str)
+    return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
+def run_sweep(series, grid, n_splits=5, workers=None, cache_dir=None, data_key=None, percentile=ANOMALY_PERCENTILE):   #cross-validate every configuration of the grid; folds x configurations run on a process pool, finished configurations come from the cache
+    configs = list(iter_configs(grid))
+    results = {}
+    todo = []
+    for i, config in enumerate(configs):
+        cached = _read_cached(cache_dir, config_key(config, data_key, n_splits, percentile)) if cache_dir else None
+        if cached is not None:
+            results[i] = dict(cached, cached=True)
+        else:
+            todo.append(i)
+
+    if todo:
+        splits = {
+            res: list(TimeSeriesSplit(n_splits=n_splits).split(series[res]))
+            for res in {configs[i]['resolution'] for i in todo}
+        }
+        tasks = [(i, fold) for i in todo for fold in range(n_splits)]
+        folds = {i: [None] * n_splits for i in todo}
+
+        if workers == 1:
+            _init_worker(series)
+            outcomes = [evaluate_fold(configs[i], *splits[configs[i]['resolution']][fold], percentile) for i, fold in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(series,)) as pool:
+                futures = [
+                    pool.submit(evaluate_fold, configs[i], *splits[configs[i]['resolution']][fold], percentile)
+                    for i, fold in tasks
+                ]
+                outcomes = [f.result() for f in futures]
+
+        for (i, fold), outcome in zip(tasks, outcomes):
+            folds[i][fold] = outcome
+        for i in todo:
+            results[i] = dict(summarise(configs[i], folds[i]), cached=False)
+            if cache_dir:
+                _write_cached(cache_dir, config_key(configs[i], data_key, n_splits, percentile), results[i])
+
+    return [results[i] for i in range(len(configs))]
+
+def load_series(data_path, resolutions):   #load and group the dataset once; every resolution is the grouped frame the app fits on, from the same aggregate pyramid
+    pyramid = AggregatePyramid.from_frame(load_and_preprocess(data_path))
+    return {res: pyramid.frame(res) for res in resolutions}
+
+def _read_cached(cache_dir, key):
+    try:
+        with open(os.path.join(cache_dir, f"{key}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_cached(cache_dir, key, result):   #written to a temp file first so an interrupted sweep never leaves a truncated entry
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.json")
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump({k: v for k, v in result.items() if k != 'cached'}, f)
+    os.replace(tmp, path)
+
+def _param(value):   #command-line hyperparameter: int, float or a keyword such as 'auto'
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+def main(argv=None):   #sweep CLI: print precision/recall and fit/predict time per configuration, best F1 first
+    parser = argparse.ArgumentParser(description="Cross-validate detector hyperparameters on the household power dataset")
+    parser.add_argument('--data', default=os.getenv("HOUSEHOLD_DATA_PATH", "household_power_consumption.xlsx"),
+                        help="dataset path (.xlsx, or the UCI .txt/.csv export)")
+    parser.add_argument('--resolution', nargs='+', default=DEFAULT_GRID['resolution'], choices=RESOLUTIONS)
+    parser.add_argument('--detector', nargs='+', default=DEFAULT_GRID['detector'], choices=list(DETECTORS))
+    parser.add_argument('--contamination', nargs='+', type=float, default=DEFAULT_GRID['contamination'])
+    parser.add_argument('--n-estimators', nargs='+', type=int, default=DEFAULT_GRID['n_estimators'])
+    parser.add_argument('--max-samples', nargs='+', type=_param, default=DEFAULT_GRID['max_samples'])
+    parser.add_argument('--splits', type=int, default=5, help="TimeSeriesSplit folds")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--no-cache', action='store_true', help="ignore and do not write cached results")
+    parser.add_argument('--output', help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    grid = {
+        'resolution':    args.resolution,
+        'detector':      args.detector,
+        'contamination': args.contamination,
+        'n_estimators':  args.n_estimators,
+        'max_samples':   args.max_samples,
+    }
+    start = time.perf_counter()
+    series = load_series(args.data, args.resolution)
+    load_seconds = time.perf_counter() - start
+
+    data_key = data_cache.source_fingerprint(args.data)
+    cache_dir = None if args.no_cache else os.path.join(data_cache.default_cache_root(args.data), "cv")
+    results = run_sweep(series, grid, n_splits=args.splits, workers=args.workers, cache_dir=cache_dir, data_key=data_key)
+    sweep_seconds = time.perf_counter() - start - load_seconds
+
+    def f1(r):
+        p, rc = r['precision'], r['recall']
+        return 2 * p * rc / (p + rc) if p + rc else 0.0
+
+    print(f"{'resolution':<11}{'detector':<10}{'contam':>7}{'trees':>6}{'samples':>8}{'precision':>11}{'recall':>9}{'F1':>7}{'fit s':>8}{'pred s':>8}")
+    for r in sorted(results, key=f1, reverse=True):
+        print(f"{r['resolution']:<11}{r['detector']:<10}{r['contamination']:>7}{r['n_estimators']:>6}{str(r['max_samples']):>8}"
+              f"{r['precision']:>11.3f}{r['recall']:>9.3f}{f1(r):>7.3f}{r['fit_seconds']:>8.2f}{r['predict_seconds']:>8.2f}"
+              f"{'  (cached)' if r['cached'] else ''}")
+    print(f"loaded in {load_seconds:.1f}s, swept {len(results)} configurations in {sweep_seconds:.1f}s", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
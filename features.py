@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+SUB_METERS = ['Sub_metering_1', 'Sub_metering_2', 'Sub_metering_3']
+#per-reading values whose sums compose across resolutions: a 30min, hour or day bucket is the sum of its minutes, and voltage mean/std follow from n, sum and sum of squares
+SOURCE_COLUMNS = ['total_power', 'sub_metering_1', 'sub_metering_2', 'sub_metering_3', 'active_energy_wh',
+                  'voltage_n', 'voltage_sum', 'voltage_sq']
+FEATURE_COLUMNS = ['total_power', 'sub_metering_1', 'sub_metering_2', 'sub_metering_3', 'sub_metering_other',
+                   'voltage_mean', 'voltage_std', 'hour_sin', 'hour_cos', 'weekday_sin', 'weekday_cos']
+NS_PER_HOUR = 3600 * 10**9
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+def has_sources(data):   #True when the raw frame carries the UCI sub-metering and voltage columns
+    return set(SUB_METERS + ['Global_active_power', 'Voltage']) <= set(data.columns)
+
+def source_frame(data, power):   #composable per-reading columns for the pyramid: total_power alone, or every source column when the UCI measurements are present
+    if not has_sources(data):
+        return pd.DataFrame({'total_power': np.asarray(power, dtype=np.float64)})
+
+    voltage = pd.to_numeric(data['Voltage'], errors='coerce').to_numpy(dtype=np.float64)
+    present = ~np.isnan(voltage)
+    voltage = np.where(present, voltage, 0.0)
+    sources = {'total_power': np.asarray(power, dtype=np.float64)}
+    for i, col in enumerate(SUB_METERS, 1):
+        sources[f'sub_metering_{i}'] = pd.to_numeric(data[col], errors='coerce').to_numpy(dtype=np.float64)
+    #Global_active_power is in kW averaged over the minute, so x 1000 / 60 gives the Wh the sub-meters use
+    sources['active_energy_wh'] = pd.to_numeric(data['Global_active_power'], errors='coerce').to_numpy(dtype=np.float64) * (1000.0 / 60.0)
+    sources['voltage_n'] = present.astype(np.float64)
+    sources['voltage_sum'] = voltage
+    sources['voltage_sq'] = voltage * voltage
+    return pd.DataFrame(sources)
+
+def has_features(grouped):   #True when a grouped frame carries every source column feature_matrix needs
+    return set(SOURCE_COLUMNS) <= set(grouped.columns)
+
+def feature_matrix(grouped):   #C-contiguous float32 (periods x FEATURE_COLUMNS) matrix from a grouped frame with the source columns, computed column by column without Python loops
+    n = len(grouped)
+    X = np.empty((n, len(FEATURE_COLUMNS)), dtype=np.float32)
+    col = lambda name: grouped[name].to_numpy(dtype=np.float64)
+
+    X[:, 0] = col('total_power')
+    subs = [col(f'sub_metering_{i}') for i in (1, 2, 3)]
+    for i, sub in enumerate(subs, 1):
+        X[:, i] = sub
+    X[:, 4] = col('active_energy_wh') - subs[0] - subs[1] - subs[2]   #energy no sub-meter records
+
+    count, total, squares = col('voltage_n'), col('voltage_sum'), col('voltage_sq')
+    mean = np.divide(total, count, out=np.zeros(n), where=count > 0)
+    fallback = total.sum() / count.sum() if count.sum() else 0.0
+    X[:, 5] = np.where(count > 0, mean, fallback)   #periods without a voltage reading get the overall mean
+    X[:, 6] = np.sqrt(np.clip(np.divide(squares, count, out=np.zeros(n), where=count > 0) - mean * mean, 0.0, None))
+
+    #cyclical encodings, so 23:00 sits next to 00:00 and Sunday next to Monday
+    ns = grouped['group'].to_numpy().astype('datetime64[ns]').view(np.int64)
+    hour = (ns % NS_PER_DAY) / NS_PER_HOUR
+    weekday = ((ns // NS_PER_DAY) + 3) % 7   #1970-01-01 was a Thursday; Monday is 0
+    X[:, 7] = np.sin(2 * np.pi * hour / 24)
+    X[:, 8] = np.cos(2 * np.pi * hour / 24)
+    X[:, 9] = np.sin(2 * np.pi * weekday / 7)
+    X[:, 10] = np.cos(2 * np.pi * weekday / 7)
+    return X
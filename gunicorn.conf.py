@@ -0,0 +1,24 @@
+#multi-worker deployment: gunicorn -c gunicorn.conf.py app:app
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("HEM_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("HEM_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"                     #threads keep /stream connections from tying up whole workers; app.py lets streams take at most MAX_STREAMS of them
+threads = int(os.getenv("HEM_THREADS", "8"))
+
+#import app.py once in the master: the dataset is loaded, grouped and every detector fitted before forking,
+#then workers share those pages copy-on-write instead of each repeating the work
+preload_app = True
+os.environ.setdefault("HEM_PRELOAD", "1")
+
+def when_ready(server):
+    gc.freeze()   #keep the garbage collector from touching (and so copying) the preloaded objects in every worker
+
+def post_fork(server, worker):
+    import app
+    app.model_registry.after_fork()
+    app.refit_registry.after_fork()
+    app.scoring.after_fork()
+    app.anomaly_store.after_fork()
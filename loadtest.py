@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import requests
+from aggregates import RESOLUTIONS
+from benchmark import dataset_path, SIZES
+
+#share of requests per endpoint for one simulated dashboard: mostly status polls, with the occasional chart and history query
+DEFAULT_MIX = {
+    '/current_status':                          0.55,
+    '/stream?resolution=minute':                0.05,   #timed to the first status event, then closed; a 503 past the per-worker stream cap counts as an error
+    '/insights':                                0.2,
+    '/history?resolution=hour&max_points=500':  0.1,
+    '/anomalies?limit=50':                      0.05,
+    '/episodes?resolution=hour&limit=50':       0.05,
+}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(data_path, port, speed="60x", workers=0, threads=8, log_path=os.devnull):   #the app in a child process, on the threaded dev server or, with workers, gunicorn; replaying at speed, its log (a request line each) going to log_path
+    env = dict(os.environ, HOUSEHOLD_DATA_PATH=data_path, REPLAY_SPEED=str(speed))
+    env.pop("TELEGRAM_BOT_TOKEN", None)   #alerts would reach a real chat
+    env.pop("TELEGRAM_CHAT_ID", None)
+    here = os.path.dirname(os.path.abspath(__file__))
+    if workers:
+        env.update(HEM_BIND=f"127.0.0.1:{port}", HEM_WORKERS=str(workers), HEM_THREADS=str(threads))
+        cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(here, "gunicorn.conf.py"), "app:app"]
+    else:
+        cmd = [sys.executable, "-c", f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    with open(log_path, "ab") as log:
+        return subprocess.Popen(cmd, cwd=here, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def wait_ready(url, proc=None, timeout=600, models=len(RESOLUTIONS)):   #poll /metrics until the server answers with a detector fitted for every resolution, so no request sees a warming placeholder; fails early if the process died while loading
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}, see its log")
+        try:
+            cached = re.search(r"^hem_models_cached (\S+)$", requests.get(f"{url}/metrics", timeout=2).text, re.M)
+            if cached and float(cached.group(1)) >= models:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+def fetch(session, url):   #one request, True unless it failed with a server error; a /stream is read up to its first status event and closed, like a dashboard that moved on
+    if '/stream' not in url:
+        return session.get(url, timeout=30).status_code < 500
+    with session.get(url, timeout=30, stream=True) as resp:
+        if resp.status_code >= 500:
+            return False
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("data:"):
+                return True
+    return False
+
+def run_clients(url, clients=50, duration=30.0, mix=None, think=0.0, seed=0):   #clients threads, each a keep-alive session polling endpoints drawn from mix for duration seconds; returns ({endpoint: [latency s]}, {endpoint: errors}, elapsed)
+    mix = mix or DEFAULT_MIX
+    paths = list(mix)
+    weights = np.array([mix[p] for p in paths], dtype=float)
+    weights /= weights.sum()
+    latencies = [{p: [] for p in paths} for _ in range(clients)]
+    errors = [{p: 0 for p in paths} for _ in range(clients)]
+    barrier = threading.Barrier(clients + 1)
+    stop = [None]
+
+    def client(i):
+        rng = np.random.default_rng([seed, i])
+        choices = rng.choice(len(paths), size=100_000, p=weights)   #drawn up front, off the timed path
+        session = requests.Session()
+        barrier.wait()
+        n = 0
+        while time.monotonic() < stop[0]:
+            path = paths[choices[n % len(choices)]]
+            n += 1
+            start = time.perf_counter()
+            try:
+                ok = fetch(session, f"{url}{path}{'&' if '?' in path else '?'}client=load{i}")
+            except requests.RequestException:
+                ok = False
+            latencies[i][path].append(time.perf_counter() - start)
+            if not ok:
+                errors[i][path] += 1
+            if think:
+                time.sleep(rng.exponential(think))   #a dashboard polls about once per think seconds, not back to back
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    for t in threads:
+        t.start()
+    stop[0] = time.monotonic() + duration
+    barrier.wait()
+    start = time.monotonic()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+
+    merged = {p: [x for per in latencies for x in per[p]] for p in paths}
+    failed = {p: sum(per[p] for per in errors) for p in paths}
+    return merged, failed, elapsed
+
+def summarise(latencies, errors, elapsed):   #throughput and p50/p95/p99 latency per endpoint, plus the total
+    def stats(values, failed):
+        ms = np.asarray(values) * 1000.0
+        if not len(ms):
+            return {'requests': 0, 'errors': failed, 'requests_per_second': 0.0}
+        return {
+            'requests':            int(len(ms)),
+            'errors':              int(failed),
+            'requests_per_second': float(len(ms) / elapsed),
+            'p50_ms':              float(np.percentile(ms, 50)),
+            'p95_ms':              float(np.percentile(ms, 95)),
+            'p99_ms':              float(np.percentile(ms, 99)),
+            'mean_ms':             float(ms.mean()),
+        }
+    report = {path: stats(values, errors[path]) for path, values in latencies.items()}
+    report['total'] = stats([x for v in latencies.values() for x in v], sum(errors.values()))
+    return report
+
+def run_loadtest(url=None, size='1M', seed=0, clients=50, duration=30.0, think=0.0, speed="60x", workers=0, workdir=None):   #start a local server on a synthetic dataset unless url is given, then load it with clients simulated dashboards
+    proc = None
+    if url is None:
+        workdir = workdir or os.path.join(tempfile.gettempdir(), "hem_bench")
+        os.makedirs(workdir, exist_ok=True)
+        rows = SIZES.get(size) or int(size)
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        log_path = os.path.join(workdir, "loadtest-server.log")
+        print(f"starting server on {url}, log in {log_path}", file=sys.stderr)
+        proc = start_server(dataset_path(workdir, rows, seed), port, speed, workers, log_path=log_path)
+    try:
+        wait_ready(url, proc)
+        latencies, errors, elapsed = run_clients(url, clients, duration, think=think, seed=seed)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(30)
+    return {
+        'meta': {
+            'url':      url,
+            'size':     size if proc is not None else None,
+            'clients':  clients,
+            'duration': duration,
+            'think':    think,
+            'speed':    speed if proc is not None else None,
+            'workers':  workers,
+            'python':   platform.python_version(),
+            'cpus':     os.cpu_count(),
+            'started':  time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'endpoints': summarise(latencies, errors, elapsed),
+    }
+
+def main(argv=None):   #load-test CLI: print a per-endpoint table to stderr and the JSON report to --output
+    parser = argparse.ArgumentParser(description="Simulate many dashboard clients against a local or running Home Energy Monitor")
+    parser.add_argument('--url', help="server to load, e.g. http://127.0.0.1:5000; by default one is started on a synthetic dataset")
+    parser.add_argument('--size', default='1M', help="synthetic dataset size for the started server: 10k, 1M, 10M or a row count")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--clients', type=int, default=50, help="simulated dashboards, one thread and keep-alive connection each")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds of load")
+    parser.add_argument('--think', type=float, default=0.0, help="mean seconds between one client's requests (0: back to back)")
+    parser.add_argument('--speed', default='60x', help="replay speed of the started server: 1x, 60x, 3600x or a number")
+    parser.add_argument('--workers', type=int, default=0, help="serve with gunicorn and this many workers instead of the threaded dev server")
+    parser.add_argument('--workdir', help="where generated datasets are kept between runs")
+    parser.add_argument('--output', default='-', help="JSON report path, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    report = run_loadtest(args.url, args.size, args.seed, args.clients, args.duration, args.think, args.speed, args.workers, args.workdir)
+    print(f"{'endpoint':<44}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}", file=sys.stderr)
+    for path, s in report['endpoints'].items():
+        print(f"{path:<44}{s['requests_per_second']:>9.1f}{s.get('p50_ms', 0):>9.2f}{s.get('p99_ms', 0):>9.2f}{s['errors']:>8}", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import os
+
+def process_memory(pid="self"):   #memory of one process in bytes from /proc/<pid>/smaps_rollup: rss, pss, uss (private) and shared
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except OSError:
+        return None
+    return {
+        "pid":    os.getpid() if pid == "self" else int(pid),
+        "rss":    fields.get("Rss", 0),
+        "pss":    fields.get("Pss", 0),    #shared pages split between the processes using them
+        "uss":    fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
+
+def frame_memory(df):   #bytes per column of a frame, counting the strings behind object columns, plus the total and bytes per row
+    columns = {str(name): int(b) for name, b in df.memory_usage(index=False, deep=True).items()}
+    total = sum(columns.values())
+    return {
+        "rows":          len(df),
+        "columns":       columns,
+        "total":         total,
+        "bytes_per_row": total / len(df) if len(df) else 0.0,
+    }
+
+def dataset_report(path):   #memory of the loaded dataset in the full and the compact representation, and of the pyramid built from it
+    from aggregates import AggregatePyramid
+    from anomaly_detector import load_and_preprocess
+
+    report = {}
+    for mode in ("full", "compact"):
+        data = load_and_preprocess(path, use_cache=False, compact=mode == "compact")
+        report[mode] = frame_memory(data)
+        report[mode]["pyramid"] = AggregatePyramid.from_frame(data).nbytes()
+        del data
+    return report
+
+def child_pids(pid):   #direct children of a process, e.g. the workers of a gunicorn master
+    children = []
+    for tid in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{tid}/children") as f:
+            children.extend(int(c) for c in f.read().split())
+    return sorted(children)
+
+def print_dataset_report(path):   #per-column bytes of both representations side by side, to size containers
+    report = dataset_report(path)
+    full, compact = report["full"], report["compact"]
+    mib = 1024 * 1024
+    print(f"{'column':<24}{'full MiB':>10}{'compact MiB':>13}")
+    for name in list(full["columns"]) + [c for c in compact["columns"] if c not in full["columns"]]:
+        cells = [f"{m['columns'][name] / mib:.1f}" if name in m["columns"] else "-" for m in (full, compact)]
+        print(f"{name:<24}{cells[0]:>10}{cells[1]:>13}")
+    for label, key in (("total", "total"), ("pyramid", "pyramid")):
+        print(f"{label:<24}{full[key] / mib:>10.1f}{compact[key] / mib:>13.1f}")
+    print(f"{full['rows']} rows: {full['bytes_per_row']:.0f} bytes per row full, {compact['bytes_per_row']:.0f} compact")
+
+def main(argv=None):   #print per-worker memory for a gunicorn master, where the PSS total is the real combined footprint, or with --data the memory of a dataset in both representations
+    parser = argparse.ArgumentParser(description="Per-worker memory of a multi-worker Home Energy Monitor deployment")
+    parser.add_argument("pid", type=int, nargs="?", help="pid of the gunicorn master process")
+    parser.add_argument("--data", help="instead report the memory of this dataset, full and compact")
+    args = parser.parse_args(argv)
+    if args.data:
+        print_dataset_report(args.data)
+        return
+    if args.pid is None:
+        parser.error("a pid or --data is required")
+
+    rows = [("master", process_memory(args.pid))]
+    rows += [("worker", process_memory(pid)) for pid in child_pids(args.pid)]
+
+    mib = 1024 * 1024
+    print(f"{'role':<8}{'pid':>8}{'RSS MiB':>10}{'PSS MiB':>10}{'USS MiB':>10}{'shared MiB':>12}")
+    for role, mem in rows:
+        if mem is None:
+            continue
+        print(f"{role:<8}{mem['pid']:>8}{mem['rss'] / mib:>10.1f}{mem['pss'] / mib:>10.1f}"
+              f"{mem['uss'] / mib:>10.1f}{mem['shared'] / mib:>12.1f}")
+    total_pss = sum(mem["pss"] for _, mem in rows if mem)
+    total_rss = sum(mem["rss"] for _, mem in rows if mem)
+    print(f"total PSS {total_pss / mib:.1f} MiB (sum of RSS {total_rss / mib:.1f} MiB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+FIT_SECONDS = REGISTRY.histogram("hem_model_fit_seconds", "Background detector fit time, including scoring every period", ["resolution"],
+                                 buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+FIT_FAILURES = REGISTRY.counter("hem_model_fit_failures_total", "Detector fits that raised", ["resolution"])
+
+class ModelRegistry:   #fitted detectors keyed by (resolution, data version); fits run on a background pool and old entries are evicted LRU
+
+    def __init__(self, fit, max_entries=8, workers=1, store=None):
+        self._fit = fit                   #callable taking a grouped frame and returning a fitted model, or a dict of them per resolution
+        self._store = store               #optional ModelStore: fits found there are loaded instead of refitted, new fits are saved to it
+        self._max_entries = max_entries
+        self._models = OrderedDict()      #(resolution, version) -> model, most recently used last
+        self._pending = {}                #(resolution, version) -> Future of a fit in progress
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="detector-fit")
+
+    def get(self, resolution, version, grouped):   #return the cached model, or None after scheduling a fit; never blocks on fitting
+        key = (resolution, version)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                return model
+            self._submit_locked(key, grouped)
+            return None
+
+    def submit(self, resolution, version, grouped):   #schedule a fit unless one is cached or running; returns a Future resolving to the model
+        key = (resolution, version)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                future = Future()
+                future.set_result(model)
+                return future
+            return self._submit_locked(key, grouped)
+
+    def put(self, resolution, version, model):   #register an already fitted model
+        with self._lock:
+            self._store_locked((resolution, version), model)
+
+    def warm(self, pyramid, resolutions):   #fit every resolution of the pyramid in the background, in the order given
+        return {res: self.submit(res, pyramid.version, pyramid.frame(res)) for res in resolutions}
+
+    def __len__(self):   #number of cached models
+        with self._lock:
+            return len(self._models)
+
+    def after_fork(self):   #call in a forked worker: the parent's pool threads do not exist there, but its fitted models do
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pool = ThreadPoolExecutor(max_workers=self._pool._max_workers, thread_name_prefix="detector-fit")
+
+    def _submit_locked(self, key, grouped):
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pool.submit(self._fit_and_store, key, grouped)
+            self._pending[key] = future
+        return future
+
+    def _fit_and_store(self, key, grouped):
+        start = time.perf_counter()
+        try:
+            model = self._fit_or_load(key[0], grouped)
+        except Exception:
+            FIT_FAILURES.labels(key[0]).inc()
+            log.exception("Detector fit failed for %s", key)
+            with self._lock:
+                self._pending.pop(key, None)   #allow the next request to retry
+            raise
+        FIT_SECONDS.labels(key[0]).observe(time.perf_counter() - start)
+        with self._lock:
+            self._store_locked(key, model)
+            self._pending.pop(key, None)
+        return model
+
+    def _fit_or_load(self, resolution, grouped):   #the persisted fit when the store has one for exactly this data and these parameters, else a new fit that is then saved
+        fit = self._fit[resolution] if isinstance(self._fit, dict) else self._fit
+        if self._store is None:
+            return fit(grouped)
+        store_key = self._store.key(resolution, grouped)
+        model = self._store.load(store_key)
+        if model is None:
+            model = fit(grouped)
+            self._store.save(store_key, model)
+        return model
+
+    def _store_locked(self, key, model):
+        self._models[key] = model
+        self._models.move_to_end(key)
+        while len(self._models) > self._max_entries:
+            self._models.popitem(last=False)
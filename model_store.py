@@ -0,0 +1,126 @@
+import hashlib
+import json
+import logging
+import os
+import platform
+import time
+import joblib
+import numpy as np
+import sklearn
+from features import FEATURE_COLUMNS
+from metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+STORE_FORMAT = 1   #bump whenever what fit_and_score returns, or how it is saved, changes
+SUFFIX = ".joblib"
+
+LOADS = REGISTRY.counter("hem_model_store_total", "Model store lookups by outcome: hit, miss or error", ["outcome"])
+LOAD_SECONDS = REGISTRY.histogram("hem_model_store_load_seconds", "Time to read one fitted detector and its scores from the model store")
+
+def library_versions():   #everything a pickled detector depends on; a change makes every stored entry unloadable, so it is part of the key
+    return {
+        'format':   STORE_FORMAT,
+        'python':   platform.python_version(),
+        'numpy':    np.__version__,
+        'sklearn':  sklearn.__version__,
+        'joblib':   joblib.__version__,
+        'features': FEATURE_COLUMNS,
+    }
+
+def data_fingerprint(grouped):   #content hash of a grouped frame: column names, timestamps and every value, so any changed period gives a new key
+    h = hashlib.blake2b(digest_size=16)
+    for name in grouped.columns:
+        h.update(str(name).encode())
+        h.update(np.ascontiguousarray(grouped[name].to_numpy()).view(np.uint8))
+    return h.hexdigest()
+
+def _digest(blob):
+    return hashlib.blake2b(json.dumps(blob, sort_keys=True, default=str).encode(), digest_size=8).hexdigest()
+
+
+class ModelStore:   #fitted detectors with their precomputed labels and scores on local disk, keyed by data fingerprint, resolution, fit parameters and library versions
+
+    def __init__(self, directory, params=None, max_entries=16):
+        self.directory = directory
+        self.params = dict(params or {})   #hyperparameters the fit callable was built with
+        self.max_entries = max_entries     #least recently used entries beyond this are deleted
+        self._versions = _digest(library_versions())   #file name prefix, so entries from other library versions are found and removed by gc()
+
+    def key(self, resolution, grouped):
+        return f"{self._versions}-" + _digest({
+            'data':       data_fingerprint(grouped),
+            'resolution': resolution,
+            'params':     self.params,
+        })
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def load(self, key):   #the stored fit for this key, or None; a hit refreshes its mtime for the LRU
+        path = self._path(key)
+        start = time.perf_counter()
+        try:
+            fitted = joblib.load(path)
+        except FileNotFoundError:
+            LOADS.labels("miss").inc()
+            return None
+        except Exception as e:
+            #truncated or unreadable: drop it and refit
+            LOADS.labels("error").inc()
+            log.warning("Discarding unreadable model store entry %s: %s", path, e)
+            self._remove(path)
+            return None
+        LOAD_SECONDS.observe(time.perf_counter() - start)
+        LOADS.labels("hit").inc()
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return fitted
+
+    def save(self, key, fitted):   #written to a temp file first so an interrupted save never leaves a truncated entry; a read-only store or an unpicklable model is logged, not fatal
+        path = self._path(key)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            joblib.dump(fitted, tmp)
+            os.replace(tmp, path)
+        except Exception as e:
+            log.warning("Could not write model store entry %s: %s", path, e)
+            self._remove(tmp)
+            return
+        self.gc()
+
+    def gc(self):   #delete entries of other library versions, leftover temp files and the least recently used entries beyond max_entries; returns how many were removed
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        removed, current = 0, []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if name.endswith(SUFFIX) and name.startswith(self._versions + "-"):
+                try:
+                    current.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+            elif name.endswith(SUFFIX) or ((SUFFIX + ".tmp-") in name and _stale_tmp(path)):
+                removed += self._remove(path)
+        current.sort(reverse=True)
+        for _, path in current[self.max_entries:]:
+            removed += self._remove(path)
+        return removed
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+def _stale_tmp(path, age=3600):   #temp files of a save still in progress in another process are left alone
+    try:
+        return time.time() - os.path.getmtime(path) > age
+    except OSError:
+        return False
@@ -0,0 +1,158 @@
+import logging
+import os
+import queue
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+TELEGRAM_API = "https://api.telegram.org"
+
+SEND_SECONDS = REGISTRY.histogram("hem_telegram_send_seconds", "Latency of one Telegram HTTP request, failed ones included")
+MESSAGES = REGISTRY.counter("hem_telegram_messages_total", "Telegram alerts by outcome: queued, sent, failed, dropped or retries", ["outcome"])
+
+class SessionTransport:   #default transport: a pooled keep-alive requests.Session shared by every send
+    def __init__(self, pool_size=4):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def __call__(self, url, payload, timeout):   #returns the response; raises requests exceptions on network errors
+        return self.session.post(url, json=payload, timeout=timeout)
+
+
+class TokenBucket:   #simple rate limiter; Telegram allows about one message per second to the same chat
+    def __init__(self, rate=1.0, capacity=1.0, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+
+    def acquire(self):   #block until a token is available, then take it
+        while True:
+            now = self._clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            self._sleep((1 - self.tokens) / self.rate)
+
+
+class TelegramNotifier:   #bounded queue drained by one background worker, so alerts never block a request
+
+    def __init__(self, transport=None, api_base=TELEGRAM_API, max_queue=100, max_attempts=3,
+                 backoff=0.5, timeout=5, rate_limiter=None):
+        self.transport = transport or SessionTransport()
+        self.api_base = api_base.rstrip("/")
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or TokenBucket()
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "dropped": 0, "retries": 0}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def submit(self, msg):   #enqueue a message without blocking; returns False if it was dropped
+        bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+        chat_id   = os.getenv("TELEGRAM_CHAT_ID")
+        #only do if both token and chat ID are set
+        if not (bot_token and chat_id):
+            return False
+
+        url = f"{self.api_base}/bot{bot_token}/sendMessage"
+        payload = {
+            "chat_id":    chat_id,
+            "text":       msg,
+            "parse_mode": "Markdown"  #use Markdown for text formatting
+        }
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((url, payload))
+        except queue.Full:
+            self._count("dropped")
+            log.warning("Telegram queue full, dropping alert")
+            return False
+        self._count("queued")
+        return True
+
+    def wait_idle(self, timeout=None):   #block until every queued message was sent or given up on; True if the queue drained in time
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+        MESSAGES.labels(key).inc(n)
+
+    def queue_size(self):   #alerts waiting for the worker
+        return self._queue.qsize()
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            url, payload = self._queue.get()
+            try:
+                self._deliver(url, payload)
+            except Exception:
+                log.exception("Telegram worker error")
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, url, payload):   #send one message, retrying network errors, 429s and 5xx with exponential backoff
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._count("retries")
+            self.rate_limiter.acquire()
+            delay = self.backoff * (2 ** attempt)
+            start = time.perf_counter()
+            try:
+                resp = self.transport(url, payload, self.timeout)
+            except requests.RequestException as e:
+                SEND_SECONDS.observe(time.perf_counter() - start)
+                log.warning("Telegram send failed: %s", e)
+            else:
+                SEND_SECONDS.observe(time.perf_counter() - start)
+                status = getattr(resp, "status_code", 200)
+                if status < 400:
+                    self._count("sent")
+                    return True
+                if status == 429:
+                    delay = max(delay, _retry_after(resp))
+                elif status < 500:
+                    log.error("Telegram rejected alert with HTTP %s", status)
+                    break
+            if attempt + 1 < self.max_attempts:
+                time.sleep(delay)
+        self._count("failed")
+        return False
+
+
+def _retry_after(resp):   #seconds Telegram asked us to wait, from its JSON body or the Retry-After header
+    try:
+        return float(resp.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        pass
+    try:
+        return float(resp.headers.get("Retry-After", 0))
+    except (ValueError, TypeError, AttributeError):
+        return 0.0
@@ -0,0 +1,261 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+import numpy as np
+import pandas as pd
+from aggregates import RESOLUTIONS, SnapshotBuffer, WindowIndex
+from anomaly_detector import ScoredSeries
+from seasonal import SeasonalProfile
+
+log = logging.getLogger(__name__)
+
+MEAN_ABS_DEV_TO_STD = 1.2533   #sqrt(pi / 2): turns a mean absolute deviation into a normal standard deviation
+
+#everything served for one resolution at one data version: the grouped series, its prefix-sum window index, its seasonal profile and, once fitted, a ScoredSeries of read-only labels and scores with the model
+Snapshot = namedtuple('Snapshot', ['grouped', 'windows', 'fitted', 'seasonal'])
+
+class RollingZScore:   #exponentially weighted centre and mean absolute deviation, so every value is scored and learned in O(1) time and memory
+
+    def __init__(self, alpha=0.01, threshold=3.5, warmup=30, center=0.0, spread=0.0, count=0):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup      #values to see before anything is flagged
+        self.center = center
+        self.spread = spread
+        self.count = count
+
+    @classmethod
+    def seeded(cls, values, window=1000, **kwargs):   #start from the median and deviation of the last window values instead of cold
+        tail = np.asarray(values[-window:], dtype=np.float64)
+        tail = tail[~np.isnan(tail)]
+        if not len(tail):
+            return cls(**kwargs)
+        center = float(np.median(tail))
+        return cls(center=center, spread=float(np.mean(np.abs(tail - center))), count=len(tail), **kwargs)
+
+    def score(self, x, partial=False):   #1 at the centre, 0 at the threshold and negative beyond it, the same sign convention as decision_function
+        if self.count < self.warmup:
+            return 1.0
+        dev = x - self.center
+        if partial:
+            dev = max(dev, 0.0)   #a bucket still filling up can only grow, so it is only judged on the high side
+        z = abs(dev) / (MEAN_ABS_DEV_TO_STD * self.spread + 1e-9)
+        return 1.0 - z / self.threshold
+
+    def update(self, x):   #learn one value; outliers are clipped first so a spike barely moves the baseline
+        if self.count >= self.warmup:
+            limit = self.threshold * MEAN_ABS_DEV_TO_STD * self.spread
+            x = min(max(x, self.center - limit), self.center + limit)
+        self.center += self.alpha * (x - self.center)
+        self.spread += self.alpha * (abs(x - self.center) - self.spread)
+        self.count += 1
+
+
+def seasonal_score(x, typical, threshold, partial=False):   #x against the (mean, std) of earlier periods at its weekday and time of day, on RollingZScore's scale
+    mean, std = typical
+    dev = x - mean
+    if partial:
+        dev = max(dev, 0.0)
+    return 1.0 - abs(dev) / (std + 1e-9) / threshold
+
+
+class LiveScores:   #labels and scores for one resolution: those of the last full fit, extended by the online detector for the periods ingested since
+
+    def __init__(self, fitted, values, detector=None, typical=None):
+        n = len(fitted.labels)
+        self.model = fitted.model
+        self.detector = detector or RollingZScore.seeded(values[:n])
+        self._buffer = SnapshotBuffer([((), np.int64, 0), ((), np.float64, 0)], max(len(values), 1024))
+        labels, scores = self._buffer.write(0, n)
+        labels[:n], scores[:n] = fitted.labels, fitted.scores
+        self.n = n
+        self.closed = n    #periods before this were scored for good, either by the full fit or once a later period arrived
+        self.update(values, n, typical)   #catch up on readings ingested while the full fit was running
+
+    @property
+    def labels(self):
+        return self._buffer.arrays[0][:self.n]
+
+    @property
+    def scores(self):
+        return self._buffer.arrays[1][:self.n]
+
+    def freeze(self):   #read-only views of the current labels and scores, left untouched by later updates
+        labels, scores = self._buffer.publish()
+        return ScoredSeries(self.model, labels, scores)
+
+    def update(self, values, cut, typical=None):   #rescore every period from position cut on; the last period is still open, the others teach the detector once. typical(pos) is the seasonal (mean, std) before a period, or None
+        n = len(values)
+        cut = min(cut, n)
+        labels, scores = self._buffer.write(cut, n)
+        for pos in range(cut, n):
+            x = float(values[pos])
+            score = self.detector.score(x, partial=pos == n - 1)
+            if score < 0 and typical is not None:
+                #unusual for the recent level, but only an anomaly if also unusual for its weekday and time of day: a routine evening peak is not
+                expected = typical(pos)
+                if expected is not None:
+                    score = max(score, seasonal_score(x, expected, self.detector.threshold, partial=pos == n - 1))
+            if self.closed <= pos < n - 1:
+                self.detector.update(x)
+                self.closed = pos + 1
+            scores[pos] = score
+            labels[pos] = -1 if score < 0 else 1
+        self.n = n
+
+
+class LiveFrame:   #one resolution's grouped frame and prefix sums, grown from its pyramid level by the periods that changed instead of rebuilt per data version
+
+    def __init__(self, pyramid, resolution):
+        self.columns = list(pyramid.columns)
+        self._total = self.columns.index('total_power')
+        level = pyramid.levels[resolution]
+        specs = [((), np.int64, 0), ((len(self.columns),), np.float64, 0), ((), np.float64, 1)]
+        if not level.keys.flags.writeable:
+            #a shared, read-only level: serve it without a private copy until the first ingested reading
+            sums = np.concatenate(([0.0], np.cumsum(level.values[:, self._total])))
+            self._buffer = SnapshotBuffer(specs, arrays=[level.keys, level.values, sums], n=level.n)
+        else:
+            self._buffer = SnapshotBuffer(specs, max(level.n, 1024))
+            self.update(level, 0)
+
+    def update(self, level, cut):   #copy in the level's periods from position cut on
+        n = level.n
+        keys, values, sums = self._buffer.write(cut, n)
+        cut = min(cut, n)
+        keys[cut:n] = level.keys[cut:]
+        values[cut:n] = level.values[cut:]
+        sums[cut + 1:n + 1] = sums[cut] + np.cumsum(values[cut:n, self._total])
+
+    def freeze(self):   #(grouped frame, WindowIndex) over read-only views, as pyramid.frame() and window_index() would build them
+        keys, values, sums = self._buffer.publish()
+        cols = {'group': keys.view('datetime64[ns]')}
+        for i, name in enumerate(self.columns):
+            cols[name] = values[:, i]
+        return pd.DataFrame(cols, copy=False), WindowIndex.from_prefix(values[:, self._total], sums)
+
+
+class LiveScoring:   #serves every resolution's series with its labels and scores while readings are ingested, refitting the full detectors periodically in the background
+    #writers (ingest, refit, a finished fit) build new immutable snapshots under a lock and publish them with one reference swap; readers never lock
+
+    def __init__(self, pyramid, registry, refit_interval=3600, refits=None):
+        self.pyramid = pyramid
+        self.registry = registry
+        self.refits = registry if refits is None else refits   #registry of the periodic refits, when they fit with other parameters than the first fits
+        self.refit_interval = refit_interval
+        self.fit_version = pyramid.version   #data version the served full fits belong to
+        self._live = {}
+        self._frames = {res: LiveFrame(pyramid, res) for res in RESOLUTIONS}
+        self._seasonal = {res: SeasonalProfile.from_series(pyramid.levels[res].keys, pyramid.column(res), pyramid.levels[res].step) for res in RESOLUTIONS}
+        self._snapshots = {}
+        self._adopting = set()   #(resolution, version) first fits with an adopt callback attached, so warming requests attach it only once
+        self._adopting_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._refit_lock = threading.Lock()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        with self._lock:
+            self._publish(RESOLUTIONS)
+
+    def snapshot(self, resolution):   #the current Snapshot of a resolution, fitted or not; unknown resolutions fall back to minute
+        return self._snapshots.get(resolution) or self._snapshots['minute']
+
+    def series(self, resolution):   #Snapshot of (grouped, window index, fitted labels and scores, seasonal profile), whose lengths always match; None while the first fit is running
+        snapshot = self._snapshots.get(resolution)
+        if snapshot is None or snapshot.fitted is not None:
+            return snapshot
+        #still warming: the first request asks the registry, which adopts a cached fit right here or a running one once it finishes; later ones just wait for it
+        key = (resolution, self.fit_version)
+        with self._adopting_lock:
+            waiting = key in self._adopting
+            self._adopting.add(key)
+        if not waiting:
+            self.registry.submit(resolution, key[1], snapshot.grouped).add_done_callback(partial(self._adopt, *key))
+        return self._snapshots[resolution] if self._snapshots[resolution].fitted is not None else None
+
+    def ingest(self, when, values, latest=None):   #append readings (total_power, or a frame of pyramid columns) and score the periods they touched on every resolution with a fitted model; readings after latest (ns) are refused; returns (first changed position per resolution, mask of accepted readings)
+        when = pd.to_datetime(pd.Series(when)).reset_index(drop=True)
+        stamps = when.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        accepted = when.notna().to_numpy()
+        if latest is not None:
+            accepted = accepted & (stamps <= latest)   #a mis-dated reading would become the newest minute and lock out every correctly dated one after it
+        with self._lock:
+            #append-only: a reading before the newest minute would shift every later period under the labels already served
+            minute = self.pyramid.levels['minute']
+            if minute.n:
+                accepted = accepted & (stamps >= minute.keys[-1])
+            values = values.reset_index(drop=True)[accepted] if isinstance(values, pd.DataFrame) else np.asarray(values, dtype=np.float64)[accepted]
+
+            if not accepted.any():
+                return {}, accepted
+            changed = self.pyramid.extend(when[accepted], values)
+            for res, cut in changed.items():
+                self._frames[res].update(self.pyramid.levels[res], cut)
+                self._seasonal[res] = self._seasonal[res].extend(self.pyramid.levels[res].keys, self.pyramid.column(res))   #folds in only the periods closed since
+            for res, live in self._live.items():
+                if res in changed:
+                    live.update(self.pyramid.column(res), changed[res], self._typical(res))
+            self._publish(changed)
+        if changed:
+            self._ensure_worker()
+        return changed, accepted
+
+    def refit(self, timeout=None):   #full fit of every resolution on the current data, swapped in only once all of them are done; False if nothing changed
+        with self._refit_lock:
+            with self._lock:
+                version = self.pyramid.version
+                if version == self.fit_version:
+                    return False
+                frames = {res: self._snapshots[res].grouped for res in RESOLUTIONS}
+            fitted = {res: self.refits.submit(res, version, frames[res]).result(timeout) for res in RESOLUTIONS}
+            with self._lock:
+                self.fit_version = version
+                self._live = {res: LiveScores(fitted[res], self.pyramid.column(res), typical=self._typical(res)) for res in RESOLUTIONS}
+                self._publish(RESOLUTIONS)
+            return True
+
+    def after_fork(self):   #call in a forked worker, where the parent's refit thread and running fits do not exist
+        self._adopting = set()
+        self._adopting_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._refit_lock = threading.Lock()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _adopt(self, resolution, version, future):   #done callback of a first fit: start scoring live with it, unless a refit has moved on since
+        with self._adopting_lock:
+            self._adopting.discard((resolution, version))
+        if future.cancelled() or future.exception() is not None:
+            return   #logged by the registry; the next request for the resolution submits it again
+        with self._lock:
+            if version != self.fit_version or resolution in self._live:
+                return
+            self._live[resolution] = LiveScores(future.result(), self.pyramid.column(resolution), typical=self._typical(resolution))
+            self._publish([resolution])
+
+    def _typical(self, resolution):   #seasonal expectation by position for the online detector, from the periods before each one
+        keys, profile = self.pyramid.levels[resolution].keys, self._seasonal[resolution]
+        return lambda pos: profile.expected(keys[pos], pos)
+
+    def _publish(self, resolutions):   #call with the lock held: fresh snapshots of these resolutions, swapped in as one new dict so a reader sees either all of the old state or all of the new; O(periods changed), every array grows in place
+        snapshots = dict(self._snapshots)
+        for res in resolutions:
+            live = self._live.get(res)
+            snapshots[res] = Snapshot(*self._frames[res].freeze(), live.freeze() if live is not None else None, self._seasonal[res])
+        self._snapshots = snapshots
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="detector-refit", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.refit_interval)
+            try:
+                self.refit()
+            except Exception:
+                log.exception("Periodic detector refit failed")
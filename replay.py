@@ -0,0 +1,36 @@
+import time
+import numpy as np
+
+SPEEDS = {'1x': 1.0, '60x': 60.0, '3600x': 3600.0}   #named presets for REPLAY_SPEED; any positive number works too
+
+def parse_speed(value):   #"60x", "60" or 60 -> 60.0; 0 or empty turns replay off
+    if value in (None, ""):
+        return 0.0
+    value = str(value).strip().lower()
+    return SPEEDS.get(value) or float(value.rstrip('x'))
+
+
+class ReplayClock:   #maps wall time to a position in the recorded series: every client sees the same virtual "now", whatever the request count
+
+    def __init__(self, pyramid, speed=1.0, start=None, clock=time.monotonic):
+        self.pyramid = pyramid
+        self.speed = float(speed)   #virtual seconds per wall second
+        self.start = start          #virtual timestamp (ns) at t0, default the first recorded minute
+        self._clock = clock
+        self._t0 = clock()
+
+    def now(self):   #virtual timestamp in ns, wrapping back to the first minute after the last one; follows ingested readings as the series grows
+        keys = self.pyramid.levels['minute'].keys
+        if not len(keys):
+            return None
+        first, span = int(keys[0]), int(keys[-1] - keys[0]) + self.pyramid.levels['minute'].step
+        start = first if self.start is None else self.start
+        elapsed = int((self._clock() - self._t0) * self.speed * 1e9)
+        return first + (start - first + elapsed) % span
+
+    def position(self, keys):   #index of the period of keys (sorted int64 ns or datetime64) that contains the virtual now
+        now = self.now()
+        if now is None or not len(keys):
+            return 0
+        keys = np.asarray(keys).view(np.int64)
+        return max(int(np.searchsorted(keys, now, side='right')) - 1, 0)
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+from aggregates import SnapshotBuffer
+
+MINUTE = pd.Timedelta("1min").value
+DAY = pd.Timedelta("1D").value
+WEEK = 7 * DAY
+ONE_WEEK = pd.Timedelta(WEEK)
+MONDAY = pd.Timestamp("1970-01-05").value   #first Monday after the epoch, so bucket 0 is Monday 00:00
+BUCKET = pd.Timedelta("15min").value        #finest time-of-day bucket: a minute is compared with its quarter hour, coarser resolutions with their own period
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MIN_SAMPLES = 2                             #periods a bucket needs before it has a typical value
+
+def _ns(keys):   #sorted period keys as int64 nanoseconds, from int64 ns or datetime64 of any unit
+    keys = np.asarray(keys)
+    return keys.astype('datetime64[ns]', copy=False).view(np.int64) if keys.dtype.kind == 'M' else keys.view(np.int64)
+
+
+class SeasonalProfile:   #expected usage and spread per (weekday, time-of-day bucket) of one grouped series, as running count, sum and sum of squares, plus for every folded period those of its bucket over the periods before it; extend() returns a new profile, older ones stay valid
+    #priors make a lookup for position pos see only earlier periods: in replay the served cursor is far behind the data, and a point must never be compared with itself or with later weeks
+
+    def __init__(self, step, count, total, squares, n=0, buffer=None):
+        self.step = step              #period length in ns of the series it describes
+        self.bucket = max(step, BUCKET)
+        self.count = count
+        self.total = total
+        self.squares = squares
+        self.n = n                    #periods folded in; the last, still open period never is
+        for array in (count, total, squares):
+            array.flags.writeable = False
+        self._buffer = buffer or SnapshotBuffer([((), np.float64, 0)] * 3)   #priors of every folded period, shared along a chain of extend() calls
+        self.prior = self._buffer.publish()   #(count, total, squares) of each folded period's bucket before it, read-only, length n
+
+    @classmethod
+    def from_series(cls, keys, values, step):   #profile of every closed period of a series, in one vectorized pass
+        bucket = max(step, BUCKET)
+        size = WEEK // bucket
+        empty = cls(step, np.zeros(size), np.zeros(size), np.zeros(size), buffer=SnapshotBuffer([((), np.float64, 0)] * 3, max(len(keys), 1024)))
+        return empty.extend(keys, values)
+
+    def extend(self, keys, values):   #fold in the periods closed since this profile was built (sorted keys, see _ns); self when there are none. Only ever extend the latest profile of a chain
+        keys = _ns(keys)
+        end = len(keys) - 1   #the last period can still grow
+        if end <= self.n:
+            return self
+        buckets = self._buckets(keys[self.n:end])
+        values = np.asarray(values[self.n:end], dtype=np.float64)
+        valid = ~np.isnan(values)
+        values = np.where(valid, values, 0.0)   #a missing period takes a position but adds nothing
+        size = len(self.count)
+
+        #each new period's prior: its bucket's running totals so far plus the earlier new periods in the same bucket, by a cumulative sum per bucket
+        order = np.argsort(buckets, kind='stable')
+        sorted_buckets = buckets[order]
+        first = np.concatenate(([0], np.flatnonzero(sorted_buckets[1:] != sorted_buckets[:-1]) + 1))
+        lengths = np.diff(np.append(first, len(order)))
+        count, total, squares = self._buffer.write(self.n, end)
+        sums = []
+        for running, weights, prior in ((self.count, valid.astype(np.float64), count), (self.total, values, total), (self.squares, values * values, squares)):
+            ordered = weights[order]
+            before = np.cumsum(ordered) - ordered
+            prior[self.n + order] = running[sorted_buckets] + before - np.repeat(before[first], lengths)
+            sums.append(running + np.bincount(buckets, weights=weights, minlength=size))
+        return SeasonalProfile(self.step, *sums, end, self._buffer)
+
+    def _buckets(self, keys):
+        return (keys - MONDAY) // self.bucket % len(self.count)
+
+    def _bucket(self, when):   #bucket of one timestamp, in plain integer arithmetic
+        return (pd.Timestamp(when).value - MONDAY) // self.bucket % len(self.count)
+
+    def expected(self, when, pos=None):   #(mean, standard deviation) of the periods at this weekday and time of day, or None before MIN_SAMPLES of them; with pos, the position of when in the series, only the periods before it count. O(1)
+        if pos is not None and pos < self.n:
+            count, total, squares = (float(prior[pos]) for prior in self.prior)
+        else:
+            b = self._bucket(when)   #every folded period comes before an unfolded one
+            count, total, squares = float(self.count[b]), float(self.total[b]), float(self.squares[b])
+        if count < MIN_SAMPLES:
+            return None
+        mean = total / count
+        return mean, float(np.sqrt(max(squares / count - mean * mean, 0.0)))
+
+    def label(self, when):   #"Tuesday 18:00", or just "Tuesday" for a daily profile
+        day, rest = divmod(self._bucket(when), len(self.count) // 7)
+        if self.bucket >= DAY:
+            return DAYS[day]
+        hours, minutes = divmod(rest * self.bucket // MINUTE, 60)
+        return f"{DAYS[day]} {hours:02d}:{minutes:02d}"
+
+
+def last_week(grouped, idx, step):   #total_power of the period exactly a week before position idx of a grouped frame, or None; O(1) when the series has no gaps, a binary search otherwise
+    return _last_week(grouped['group'], grouped['total_power'], idx, step)
+
+def _last_week(keys, power, idx, step):   #last_week on the columns, each looked up once by the caller
+    target = keys.iat[idx] - ONE_WEEK
+    back = idx - WEEK // step
+    if not 0 <= back < len(keys) or keys.iat[back] != target:
+        back = int(keys.searchsorted(target))
+        if back >= len(keys) or keys.iat[back] != target:
+            return None
+    return float(power.iat[back])
+
+def pct(value, reference):   #percentage change of value against reference, 0.0 when there is nothing to compare with
+    return round((value - reference) / reference * 100.0, 1) if reference else 0.0
+
+#seasonal insight fields before anything has been served, or without history to compare with
+NO_INSIGHTS = {
+    "lastWeekPower":     None,
+    "lastWeekPctChange": 0.0,
+    "typicalLabel":      None,
+    "typicalPower":      None,
+    "typicalPctChange":  0.0,
+    "seasonalZ":         0.0,   #standard deviations from the typical value
+}
+
+def seasonal_insights(profile, grouped, idx):   #the period at position idx of a grouped frame against the same time last week and a typical period at this weekday and time of day, both from before it
+    keys, power = grouped['group'], grouped['total_power']   #a frame column lookup costs more than the rest of the insight
+    value = float(power.iat[idx])
+    week = _last_week(keys, power, idx, profile.step)
+    when = keys.iat[idx]
+    typical = profile.expected(when, idx)
+    insight = dict(NO_INSIGHTS, typicalLabel=profile.label(when))
+    if week is not None:
+        insight.update(lastWeekPower=round(week, 3), lastWeekPctChange=pct(value, week))
+    if typical is not None:
+        mean, std = typical
+        insight.update(
+            typicalPower=round(mean, 3),
+            typicalPctChange=pct(value, mean),
+            seasonalZ=round((value - mean) / std, 2) if std > 0 else 0.0,
+        )
+    return insight
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+
+class ClientSession:   #one client's cursor into the shared grouped series: its resolution and the next position to serve
+    __slots__ = ("session_id", "resolution", "index", "last_ts", "last_seen", "lock")
+
+    def __init__(self, session_id, resolution, now):
+        self.session_id = session_id
+        self.resolution = resolution
+        self.index = 0
+        self.last_ts = None      #timestamp of the last served point, used to keep the position across resolution switches
+        self.last_seen = now
+        self.lock = threading.Lock()   #guards only the cursor steps below, never any work on the series
+
+    def step(self, length):   #claim the position to serve from a series of this length, wrapping to the start, and move the cursor past it
+        with self.lock:
+            idx = self.index if self.index < length else 0
+            self.index = idx + 1
+            return idx
+
+    def step_back(self):   #move the cursor back one position, so the next step serves the previous point again
+        with self.lock:
+            if self.index > 0:
+                self.index -= 1
+
+    def seek(self, resolution, index):   #switch resolution and position together
+        with self.lock:
+            self.resolution = resolution
+            self.index = index
+
+
+class SessionStore:   #client sessions kept in last-seen order, so idle ones expire from the front in O(1) amortised time
+
+    def __init__(self, ttl=1800, max_sessions=10000, default_resolution="minute", clock=time.monotonic):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.default_resolution = default_resolution
+        self._clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):   #return the session for this id, creating it if new or expired
+        now = self._clock()
+        with self._lock:
+            self._expire_locked(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ClientSession(session_id, self.default_resolution, now)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)   #over the cap, drop the least recently seen
+            else:
+                session.last_seen = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def touch(self, session):   #mark a session held by an open stream as seen, putting it back if expiry or the cap dropped it meanwhile
+        now = self._clock()
+        with self._lock:
+            session.last_seen = now
+            self._sessions[session.session_id] = session   #the stream's cursor wins over any fresh session created under the same id
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def expire(self):   #drop every session idle for longer than ttl; returns how many were removed
+        with self._lock:
+            return self._expire_locked(self._clock())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _expire_locked(self, now):
+        removed = 0
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_seen <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            removed += 1
+        return removed
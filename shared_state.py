@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+import numpy as np
+import data_cache
+from aggregates import AggregatePyramid, RESOLUTIONS
+
+META_FILE = "meta.json"
+
+def export_pyramid(pyramid, entry_dir, key):   #write every pyramid level as .npy files; the directory appears atomically, so concurrent workers never read a partial export
+    tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for res in RESOLUTIONS:
+        level = pyramid.levels[res]
+        np.save(os.path.join(tmp_dir, f"{res}_keys.npy"), level.keys, allow_pickle=False)
+        np.save(os.path.join(tmp_dir, f"{res}_values.npy"), level.values, allow_pickle=False)
+    with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+        json.dump({"key": key, "columns": pyramid.columns}, f)
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        #another process exported the same data first; keep theirs
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def attach_pyramid(entry_dir, key):   #memory-map an exported pyramid read-only, so every process attached to it shares one copy in the page cache
+    try:
+        with open(os.path.join(entry_dir, META_FILE)) as f:
+            meta = json.load(f)
+        if meta.get("key") != key:
+            return None
+        levels = {
+            res: (
+                np.load(os.path.join(entry_dir, f"{res}_keys.npy"), mmap_mode="r"),
+                np.load(os.path.join(entry_dir, f"{res}_values.npy"), mmap_mode="r"),
+            )
+            for res in RESOLUTIONS
+        }
+    except (OSError, ValueError):
+        return None
+    return AggregatePyramid.from_levels(levels, meta["columns"])
+
+def shared_pyramid(source_path, shared_dir, build):   #attach the exported pyramid for this exact source file, building and exporting it first if needed
+    key = data_cache.source_fingerprint(source_path)
+    entry_dir = os.path.join(shared_dir, key["digest"])
+
+    pyramid = attach_pyramid(entry_dir, key)
+    if pyramid is not None:
+        return pyramid
+
+    os.makedirs(shared_dir, exist_ok=True)
+    export_pyramid(build(), entry_dir, key)
+    _remove_stale_exports(shared_dir, key["digest"])
+    return attach_pyramid(entry_dir, key)
+
+def _remove_stale_exports(shared_dir, keep):   #exports of older source versions; processes still mapping them keep their pages until they exit
+    for name in os.listdir(shared_dir):
+        if name != keep and "." not in name:
+            shutil.rmtree(os.path.join(shared_dir, name), ignore_errors=True)
@@ -36,6 +36,15 @@ let pausedOnAnomaly    = false;
 let anomalyInterval;
 let insight1Data = [];
 
+//per-tab id so every open dashboard keeps its own cursor and resolution on the server
+const clientId = (window.crypto && crypto.randomUUID)
+  ? crypto.randomUUID()
+  : Math.random().toString(36).slice(2) + Date.now().toString(36);
+
+//live update transport: Server-Sent Events when available, polling otherwise
+let eventSource  = null;
+let streamFailed = !("EventSource" in window);
+
 //helper to retrieve the current resolution object
 const getCurrentResolution = () => resolutions[currentResolutionIndex];
 
@@ -48,9 +57,7 @@ function setupResolutionToggle() {  //sets up the resolution toggle button to cy
     resetChartData();
 
     //immediately fetch and plot the current point at the exact "now" timestamp
-    clearInterval(anomalyInterval);
-    checkAnomaly();
-    anomalyInterval = setInterval(checkAnomaly, 1000);
+    startUpdates();
   });
 }
 
@@ -80,63 +87,66 @@ function updateSessionInsight() {   //updates the session based insight (Insight
 async function updateInsights() {    //fetches server driven insight (Insight 2) and updates the UI accordingly
   try {
     const { key: resolution } = getCurrentResolution();
-    const resp = await fetch(`/insights?resolution=${resolution}`, { cache: "no-cache" });
-    const { sevenPctChange, deltaKw } = await resp.json();
-
-    //Insight 2 - last window kW delta
-    const kw   = Math.abs(deltaKw).toFixed(3);
-    const dir2 = deltaKw >= 0 ? "higher" : "lower";
-    document.getElementById("insight-2").innerText =
-      `Your current window's total energy usage is ${kw} kW ${dir2} than the previous window.`;
-
-    //dynamic footer message based on performance
-    const footerEl = document.querySelector(".insights .success");
-    if (sevenPctChange < 0 && deltaKw < 0) {
-      footerEl.innerText = "Well done!";
-      footerEl.style.color = "var(--success-color)";
-    } else {
-      footerEl.innerText = "You are not improving your electricity usage!";
-      footerEl.style.color = "#FFA000";
-    }
-
+    const resp = await fetch(`/insights?resolution=${resolution}&client=${clientId}`, { cache: "no-cache" });
+    applyInsights(await resp.json());
   } catch (err) {
     console.error("Error updating insights:", err);
   }
 }
 
+function applyInsights({ sevenPctChange, deltaKw }) {   //renders Insight 2 and the footer from server insights, fetched or streamed
+  //Insight 2 - last window kW delta
+  const kw   = Math.abs(deltaKw).toFixed(3);
+  const dir2 = deltaKw >= 0 ? "higher" : "lower";
+  document.getElementById("insight-2").innerText =
+    `Your current window's total energy usage is ${kw} kW ${dir2} than the previous window.`;
+
+  //dynamic footer message based on performance
+  const footerEl = document.querySelector(".insights .success");
+  if (sevenPctChange < 0 && deltaKw < 0) {
+    footerEl.innerText = "Well done!";
+    footerEl.style.color = "var(--success-color)";
+  } else {
+    footerEl.innerText = "You are not improving your electricity usage!";
+    footerEl.style.color = "#FFA000";
+  }
+}
+
 
 // ---- Tips Updater ----
 
+function showPlaceholderTips(tipsEls) {   //if insufficient data, show default gathering data tips
+  if (insight1Data.length >= 14) return false;
+  tipsEls[0].innerText =
+    "Gathering data on your usage - more detailed insights will appear once we have more readings.";
+  tipsEls[1].innerText =
+    "Your usage is steady. Unused devices can still draw phantom power. Try unplugging what you're not using.";
+  return true;
+}
+
+function applyTips(tips) {   //populates the tips section with streamed tips, keeping the placeholders until enough data
+  const tipsEls = document.querySelectorAll(".tips p.tip");
+  if (tipsEls.length < 2 || showPlaceholderTips(tipsEls)) return;
+  tipsEls[0].innerText = tips[0] || "";
+  tipsEls[1].innerText = tips[1] || "";
+}
+
 async function updateTips() {    //updates the personalised tips section and shows placeholders until enough data, then fetches server tips
   const tipsEls = document.querySelectorAll(".tips p.tip");
   if (tipsEls.length < 2) return; //guard
+  if (showPlaceholderTips(tipsEls)) return;
 
-  //if insufficient data, show default gathering data tips
-  if (insight1Data.length < 14) {
-    tipsEls[0].innerText =
-      "Gathering data on your usage - more detailed insights will appear once we have more readings.";
-    tipsEls[1].innerText =
-      "Your usage is steady. Unused devices can still draw phantom power. Try unplugging what you're not using.";
-    return;
-  }
-
-  //otherwise fetch server generated tips
+  //otherwise fetch server generated tips, reading the insights once
   try {
     const { key: resolution } = getCurrentResolution();
-    const resp = await fetch(
-      `/tips?sevenPctChange=${encodeURIComponent(
-        (await fetch(`/insights?resolution=${resolution}`, { cache: "no-cache" })
-          .then(r => r.json())
-          .then(j => j.sevenPctChange)
-        )
-      )}&deltaKw=${encodeURIComponent(
-        (await fetch(`/insights?resolution=${resolution}`, { cache: "no-cache" })
-          .then(r => r.json())
-          .then(j => j.deltaKw)
-        )
-      )}`,
-      { cache: "no-cache" }
-    );
+    const insight = await fetch(`/insights?resolution=${resolution}&client=${clientId}`, { cache: "no-cache" })
+      .then(r => r.json());
+    //the window change plus, once there is history, the seasonal comparisons
+    const params = new URLSearchParams();
+    for (const key of ["sevenPctChange", "deltaKw", "typicalPctChange", "lastWeekPctChange", "typicalLabel"]) {
+      if (insight[key] != null) params.set(key, insight[key]);
+    }
+    const resp = await fetch(`/tips?${params}`, { cache: "no-cache" });
     const { tips } = await resp.json();
 
     //populate the two <p.tip> elements with fetched tips
@@ -171,16 +181,30 @@ function showAnomalyPopup(message) {
 
 // ----- Anomaly Polling and UI Updates -----
 
-async function checkAnomaly() {    //periodically polls for anomaly status, updates the chart and UI, and handles anomaly pauses
+async function checkAnomaly() {    //polling fallback: fetches the anomaly status once and hands it to handleStatus
   if (pausedOnAnomaly) return;
 
   try {
     const { key } = getCurrentResolution();
     const resp = await fetch(
-      `http://localhost:5000/current_status?resolution=${key}`,
+      `http://localhost:5000/current_status?resolution=${key}&client=${clientId}`,
       { cache: "no-cache" }
     );
-    const data = await resp.json();
+    handleStatus(await resp.json());
+  } catch (err) {
+    console.error("Error fetching anomaly status:", err);
+  }
+}
+
+function handleStatus(data) {    //updates the chart and UI for one data point, polled or streamed, and handles anomaly pauses
+  if (pausedOnAnomaly) return;
+
+  try {
+    //the server is still fitting the detector for this resolution, keep polling until it is ready
+    if (data.warming) {
+      document.getElementById("anomaly-status").innerText = data.status;
+      return;
+    }
 
     //normalise and extract date/time/power
     const fixedDate = data.date.replace(/\/\d{4}$/, '/2025');
@@ -219,9 +243,14 @@ async function checkAnomaly() {    //periodically polls for anomaly status, upda
     }
     chart.update();
 
-    //update insights based on new data
-    updateInsights();
-    updateTips();
+    //update insights based on new data; streamed points carry them, polled points fetch them
+    if (data.insights) {
+      applyInsights(data.insights);
+      applyTips(data.tips);
+    } else {
+      updateInsights();
+      updateTips();
+    }
     updateSessionInsight();
 
     //on first anomaly detection, pause updates and store data for detail view
@@ -230,7 +259,7 @@ async function checkAnomaly() {    //periodically polls for anomaly status, upda
       pendingAnomalyData = { date: fixedDate, time, power };
       anomalyHandled     = true;
       pausedOnAnomaly    = true;
-      clearInterval(anomalyInterval);
+      stopUpdates();
       clearInterval(temperatureInterval);
       document.getElementById("anomaly-details").style.display = "none";
       return;
@@ -243,8 +272,60 @@ async function checkAnomaly() {    //periodically polls for anomaly status, upda
     }
 
   } catch (err) {
-    console.error("Error fetching anomaly status:", err);
+    console.error("Error handling anomaly status:", err);
+  }
+}
+
+
+// ----- Live Updates: Server-Sent Events with Polling Fallback -----
+
+function startUpdates() {   //opens one /stream connection, or polls /current_status every second if streaming is unavailable
+  stopUpdates();
+  if (!streamFailed) {
+    openStream();
+    return;
   }
+  checkAnomaly();
+  anomalyInterval = setInterval(checkAnomaly, 1000);
+}
+
+function stopUpdates() {   //stops whichever update transport is running
+  clearInterval(anomalyInterval);
+  if (eventSource) {
+    eventSource.close();
+    eventSource = null;
+  }
+}
+
+function openStream() {   //subscribes to status and resolution events for the selected resolution
+  const { key } = getCurrentResolution();
+  const source = new EventSource(`/stream?resolution=${key}&client=${clientId}`);
+  let received = false;
+  eventSource = source;
+
+  source.addEventListener("status", (e) => {
+    received = true;
+    handleStatus(JSON.parse(e.data));
+  });
+
+  //follow resolution changes reported by the server
+  source.addEventListener("resolution", (e) => {
+    const idx = resolutions.findIndex(r => r.key === JSON.parse(e.data).resolution);
+    if (idx !== -1 && idx !== currentResolutionIndex) {
+      currentResolutionIndex = idx;
+      updateResolutionButton();
+      resetChartData();
+    }
+  });
+
+  //the browser reconnects by itself; fall back to polling if the stream never worked or was closed for good
+  source.onerror = () => {
+    if (eventSource !== source) return;
+    if (!received || source.readyState === EventSource.CLOSED) {
+      streamFailed = true;
+      startUpdates();
+    }
+  };
 }
 
 function resetChartData() {    //resets the chart data and insights when resolution changes
@@ -370,14 +451,13 @@ document.addEventListener("DOMContentLoaded", () => {
       pausedOnAnomaly           = false;
       anomalyHandled            = false;
       animateTemperature();
-      anomalyInterval = setInterval(checkAnomaly, 1000);
+      startUpdates();
     }, 5000);
   });
 
-  //start temperature animation and anomaly polling
+  //start temperature animation and live anomaly updates
   animateTemperature();
-  checkAnomaly();
-  anomalyInterval = setInterval(checkAnomaly, 1000);
+  startUpdates();
   document.getElementById("anomaly-details").style.display = "none";
 
   //initial insights and tips
@@ -2,6 +2,12 @@ import pytest
 import pandas as pd
 import app as app_module
 import anomaly_detector as det
+from aggregates import AggregatePyramid
+from anomaly_store import AnomalyStore
+from episodes import AlertGate
+from model_registry import ModelRegistry
+from online_detector import LiveScoring
+from sessions import SessionStore
 from app import create_app
 
 #setting up the Flask app and sample data for testing
@@ -23,7 +29,7 @@ def sample_raw_df():
     })
 
 @pytest.fixture(autouse=True)
-def patch_detector_and_app(monkeypatch, sample_raw_df):   #Monkeypatch the anomaly_detector module to use dummy functions instead of relying on real data
+def patch_detector_and_app(monkeypatch, sample_raw_df, tmp_path_factory):   #Monkeypatch the anomaly_detector module to use dummy functions instead of relying on real data
 
     #dummy load_and_preprocess, returning the sample DataFrame
     monkeypatch.setattr(
@@ -47,15 +53,25 @@ def patch_detector_and_app(monkeypatch, sample_raw_df):   #Monkeypatch the anoma
         def predict(self, df):
             return [-1 if x > 2.0 else 1 for x in df['total_power']]
 
+        def decision_function(self, df):   #negative above the 2.0 threshold, matching predict
+            return [2.0 - x for x in df['total_power']]
+
     monkeypatch.setattr(
         det,
         'fit_detector',
-        lambda df: DummyModel()
+        lambda df, **params: DummyModel()
     )
 
     #override the app's global variables so endpoints use the dummy data/model
-    app_module.data = sample_raw_df.copy()
-    app_module.current_resolution = 'minute'
-    app_module.grouped_data = det.group_power(app_module.data, 'minute')
-    app_module.model = det.fit_detector(app_module.grouped_data)
-    app_module.current_index = 0
+    app_module.pyramid = AggregatePyramid.from_frame(sample_raw_df)
+    grouped = det.group_power(sample_raw_df, 'minute')
+    app_module.model_registry = ModelRegistry(lambda df: det.ScoredSeries(DummyModel(), *det.score_series(DummyModel(), df)))
+    app_module.model_registry.put(
+        'minute',
+        app_module.pyramid.version,
+        det.ScoredSeries(DummyModel(), *det.score_series(DummyModel(), grouped))
+    )
+    app_module.scoring = LiveScoring(app_module.pyramid, app_module.model_registry)
+    app_module.sessions = SessionStore()   #fresh client cursors for every test
+    app_module.alert_gate = AlertGate(cooldown=0)   #no episode has alerted yet
+    app_module.anomaly_store = AnomalyStore(str(tmp_path_factory.mktemp("anomalies") / "anomalies.sqlite3"))   #and an empty anomaly store
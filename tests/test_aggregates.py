@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from aggregates import AggregatePyramid, RESOLUTIONS, WindowIndex, window_periods
+from anomaly_detector import group_power
+
+def make_raw(n=3000, start="2025-01-01 23:00:00"):   #raw readings every 30 seconds spanning several days, with a missing value
+    rng = np.random.default_rng(0)
+    power = rng.gamma(2.0, 0.5, n)
+    power[10] = np.nan
+    return pd.DataFrame({
+        'datetime':    pd.date_range(start, periods=n, freq='30s'),
+        'total_power': power,
+    })
+
+@pytest.mark.parametrize("resolution", RESOLUTIONS)
+def test_pyramid_matches_group_power(resolution):   #every level of the pyramid equals a fresh group_power at that resolution
+    raw = make_raw()
+    expected = group_power(raw, resolution)
+    got = AggregatePyramid.from_frame(raw).frame(resolution)
+
+    assert list(got['group']) == list(expected['group'])
+    assert np.allclose(got['total_power'], expected['total_power'])
+
+def test_pyramid_extend_matches_full_build():   #appending rows in batches, including one that lands inside an open bucket, gives the same levels as one build
+    raw = make_raw()
+    full = AggregatePyramid.from_frame(raw)
+
+    incremental = AggregatePyramid.from_frame(raw.iloc[:1001])
+    version = incremental.version
+    for lo, hi in [(1001, 1500), (1500, 1501), (1501, 3000)]:
+        incremental.extend(raw['datetime'].iloc[lo:hi], raw['total_power'].iloc[lo:hi])
+
+    assert incremental.version > version
+    for res in RESOLUTIONS:
+        assert list(incremental.frame(res)['group']) == list(full.frame(res)['group'])
+        assert np.allclose(incremental.frame(res)['total_power'], full.frame(res)['total_power'])
+
+def test_from_frame_in_chunks_matches_one_chunk():   #folding the raw rows in small chunks, with minutes straddling chunk edges, gives the same levels
+    raw = make_raw()
+    whole = AggregatePyramid.from_frame(raw)
+    chunked = AggregatePyramid.from_frame(raw, chunk_rows=7)
+
+    for res in RESOLUTIONS:
+        assert list(chunked.frame(res)['group']) == list(whole.frame(res)['group'])
+        assert np.allclose(chunked.frame(res)['total_power'], whole.frame(res)['total_power'])
+
+def test_window_index_matches_direct_sums():   #prefix-sum windows equal slicing and summing the series
+    power = np.arange(1.0, 31.0)
+    windows = WindowIndex(power)
+
+    assert windows.window_sum(20, 7) == pytest.approx(power[13:20].sum())
+    last, prev = power[13:20].sum(), power[6:13].sum()
+    assert windows.pct_change(20, 7) == round((last - prev) / prev * 100, 1)
+    assert windows.pct_change(13, 7) == 0.0   #not two full windows yet
+    assert windows.delta(20) == pytest.approx(power[19] - power[18])
+
+@pytest.mark.parametrize("window,resolution,expected", [
+    ("7", "minute", 7),
+    ("24h", "minute", 1440),
+    ("24h", "hour", 24),
+    ("7D", "30min", 336),
+    ("24h", "day", 1),
+    ("30min", "day", 1),   #never shorter than one period
+])
+def test_window_periods(window, resolution, expected):
+    assert window_periods(window, resolution) == expected
@@ -1,7 +1,15 @@
+import json
+import numpy as np
 import pandas as pd
 import pytest
 from datetime import datetime, timedelta
-from anomaly_detector import group_power, fit_detector
+from anomaly_detector import (
+    group_power, fit_detector, load_and_preprocess, iter_text_chunks,
+    score_series, find_all_anomalies, find_first_anomaly, run_anomaly_detection, readings_frame,
+    COMPACT_COLS
+)
+from aggregates import AggregatePyramid
+from memstat import frame_memory
 
 def make_df():  #helper function to generate the DataFrame with hourly timestamps and power usage
     base = datetime(2025, 1, 1, 0, 0)
@@ -38,3 +46,170 @@ def test_fit_detector_flags_anomalies():  #test that fit_detector returns a mode
     #0.6 → normal (1), 2.6 → anomaly (-1)
     assert preds[0] == 1
     assert preds[1] == -1
+
+def write_uci_text(path):   #helper writing a tiny semicolon-delimited UCI export, including a '?' missing value
+    path.write_text(
+        "Date;Time;Global_active_power;Global_reactive_power;Voltage;Global_intensity;Sub_metering_1;Sub_metering_2;Sub_metering_3\n"
+        "1/1/2025;00:00:00;1.0;0.1;240.0;4.0;0.0;0.0;1.0\n"
+        "1/1/2025;00:00:30;2.0;0.1;240.0;8.0;0.0;0.0;1.0\n"
+        "1/1/2025;00:01:00;?;0.1;240.0;4.0;0.0;0.0;1.0\n"
+        "1/1/2025;00:01:30;1.0;0.1;240.0;4.0;0.0;0.0;1.0\n"
+        "1/1/2025;00:02:00;3.0;0.1;240.0;12.0;0.0;0.0;1.0\n"
+    )
+
+def test_iter_text_chunks_parses_uci_format(tmp_path):   #chunks are bounded in size, timestamps use the day-first format and '?' becomes NaN
+    src = tmp_path / "power.txt"
+    write_uci_text(src)
+    chunks = list(iter_text_chunks(str(src), chunksize=2))
+
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    assert chunks[0]['datetime'].iloc[1] == pd.Timestamp("2025-01-01 00:00:30")
+    assert pd.isna(chunks[1]['total_power'].iloc[0])
+
+def test_malformed_timestamps_are_dropped_not_guessed(tmp_path):   #one row off the day-first format neither fails the chunk nor flips the others to month-first
+    src = tmp_path / "power.txt"
+    src.write_text(
+        "Date;Time;Global_active_power;Global_reactive_power;Voltage;Global_intensity;Sub_metering_1;Sub_metering_2;Sub_metering_3\n"
+        "4/1/2025;00:00:00;1.0;0.1;240.0;4.0;0.0;0.0;1.0\n"
+        "2025-01-04;00:01:00;2.0;0.1;240.0;8.0;0.0;0.0;1.0\n"
+        "4/1/2025;00:02:00;3.0;0.1;240.0;12.0;0.0;0.0;1.0\n"
+    )
+    chunk, = iter_text_chunks(str(src))
+
+    assert list(chunk['datetime']) == [pd.Timestamp("2025-01-04 00:00"), pd.Timestamp("2025-01-04 00:02")]
+    assert pd.isna(readings_frame([{"Date": "2007-01-04", "Time": "00:00:00", "total_power": 1.0}])['datetime'].iloc[0])
+
+def test_pyramid_from_chunks_matches_the_whole_file(tmp_path):   #folding chunks into the pyramid one at a time equals grouping the whole file at once, even when a minute straddles two chunks
+    src = tmp_path / "power.txt"
+    write_uci_text(src)
+    whole = AggregatePyramid.from_frame(load_and_preprocess(str(src), use_cache=False)).frame('minute')
+    streamed = AggregatePyramid.from_chunks(iter_text_chunks(str(src), chunksize=3)).frame('minute')
+
+    assert list(streamed['group']) == list(whole['group'])
+    assert np.allclose(streamed.iloc[:, 1:].to_numpy(), whole.iloc[:, 1:].to_numpy(), equal_nan=True)
+
+def test_compact_load_keeps_only_what_grouping_needs(tmp_path):   #compact frames hold float32 measurements and an int64-backed datetime, and sum to the same pyramid
+    src = tmp_path / "power.txt"
+    write_uci_text(src)
+    full = load_and_preprocess(str(src), use_cache=False)
+    compact = load_and_preprocess(str(src), use_cache=False, compact=True)
+
+    assert list(compact.columns) == ['datetime', 'total_power'] + COMPACT_COLS
+    assert compact['datetime'].dtype == 'datetime64[ns]'
+    assert all(compact[c].dtype == np.float32 for c in compact.columns[1:])
+    assert list(compact['datetime']) == list(full['datetime'])
+    assert np.allclose(compact['total_power'], full['total_power'], equal_nan=True)
+    assert frame_memory(compact)['total'] < frame_memory(full)['total'] / 2
+
+    full_frame = AggregatePyramid.from_frame(full).frame('minute')
+    compact_frame = AggregatePyramid.from_frame(compact).frame('minute')
+    assert list(compact_frame.columns) == list(full_frame.columns)
+    assert np.allclose(compact_frame.iloc[:, 1:].to_numpy(), full_frame.iloc[:, 1:].to_numpy())
+
+def test_app_load_streams_text_chunks_into_the_pyramid(tmp_path, monkeypatch):   #the app's load path folds a text export in chunk by chunk without ever joining the raw rows, caching them for the next start as it goes
+    import anomaly_detector as det
+    import app as app_module
+    src = tmp_path / "power.txt"
+    write_uci_text(src)
+    expected = AggregatePyramid.from_frame(load_and_preprocess(str(src), use_cache=False, compact=True)).frame('minute')
+
+    monkeypatch.setattr(det, 'TEXT_CHUNK_ROWS', 2)
+    monkeypatch.setattr(app_module, 'COMPACT_DATA', True)
+    monkeypatch.setattr(pd, 'concat', lambda *args, **kwargs: pytest.fail("raw rows joined"))
+    folded = []
+    extend = AggregatePyramid.extend
+    monkeypatch.setattr(AggregatePyramid, 'extend', lambda self, when, values: folded.append(len(when)) or extend(self, when, values))
+
+    streamed = app_module.load_pyramid(str(src)).frame('minute')
+    assert folded == [2, 2, 1]
+    pd.testing.assert_frame_equal(streamed, expected)
+
+    folded.clear()
+    cached = app_module.load_pyramid(str(src)).frame('minute')   #the cache written while streaming, read back as one memory-mapped frame
+    assert folded == [5]
+    pd.testing.assert_frame_equal(cached, expected)
+
+def test_compact_frames_are_cached_apart(tmp_path):   #the compact and full representations of one source get separate cache entries
+    src = tmp_path / "power.txt"
+    write_uci_text(src)
+    cache = str(tmp_path / "cache")
+    assert 'Date' in load_and_preprocess(str(src), cache_dir=cache).columns
+    assert 'Date' not in load_and_preprocess(str(src), cache_dir=cache, compact=True).columns
+    assert 'Date' in load_and_preprocess(str(src), cache_dir=cache).columns
+
+def test_score_series_matches_predict():   #batch labels agree with the model's own predict and line up with the grouped rows
+    df = make_df().rename(columns={
+        'Datetime': 'group',
+        'Global_active_power': 'total_power'
+    })
+    model = fit_detector(df)
+    labels, scores = score_series(model, df)
+
+    assert len(labels) == len(scores) == len(df)
+    assert list(labels) == model.predict(df[['total_power']])
+    #the anomalous 2.5 kW hour has the lowest score
+    assert scores.argmin() == 3
+
+def test_find_all_anomalies_returns_every_anomaly():   #one vectorized call returns timestamp, power and score of each anomaly, in order
+    df = make_df().rename(columns={
+        'Datetime': 'group',
+        'Global_active_power': 'total_power'
+    })
+    model = fit_detector(df)
+    anomalies = find_all_anomalies(df, model)
+
+    assert list(anomalies.columns) == ['group', 'total_power', 'score']
+    assert list(anomalies['total_power']) == [2.5]
+    assert anomalies['group'].iloc[0] == pd.Timestamp("2025-01-01 03:00")
+    assert (anomalies['score'] < 0).all()
+    assert find_first_anomaly(df, model) == (anomalies['group'].iloc[0], 2.5)
+
+def test_batch_cli_writes_json_lines(tmp_path):   #the CLI runs on conftest's sample data and threshold model and honours the date range
+    out = tmp_path / "anomalies.jsonl"
+    run_anomaly_detection([
+        '--data', 'unused.xlsx', '--resolution', 'minute',
+        '--start', '2025-01-01 00:01', '--format', 'jsonl', '--output', str(out)
+    ])
+
+    rows = [json.loads(line) for line in out.read_text().splitlines()]
+    assert len(rows) == 1
+    assert rows[0]['total_power'] == 5.0
+    assert rows[0]['group'].startswith("2025-01-01T00:02:00")
+
+def test_batch_cli_fits_like_the_app_and_checks_parquet_up_front(monkeypatch, capsys):   #the CLI fits with the app's FIT_PARAMS and DETECTOR, so its anomalies can share the store /anomalies serves; parquet without an engine is a usage error
+    import anomaly_detector as det
+    params, dummy = [], det.fit_detector   #conftest's threshold model
+    monkeypatch.setattr(det, 'fit_detector', lambda df, **kw: params.append(kw) or dummy(df))
+    run_anomaly_detection(['--data', 'unused.xlsx', '--format', 'jsonl'])
+
+    assert params == [det.FIT_PARAMS]
+    out = capsys.readouterr().out
+    assert len(out.splitlines()) == 1 and out.endswith("}\n")   #one anomaly, no stray blank line
+
+    monkeypatch.setattr(det, 'parquet_engine', lambda: False)
+    with pytest.raises(SystemExit):
+        run_anomaly_detection(['--data', 'unused.xlsx', '--format', 'parquet', '--output', 'anomalies.parquet'])
+    assert 'pyarrow' in capsys.readouterr().err
+
+def test_fit_and_score_trains_on_trailing_window(monkeypatch):   #with a window the detector only sees recent periods but every period is scored
+    import anomaly_detector as det
+    grouped = pd.DataFrame({
+        'group':       pd.date_range("2025-01-01", periods=48, freq='h'),
+        'total_power': [float(i) for i in range(48)],
+    })
+    seen = []
+    monkeypatch.setattr(det, 'fit_detector', lambda df: seen.append(len(df)) or fit_detector(df))
+
+    fitted = det.fit_and_score(grouped, window="12h")
+
+    assert seen == [12]
+    assert len(fitted.labels) == 48
+
+def test_readings_frame_accepts_uci_fields():   #raw UCI measurements give the same total_power as preprocess_frame
+    frame = readings_frame([{
+        "Date": "16/12/2006", "Time": "17:24:00",
+        "Global_active_power": "4.216", "Global_reactive_power": "0.418",
+        "Voltage": "234.84", "Global_intensity": "18.4",
+    }])
+    assert frame['datetime'].iloc[0] == pd.Timestamp("2006-12-16 17:24:00")
+    assert frame['total_power'].iloc[0] == pytest.approx(((4.216 + 0.418) + 234.84 * 18.4 / 1000) / 2)
@@ -0,0 +1,49 @@
+import sqlite3
+import pandas as pd
+from anomaly_store import AnomalyStore, to_ms
+
+def make_store(tmp_path, **kw):
+    return AnomalyStore(str(tmp_path / "anomalies.sqlite3"), **kw)
+
+def test_recorded_events_are_batched_and_deduplicated(tmp_path):   #the writer commits queued events; the same period recorded again updates its row
+    store = make_store(tmp_path, flush_interval=0.05)
+    ts = pd.Timestamp("2025-01-01 00:02")
+    assert store.record('minute', ts, 5.0, -0.2)
+    assert store.record('minute', ts, 5.5, -0.3)
+    assert store.record('hour', ts.floor('h'), 8.3, -0.1)
+    assert store.flush(5)
+
+    rows, cursor = store.query()
+    assert cursor is None
+    assert [(r['datetime'], r['resolution'], r['power']) for r in rows] == [
+        ("2025-01-01T00:00:00", 'hour', 8.3),
+        ("2025-01-01T00:02:00", 'minute', 5.5),
+    ]
+
+def test_keyset_pages_cover_every_row_once(tmp_path):   #following the cursor visits each anomaly in the range exactly once, with or without a resolution filter
+    store = make_store(tmp_path)
+    times = pd.date_range("2025-01-01", periods=50, freq='h')
+    store.write([(res, ts, 1.0, -0.1) for ts in times for res in ('minute', 'hour')])
+    since, until = times[10], times[40]
+
+    for resolution, expected in ((None, 60), ('hour', 30)):
+        seen, after = [], None
+        while True:
+            rows, after = store.query(since, until, resolution, limit=7, after=after)
+            seen.extend((r['datetime'], r['resolution']) for r in rows)
+            if after is None:
+                break
+        assert len(seen) == len(set(seen)) == expected == store.count(since, until, resolution)
+        assert seen == sorted(seen)
+
+def test_queries_use_the_indexes(tmp_path):   #paging by time, with or without a resolution, never scans the whole table
+    make_store(tmp_path)
+    conn = sqlite3.connect(str(tmp_path / "anomalies.sqlite3"))
+    t = to_ms(pd.Timestamp("2025-01-01"))
+    plans = [
+        conn.execute("EXPLAIN QUERY PLAN SELECT * FROM anomalies WHERE ts >= ? AND (ts, resolution) > (?, ?) ORDER BY ts, resolution LIMIT 10", (t, t, 'hour')).fetchall(),
+        conn.execute("EXPLAIN QUERY PLAN SELECT * FROM anomalies WHERE resolution = ? AND ts > ? ORDER BY ts LIMIT 10", ('hour', t)).fetchall(),
+    ]
+    for plan in plans:
+        detail = " ".join(row[-1] for row in plan)
+        assert "SEARCH" in detail and "TEMP B-TREE" not in detail
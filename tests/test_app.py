@@ -1,5 +1,7 @@
 import pytest
+import json
 import os
+import pandas as pd
 from app import send_telegram
 
 def test_current_status_cycle(client):  #tests for the /current_status and /anomaly endpoints to ensure correct cycling through data points
@@ -23,6 +25,8 @@ def test_current_status_cycle(client):  #tests for the /current_status and /anom
     j3 = rv3.get_json()
     assert j3['latestPower'] == 5.0
     assert j3['anomalyFound'] is True
+    #the precomputed decision_function score is exposed alongside the label
+    assert j3['anomalyScore'] == pytest.approx(-3.0)
 
     #power = 1.1 so back to no anomaly
     rv4 = client.get('/current_status?resolution=minute')
@@ -36,9 +40,9 @@ def test_anomaly_alias(client):   #ensure that /anomaly is an alias for /current
     assert r1 == r2
 
 def test_insights_endpoint(client):  #test /insights returns correct deltaKw and sevenPctChange calculations
-    import app as m
-    #advance index so idx >= 2 to have at least two data points to compare
-    m.current_index = 3
+    #advance this client's cursor so idx >= 2 to have at least two data points to compare
+    for _ in range(3):
+        client.get('/current_status?resolution=minute')
     rv = client.get('/insights')
     assert rv.status_code == 200
     js = rv.get_json()
@@ -46,6 +50,11 @@ def test_insights_endpoint(client):  #test /insights returns correct deltaKw and
     assert pytest.approx(js['deltaKw'], rel=1e-3) == 3.8
     #with only four data points, sevenPctChange should be default 0.0
     assert js['sevenPctChange'] == 0.0
+    #no earlier week to compare the 5.0 spike with yet, but a typical Wednesday 00:00 from the two minutes of that quarter hour before it, never the spike itself or later minutes
+    assert js['lastWeekPower'] is None
+    assert js['typicalLabel'] == "Wednesday 00:00"
+    assert js['typicalPower'] == pytest.approx(1.1)
+    assert js['typicalPctChange'] == pytest.approx(354.5)
 
 #parameterised tests for /tips to cover different percentage and deltaKw scenarios
 @pytest.mark.parametrize("pct,dk,contains", [
@@ -61,6 +70,12 @@ def test_tips_endpoint(client, pct, dk, contains):
     #one of the tips should contain the specified substring
     assert any(contains in t for t in tips)
  
+def test_tips_lead_with_seasonal_comparison(client):   #a point well above a typical period at that weekday and time gets its own tip first
+    rv = client.get('/tips?sevenPctChange=5&deltaKw=0.1&typicalPctChange=45&typicalLabel=Tuesday%2018:00')
+    tips = rv.get_json()['tips']
+    assert tips[0].startswith("You're using 45% more than on a typical Tuesday 18:00")
+    assert len(tips) >= 3
+
 def test_index_route_serves_html(client):  #test that the root index route serves HTML (index.html)
     #GET / should return index.html with HTML content
     rv = client.get('/')
@@ -106,3 +121,207 @@ def test_send_telegram_success(monkeypatch):     #with valid token & chat_id, se
     assert payload["parse_mode"] == "Markdown"
     #confirm timeout argument was passed as expected
     assert to == 5
+
+def test_resolution_switch_waits_for_background_fit(client):   #switching resolution never fits on the request thread; it reports warming until the model is ready
+    import app as m
+    first = client.get('/current_status?resolution=hour').get_json()
+    if first.get('warming'):
+        assert first['resolution'] == 'hour'
+        m.model_registry.submit('hour', m.pyramid.version, m.pyramid.frame('hour')).result(5)
+        first = client.get('/current_status?resolution=hour').get_json()
+
+    assert first['resolution'] == 'hour'
+    assert first['latestPower'] == pytest.approx(8.3)   #all four sample minutes fall in one hour
+
+def read_sse(resp, count):   #collect the first count named events from a streaming response
+    events, buf = [], ""
+    chunks = iter(resp.response)
+    while len(events) < count:
+        chunk = next(chunks)
+        buf += chunk.decode() if isinstance(chunk, bytes) else chunk
+        while "\n\n" in buf and len(events) < count:
+            block, buf = buf.split("\n\n", 1)
+            fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+            if "event" in fields:
+                events.append((fields["event"], json.loads(fields["data"])))
+    resp.close()
+    return events
+
+def test_stream_pushes_status_with_insights_and_tips(client, monkeypatch):   #/stream sends a resolution event, then one status event per data point with insights and tips attached
+    import app as m
+    monkeypatch.setattr(m, "STREAM_INTERVAL", 0)
+    resp = client.get('/stream?resolution=minute', buffered=False)
+    assert resp.mimetype == "text/event-stream"
+
+    events = read_sse(resp, 4)
+    assert events[0] == ("resolution", {"resolution": "minute"})
+    assert [e for e, _ in events[1:]] == ["status"] * 3
+    powers = [payload["latestPower"] for _, payload in events[1:]]
+    assert powers == [1.0, 1.2, 5.0]
+    last = events[3][1]
+    assert last["anomalyFound"] is True
+    assert last["insights"]["deltaKw"] == pytest.approx(3.8)
+    assert len(last["tips"]) >= 2
+
+def test_streams_past_the_cap_are_refused_until_one_closes(client, monkeypatch):   #each open stream holds a server thread, so past MAX_STREAMS a 503 sends the dashboard to polling; closing a stream frees its slot
+    import threading
+    import app as m
+    monkeypatch.setattr(m, "STREAM_INTERVAL", 0)
+    monkeypatch.setattr(m, "stream_slots", threading.BoundedSemaphore(1))
+    first = client.get('/stream?client=tab-a', buffered=False)
+    assert first.status_code == 200
+
+    refused = client.get('/stream?client=tab-b', buffered=False)
+    assert refused.status_code == 503 and refused.headers['Retry-After']
+    assert client.get('/current_status?client=tab-b').status_code == 200   #polling still works
+
+    read_sse(first, 1)   #reads one event, then closes the stream
+    second = client.get('/stream?client=tab-b', buffered=False)
+    assert second.status_code == 200
+    second.close()
+
+def test_open_stream_keeps_its_session_after_eviction(client, monkeypatch):   #a stream evicted from the session store puts its cursor back, so a poll with the same id resumes where the stream was
+    import app as m
+    from sessions import SessionStore
+    monkeypatch.setattr(m, "STREAM_INTERVAL", 0)
+    monkeypatch.setattr(m, "sessions", SessionStore(max_sessions=1))
+    resp = client.get('/stream?resolution=minute&client=tab-a', buffered=False)
+    chunks = iter(resp.response)
+    for _ in range(3):   #retry hint, resolution event, first status
+        next(chunks)
+
+    client.get('/current_status?client=tab-b')   #over the cap of one, tab-a is evicted while its stream is open
+    next(chunks)   #the stream serves the second point and touches its session back in
+    resp.close()
+
+    assert client.get('/current_status?client=tab-a').get_json()['latestPower'] == 5.0
+
+def test_clients_have_independent_cursors(client):   #each client id advances its own cursor and keeps its own resolution
+    a1 = client.get('/current_status?resolution=minute&client=tab-a').get_json()
+    a2 = client.get('/current_status?resolution=minute&client=tab-a').get_json()
+    b1 = client.get('/current_status?resolution=minute&client=tab-b').get_json()
+
+    assert [a1['latestPower'], a2['latestPower']] == [1.0, 1.2]
+    assert b1['latestPower'] == 1.0   #tab-b starts from the beginning, unaffected by tab-a
+
+def test_new_client_gets_session_cookie(client):   #clients without an id are handed a session cookie and keep their place with it
+    rv = client.get('/current_status')
+    assert 'hem_session=' in rv.headers.get('Set-Cookie', '')
+    assert client.get('/current_status').get_json()['latestPower'] == 1.2
+
+def test_readings_are_ingested_and_scored(client):   #POST /readings appends to every resolution and scores the new minutes online
+    readings = [{"datetime": f"2025-01-01T00:{m:02d}:00", "total_power": 1.1} for m in range(4, 40)]
+    readings.append({"datetime": "2025-01-01T00:40:00", "total_power": 40.0})
+    readings.append({"datetime": "not a date", "total_power": 1.0})
+    body = client.post('/readings', json={"readings": readings}).get_json()
+
+    assert body["accepted"] == 37 and body["rejected"] == 1
+    assert [a["datetime"] for a in body["anomalies"]] == ["2025-01-01T00:40:00"]
+
+    import app as m
+    assert len(m.pyramid.frame('minute')) == 41
+    assert m.scoring.fit_version != m.pyramid.version   #served from the online detector until the next refit
+
+def test_readings_dated_in_the_future_are_rejected(client):   #a reading past the server clock would become the newest minute and lock out every correctly dated one after it
+    body = client.post('/readings', json=[{"datetime": "2100-01-01T00:00:00", "total_power": 1.0}]).get_json()
+    assert body["accepted"] == 0 and body["rejected"] == 1
+
+    body = client.post('/readings', json=[{"datetime": "2025-01-01T00:05:00", "total_power": 1.0}]).get_json()
+    assert body["accepted"] == 1
+
+def test_readings_with_mixed_offsets_are_converted(client):   #one batch may mix Z, offsets and local time; each is converted to local wall-clock time rather than failing the batch
+    from dateutil.tz import tzlocal
+    import app as m
+    readings = [
+        {"datetime": "2025-01-01T00:04:00", "total_power": 1.0},
+        {"datetime": "2025-01-02T03:00:00Z", "total_power": 1.0},
+        {"datetime": "2025-01-02T06:00:00+01:00", "total_power": 1.0},
+    ]
+    body = client.post('/readings', json=readings).get_json()
+    assert body["accepted"] == 3
+
+    local = lambda stamp: pd.Timestamp(stamp).tz_convert(tzlocal()).tz_localize(None)
+    assert m.pyramid.frame('minute')['group'].iat[-1] == local("2025-01-02T05:00:00Z")
+    assert local("2025-01-02T03:00:00Z") in set(m.pyramid.frame('minute')['group'])
+
+def test_readings_rejects_bad_payload(client):   #payloads that are not a list of readings, or lack the needed fields, are a 400
+    assert client.post('/readings', json={"readings": "x"}).status_code == 400
+    assert client.post('/readings', json=[{"total_power": 1.0}]).status_code == 400
+
+def test_metrics_endpoint_reports_routes_and_stages(client):   #/metrics is Prometheus text with per-route counters and latency histograms
+    client.get('/current_status')
+    resp = client.get('/metrics')
+
+    assert resp.status_code == 200
+    assert resp.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = resp.get_data(as_text=True)
+    assert 'hem_http_requests_total{route="/current_status",method="GET",status="200"}' in text
+    assert 'hem_http_request_duration_seconds_bucket{route="/current_status",method="GET",le="+Inf"}' in text
+    assert 'hem_predict_seconds_count{resolution="minute"}' in text
+    assert 'hem_sessions_active 1' in text
+
+def test_history_accepts_timestamps_with_an_offset(client):   #browsers send toISOString() (Z) or an offset; both are read as the dataset's wall-clock time, as /anomalies does
+    for suffix in ("Z", "%2B01:00"):
+        body = client.get(f'/history?start=2025-01-01T00:01:00{suffix}&end=2025-01-01T00:03:00{suffix}').get_json()
+        assert body["v"] == [1.2, 5.0]
+
+def test_history_range_is_columnar_and_cached(client):   #range by binary search, parallel arrays with anomaly positions, gzip and a 304 on an unchanged ETag
+    resp = client.get('/history?start=2025-01-01T00:01:00&end=2025-01-01T00:03:00')
+    body = resp.get_json()
+
+    assert body["count"] == 2
+    assert body["t"] == [1735689660000, 1735689720000]   #00:01 and 00:02 in epoch milliseconds, end excluded
+    assert body["v"] == [1.2, 5.0]
+    assert body["a"] == [1]   #the 5.0 spike
+
+    again = client.get('/history?start=2025-01-01T00:01:00&end=2025-01-01T00:03:00', headers={"If-None-Match": resp.headers["ETag"]})
+    assert again.status_code == 304
+
+    gz = client.get('/history?max_points=3', headers={"Accept-Encoding": "gzip"})
+    assert gz.headers["Content-Encoding"] == "gzip"
+    import gzip, json
+    assert len(json.loads(gzip.decompress(gz.data))["t"]) == 3
+
+    assert client.get('/history?start=yesterday-ish').status_code == 400
+
+def test_served_anomalies_are_recorded_and_paged(client):   #anomalies served by /current_status land in the store and come back from /anomalies a page at a time
+    import app as app_module
+    for _ in range(3):
+        client.get('/current_status?client=rec')
+    assert client.get('/anomaly?client=rec').get_json()['anomalyFound']   #serves the 5.0 kW spike again; still one row
+    assert app_module.anomaly_store.flush(5)
+
+    first = client.get('/anomalies?resolution=minute&limit=1').get_json()
+    assert [(a['datetime'], a['power']) for a in first['anomalies']] == [("2025-01-01T00:02:00", 5.0)]
+    assert first['next'] is None
+    assert client.get('/anomalies?since=2025-01-01T00:03:00').get_json()['anomalies'] == []
+
+    assert client.get('/anomalies?resolution=week').status_code == 400
+    assert client.get('/anomalies?since=yesterday-ish').status_code == 400
+    assert client.get('/anomalies?after=nope').status_code == 400
+
+def test_episodes_endpoint_and_one_alert_per_episode(client, monkeypatch):   #/episodes reports the spike as one episode, and re-serving it does not alert twice
+    import app as app_module
+    alerts = []
+    monkeypatch.setattr(app_module.telegram, "submit", alerts.append)
+    for _ in range(3):
+        client.get('/current_status?client=ep')
+    client.get('/anomaly?client=ep')   #the spike again
+    assert len(alerts) == 1
+
+    body = client.get('/episodes?resolution=minute').get_json()
+    assert body['count'] == 1
+    assert body['episodes'][0]['start'] == body['episodes'][0]['end'] == "2025-01-01T00:02:00"
+    assert body['episodes'][0]['peakPower'] == 5.0
+    assert client.get('/episodes?since=2025-01-01T00:03:00').get_json()['count'] == 0
+    assert client.get('/episodes?gap=x').status_code == 400
+
+def test_replay_clock_serves_by_virtual_time(client, monkeypatch):   #in replay mode the point depends on the virtual clock, not on how often a client polls
+    import app as app_module
+    from replay import ReplayClock
+    now = [0.0]
+    monkeypatch.setattr(app_module, "replay_clock", ReplayClock(app_module.pyramid, speed=60, clock=lambda: now[0]))
+    powers = [client.get('/current_status?client=r').get_json()['latestPower'] for _ in range(3)]
+    assert powers == [1.0, 1.0, 1.0]
+    now[0] = 2.0   #two virtual minutes later
+    assert client.get('/current_status?client=other').get_json()['latestPower'] == 5.0
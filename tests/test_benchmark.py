@@ -0,0 +1,46 @@
+import pandas as pd
+from benchmark import bench_detectors, bench_endpoints, compare, generate_uci, write_uci_text
+from aggregates import AggregatePyramid
+from anomaly_detector import load_and_preprocess
+
+def test_generator_is_seeded_and_uci_shaped(tmp_path):   #same seed, same file; chunked writing gives one continuous minute series the real parser reads
+    a, b = tmp_path / "a.txt", tmp_path / "b.txt"
+    write_uci_text(str(a), 3000, seed=7, chunk_rows=1000)
+    write_uci_text(str(b), 3000, seed=7, chunk_rows=1000)
+    assert a.read_bytes() == b.read_bytes()
+
+    data = load_and_preprocess(str(a), use_cache=False)
+    assert len(data) == 3000
+    assert data['datetime'].iloc[0] == pd.Timestamp("2006-12-16 17:24:00")
+    assert (data['datetime'].diff().dropna() == pd.Timedelta(minutes=1)).all()
+    assert data['total_power'].isna().any()   #'?' rows, like the real export
+    assert list(generate_uci(10, seed=1)['Date'])[0] == "16/12/2006"
+
+def test_endpoint_latency_is_measured_per_client():   #every endpoint gets latency percentiles over clients x requests
+    data = generate_uci(2000)
+    data['datetime'] = pd.to_datetime(data['Date'] + ' ' + data['Time'], format='%d/%m/%Y %H:%M:%S')
+    data['total_power'] = data['Global_active_power']
+    results = bench_endpoints(AggregatePyramid.from_frame(data[['datetime', 'total_power']]), clients=2, requests_per_client=5)   #conftest's dummy model only reads total_power
+
+    assert set(results) == {'current_status', 'insights'}
+    assert 0 < results['insights']['p50_ms'] <= results['insights']['p99_ms']
+
+def test_compare_flags_only_real_slowdowns():   #relative slowdowns past the threshold are regressions, timer noise on tiny stages is not
+    def report(load, tiny, p99):
+        return {'results': {'10k': {
+            'stages': {'load_text_seconds': load, 'group_power/day_seconds': tiny},
+            'endpoints': {'insights': {'p99_ms': p99, 'requests_per_second': 1.0}},
+        }}}
+
+    regressions = compare(report(1.0, 0.0001, 5.0), report(1.5, 0.0003, 5.5))
+    assert [r['metric'] for r in regressions] == ['10k/stages/load_text_seconds']
+
+def test_detectors_are_compared_with_isolation_forest():   #fit time, predict figures and agreement per detector and resolution, IsolationForest agreeing with itself
+    data = generate_uci(3000)
+    data['datetime'] = pd.to_datetime(data['Date'] + ' ' + data['Time'], format='%d/%m/%Y %H:%M:%S')
+    data['total_power'] = pd.to_numeric(data['Global_active_power'], errors='coerce')
+    results = bench_detectors(AggregatePyramid.from_frame(data[['datetime', 'total_power']].dropna()), ('iforest', 'mad'), repeat=1, single=5, n_estimators=10)
+
+    assert set(results) == {f"{res}/{name}" for res in ('minute', '30min', 'hour', 'day') for name in ('iforest', 'mad')}
+    assert results['minute/iforest']['agreement'] == results['minute/iforest']['anomaly_overlap'] == 1.0
+    assert 0 < results['minute/mad']['predict_one_ms'] and 0 <= results['minute/mad']['agreement'] <= 1
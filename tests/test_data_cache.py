@@ -0,0 +1,41 @@
+import pandas as pd
+from data_cache import cached_frame
+
+def make_frame():   #small preprocessed-looking frame with a datetime, a string and a float column
+    return pd.DataFrame({
+        'datetime':    pd.to_datetime(["2025-01-01 00:00:00", "2025-01-01 00:01:00"]),
+        'Date':        ["1/1/2025", "1/1/2025"],
+        'total_power': [1.5, 2.25],
+    })
+
+def test_cached_frame_reuses_cache(tmp_path):   #second load must come from the cache without calling the builder again
+    src = tmp_path / "source.xlsx"
+    src.write_bytes(b"v1")
+    calls = []
+
+    def build():
+        calls.append(1)
+        return make_frame()
+
+    first = cached_frame(str(src), build, str(tmp_path / "cache"))
+    second = cached_frame(str(src), build, str(tmp_path / "cache"))
+
+    assert len(calls) == 1
+    pd.testing.assert_series_equal(first['datetime'], second['datetime'])
+    assert list(second['total_power']) == [1.5, 2.25]
+    assert list(second['Date']) == ["1/1/2025", "1/1/2025"]
+
+def test_cached_frame_rebuilds_when_source_changes(tmp_path):   #any change to the source content invalidates the cache entry
+    src = tmp_path / "source.xlsx"
+    src.write_bytes(b"v1")
+    calls = []
+
+    def build():
+        calls.append(1)
+        return make_frame()
+
+    cached_frame(str(src), build, str(tmp_path / "cache"))
+    src.write_bytes(b"v2")
+    cached_frame(str(src), build, str(tmp_path / "cache"))
+
+    assert len(calls) == 2
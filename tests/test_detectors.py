@@ -0,0 +1,49 @@
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+from anomaly_detector import fit_and_score
+from detectors import DETECTORS, Detector, make_detector, parse_detectors
+
+def spiky(n=2000, seed=0):   #steady usage with a spike every 100 periods
+    values = np.random.default_rng(seed).normal(1.0, 0.1, n)
+    values[::100] += 5.0
+    return values
+
+@pytest.mark.parametrize("name", ['mad', 'histogram'])
+def test_numpy_detectors_flag_spikes_at_the_contamination_share(name):   #calibrated on the training scores: about contamination of them flagged (never many more), every spike among them, one period scored like many
+    values = spiky()
+    model = make_detector(name, contamination=0.05, n_estimators=10).fit(values)   #parameters a detector does not take are ignored
+    labels = model.predict(values)
+    assert np.array_equal(values, spiky())   #the training data is left as it was
+
+    assert 0.03 <= (labels == -1).mean() <= 0.055   #periods sharing a histogram bin tie, so a few fewer may be flagged
+    assert (labels[::100] == -1).all()
+    assert model.predict(np.array([[1.0]]))[0] == 1 and model.score(np.array([[1.0]]))[0] > 0
+    assert model.predict(np.array([[50.0]]))[0] == -1   #far outside anything seen in training
+    assert np.array_equal(pickle.loads(pickle.dumps(model)).score(values), model.score(values))   #storable in the model store
+
+def test_fit_and_score_takes_a_detector_by_name():   #the same grouped frame through a NumPy detector, with labels and scores for every period
+    grouped = pd.DataFrame({'group': pd.date_range("2025-01-01", periods=2000, freq='h'), 'total_power': spiky()})
+    fitted = fit_and_score(grouped, detector='mad', contamination=0.05)
+
+    assert isinstance(fitted.model, DETECTORS['mad'])
+    assert len(fitted.labels) == len(fitted.scores) == 2000
+    assert np.array_equal(fitted.labels, np.where(fitted.scores < 0, -1, 1))
+
+def test_detector_config_per_resolution():   #a bare name sets every resolution, resolution=name overrides one; unknown names are an error
+    resolutions = ['minute', 'hour', 'day']
+    assert parse_detectors(None, resolutions) == dict.fromkeys(resolutions, 'iforest')
+    assert parse_detectors("minute=mad, histogram", resolutions) == {'minute': 'mad', 'hour': 'histogram', 'day': 'histogram'}
+    with pytest.raises(ValueError):
+        parse_detectors("minute=forest", resolutions)
+    with pytest.raises(ValueError):
+        make_detector("forest")
+
+def test_detector_without_score_cannot_be_built():   #fit and score are abstract, so an incomplete detector fails when made rather than when first scored
+    class FitOnly(Detector):
+        def fit(self, X):
+            return self
+
+    with pytest.raises(TypeError):
+        FitOnly()
@@ -0,0 +1,18 @@
+import numpy as np
+from downsample import lttb_indices
+
+def test_lttb_keeps_endpoints_and_spikes():   #exactly max_points sorted positions, always the first and last, and an isolated spike survives
+    x = np.arange(10_000, dtype=np.int64) * 60_000
+    y = np.sin(np.arange(10_000) / 500.0)
+    y[4321] = 25.0
+
+    kept = lttb_indices(x, y, 200)
+
+    assert len(kept) == 200
+    assert kept[0] == 0 and kept[-1] == 9_999
+    assert np.all(np.diff(kept) > 0)
+    assert 4321 in kept
+
+def test_lttb_returns_short_series_unchanged():   #nothing to drop when the series already fits
+    assert list(lttb_indices(np.arange(5), np.ones(5), 10)) == [0, 1, 2, 3, 4]
+    assert list(lttb_indices(np.arange(5), np.ones(5), 2)) == [0, 4]
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from episodes import AlertGate, episode_start, find_episodes
+
+def loop_episodes(labels, values, gap, baseline):   #reference: walk the labels one period at a time
+    episodes, current = [], None
+    for i, label in enumerate(labels):
+        if label != -1:
+            continue
+        if current and i - current[1] <= gap + 1:
+            current[1] = i
+            current[2] += 1
+        else:
+            current = [i, i, 1]
+            episodes.append(current)
+    return [(s, e, n, max(values[s:e + 1]), sum(max(v - baseline, 0) for v in values[s:e + 1]) / 60) for s, e, n in episodes]
+
+@pytest.mark.parametrize("gap", [0, 1, 3])
+def test_find_episodes_matches_a_loop(gap):   #merged runs, peaks and energy above baseline equal a plain loop over random labels
+    rng = np.random.default_rng(gap)
+    labels = np.where(rng.random(2000) < 0.15, -1, 1)
+    values = rng.gamma(2.0, 0.5, 2000)
+    found = find_episodes(labels, values, gap, baseline=1.0)
+
+    expected = loop_episodes(labels, values, gap, 1.0)
+    assert list(found['start_pos']) == [e[0] for e in expected]
+    assert list(found['end_pos']) == [e[1] for e in expected]
+    assert list(found['anomalies']) == [e[2] for e in expected]
+    assert np.allclose(found['peak'], [e[3] for e in expected])
+    assert np.allclose(found['energy_kwh'], [e[4] for e in expected])
+
+def test_find_episodes_without_anomalies():
+    assert len(find_episodes(np.ones(10), np.ones(10))) == 0
+
+def test_episode_start_agrees_with_find_episodes():   #every anomalous point maps to the start of its episode, even when the look-back window has to grow
+    rng = np.random.default_rng(7)
+    labels = np.where(rng.random(3000) < 0.4, -1, 1)   #dense enough for episodes longer than the window
+    found = find_episodes(labels, np.ones(3000), gap=2)
+    for s, e in zip(found['start_pos'], found['end_pos']):
+        for pos in np.flatnonzero(labels[s:e + 1] == -1) + s:
+            assert episode_start(labels, pos, gap=2, window=4) == s
+
+def test_alert_gate_coalesces_episodes_and_enforces_cooldown():   #one alert per episode, and a new episode inside the cooldown stays silent
+    now = [0.0]
+    gate = AlertGate(cooldown=60, clock=lambda: now[0])
+    assert gate.allow('minute', 10)
+    assert not gate.allow('minute', 10)   #same episode
+    now[0] = 30
+    assert not gate.allow('minute', 20)   #new episode, but too soon
+    now[0] = 61
+    assert not gate.allow('minute', 20)   #that episode was already handled
+    assert gate.allow('minute', 30)
+    assert not gate.allow('hour', 30)   #still inside the cooldown started by minute 30
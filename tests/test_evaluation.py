@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+import anomaly_detector
+import evaluation
+from anomaly_detector import fit_detector
+from evaluation import config_key, iter_configs, run_sweep
+from features import FEATURE_COLUMNS, SOURCE_COLUMNS
+
+@pytest.fixture(autouse=True)
+def real_fit_detector(monkeypatch):   #conftest swaps in a dummy model for the app tests; the sweep cross-validates the real IsolationForest
+    monkeypatch.setattr(anomaly_detector, 'fit_detector', fit_detector)
+
+def make_series(sources=False):   #hourly-like usage with a few large spikes the detector should find, optionally with every source column
+    rng = np.random.default_rng(0)
+    values = rng.gamma(4.0, 0.25, 600)
+    values[rng.choice(600, 30, replace=False)] += 8.0
+    grouped = pd.DataFrame({'group': pd.date_range("2025-01-01", periods=600, freq='h'), 'total_power': values})
+    if sources:
+        for col in SOURCE_COLUMNS[1:]:
+            grouped[col] = rng.gamma(2.0, 1.0, 600)
+        grouped['voltage_n'] = 60.0
+    return {'hour': grouped}
+
+GRID = {'resolution': ['hour'], 'detector': ['iforest'], 'contamination': [0.05, 0.10], 'n_estimators': [20], 'max_samples': ['auto']}
+
+def test_iter_configs_covers_the_grid():   #one dict per combination, in grid order
+    configs = list(iter_configs(GRID))
+    assert [c['contamination'] for c in configs] == [0.05, 0.10]
+    assert all(c['n_estimators'] == 20 for c in configs)
+
+def test_sweep_runs_in_processes_and_caches(tmp_path):   #parallel folds give the same metrics as in-process ones, and a rerun is served from the cache
+    series = make_series()
+    parallel = run_sweep(series, GRID, n_splits=3, workers=2, cache_dir=str(tmp_path), data_key="synthetic")
+    serial = run_sweep(series, GRID, n_splits=3, workers=1)
+
+    for p, s in zip(parallel, serial):
+        assert p['precision'] == s['precision'] and p['recall'] == s['recall']
+        assert p['folds'] == 3 and p['fit_seconds'] > 0 and not p['cached']
+    assert parallel[1]['recall'] > 0.5   #the spikes are found
+
+    again = run_sweep(series, GRID, n_splits=3, workers=2, cache_dir=str(tmp_path), data_key="synthetic")
+    assert all(r['cached'] for r in again)
+    assert [r['precision'] for r in again] == [r['precision'] for r in parallel]
+
+def test_folds_fit_the_app_detector_input_and_each_detector_is_cached_apart(tmp_path):   #frames with source columns are cross-validated on the feature matrix, and the detector is part of the grid and the cache key
+    series = make_series(sources=True)
+    evaluation._init_worker(series)
+    X, values = evaluation.fold_inputs('hour')
+    assert X.shape == (600, len(FEATURE_COLUMNS))
+    assert np.array_equal(values, series['hour']['total_power'].to_numpy())
+
+    grid = dict(GRID, detector=['iforest', 'mad'], contamination=[0.10])
+    results = run_sweep(series, grid, n_splits=3, workers=1, cache_dir=str(tmp_path), data_key="synthetic")
+    assert [r['detector'] for r in results] == ['iforest', 'mad']
+    config = next(iter_configs(GRID))
+    assert config_key(config, "synthetic", 3, 95) != config_key(dict(config, detector='mad'), "synthetic", 3, 95)
+    assert len(list(tmp_path.iterdir())) == 2
@@ -0,0 +1,23 @@
+import threading
+from werkzeug.serving import make_server
+from loadtest import run_clients, summarise, wait_ready
+
+def test_clients_report_latency_per_endpoint(app, monkeypatch):   #simulated clients against a real HTTP server: every request counted and timed, streams to their first event, no errors
+    import app as m
+    monkeypatch.setattr(m, "STREAM_INTERVAL", 0.01)   #a closed stream is noticed at its next write
+    monkeypatch.setattr(m, "stream_slots", threading.BoundedSemaphore(16))
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        wait_ready(url, timeout=10, models=1)
+        mix = {'/current_status': 0.6, '/insights': 0.3, '/stream?resolution=minute': 0.1}
+        latencies, errors, elapsed = run_clients(url, clients=3, duration=0.5, mix=mix)
+    finally:
+        server.shutdown()
+
+    report = summarise(latencies, errors, elapsed)
+    assert set(report) == {'/current_status', '/insights', '/stream?resolution=minute', 'total'}
+    assert report['total']['requests'] == sum(report[path]['requests'] for path in mix) > 0
+    assert report['total']['errors'] == 0
+    assert report['total']['p50_ms'] <= report['total']['p99_ms']
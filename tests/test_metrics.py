@@ -0,0 +1,33 @@
+from metrics import Registry
+
+def test_histogram_renders_cumulative_buckets():   #buckets count every observation at or below their bound, plus _sum and _count
+    registry = Registry()
+    hist = registry.histogram("stage_seconds", "Stage time", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        hist.labels(stage="fit").observe(value)
+
+    text = registry.render()
+    assert '# TYPE stage_seconds histogram' in text
+    assert 'stage_seconds_bucket{stage="fit",le="0.1"} 2' in text
+    assert 'stage_seconds_bucket{stage="fit",le="1.0"} 3' in text
+    assert 'stage_seconds_bucket{stage="fit",le="+Inf"} 4' in text
+    assert 'stage_seconds_count{stage="fit"} 4' in text
+    assert 'stage_seconds_sum{stage="fit"} 3.65' in text
+
+def test_counters_gauges_and_callbacks():   #label values are escaped, re-registering returns the same metric and a failing callback is skipped
+    registry = Registry()
+    counter = registry.counter("alerts_total", "Alerts", ["outcome"])
+    counter.labels('say "hi"').inc(2)
+    assert registry.counter("alerts_total", "Alerts", ["outcome"]) is counter
+
+    gauge = registry.gauge("queue_size", "Queue")
+    gauge.set(3)
+    gauge.dec()
+    registry.callback("periods", "Periods", lambda: {("hour",): 24}, labelnames=["resolution"])
+    registry.callback("broken", "Broken", lambda: 1 / 0)
+
+    text = registry.render()
+    assert 'alerts_total{outcome="say \\"hi\\""} 2.0' in text
+    assert 'queue_size 2.0' in text
+    assert 'periods{resolution="hour"} 24' in text
+    assert 'broken' not in text
@@ -0,0 +1,36 @@
+import threading
+from model_registry import ModelRegistry
+
+def test_get_schedules_fit_without_blocking():   #first get returns None while the fit runs, later gets return the cached model
+    release = threading.Event()
+    calls = []
+
+    def slow_fit(grouped):
+        calls.append(grouped)
+        release.wait(5)
+        return "model-" + grouped
+
+    registry = ModelRegistry(slow_fit)
+    assert registry.get('hour', 1, 'h') is None
+    assert registry.get('hour', 1, 'h') is None   #still fitting, no second fit is queued
+
+    release.set()
+    assert registry.submit('hour', 1, 'h').result(5) == "model-h"
+    assert registry.get('hour', 1, 'h') == "model-h"
+    assert calls == ['h']
+
+def test_least_recently_used_entry_is_evicted():   #the registry never holds more than max_entries models
+    registry = ModelRegistry(lambda grouped: grouped, max_entries=2)
+    registry.put('minute', 1, 'a')
+    registry.put('hour', 1, 'b')
+    registry.get('minute', 1, None)   #touch 'minute' so 'hour' becomes the oldest
+    registry.put('day', 1, 'c')
+
+    assert registry.get('minute', 1, None) == 'a'
+    assert registry.get('day', 1, None) == 'c'
+    assert registry.get('hour', 1, 'fresh') is None
+
+def test_fit_per_resolution():   #a dict of fit callables picks the one for each resolution
+    registry = ModelRegistry({'minute': lambda grouped: "mad-" + grouped, 'hour': lambda grouped: "iforest-" + grouped})
+    assert registry.submit('minute', 1, 'm').result(5) == "mad-m"
+    assert registry.submit('hour', 1, 'h').result(5) == "iforest-h"
@@ -0,0 +1,65 @@
+import os
+import numpy as np
+import pandas as pd
+import anomaly_detector as det
+from anomaly_detector import fit_and_score, fit_detector
+from model_registry import ModelRegistry
+from model_store import ModelStore
+
+def make_grouped(n=200, seed=0):   #hourly grouped frame with random power
+    return pd.DataFrame({
+        'group':       pd.date_range("2025-01-01", periods=n, freq='h'),
+        'total_power': np.random.default_rng(seed).gamma(2.0, 0.5, n),
+    })
+
+def test_restart_loads_the_stored_fit(tmp_path, monkeypatch):   #a second registry on the same store reads the fit back instead of fitting again
+    monkeypatch.setattr(det, 'fit_detector', fit_detector)   #conftest swaps in an unpicklable dummy; use the real one here
+    grouped = make_grouped()
+    fits = []
+
+    def fit(g):
+        fits.append(len(g))
+        return fit_and_score(g)
+
+    first = ModelRegistry(fit, store=ModelStore(str(tmp_path)))
+    fitted = first.submit('hour', 1, grouped).result(10)
+    restarted = ModelRegistry(fit, store=ModelStore(str(tmp_path)))
+    loaded = restarted.submit('hour', 7, grouped).result(10)   #a new process numbers its pyramid versions afresh
+
+    assert fits == [200]
+    assert np.array_equal(loaded.labels, fitted.labels)
+    assert np.array_equal(loaded.scores, fitted.scores)
+    assert loaded.model.predict(grouped[['total_power']]) == fitted.model.predict(grouped[['total_power']])
+
+def test_key_covers_data_resolution_and_params(tmp_path):   #any change to the data, the resolution or the parameters needs a new fit
+    store = ModelStore(str(tmp_path), params={'contamination': 0.1})
+    grouped = make_grouped()
+    changed = grouped.copy()
+    changed.loc[5, 'total_power'] += 1.0
+
+    key = store.key('hour', grouped)
+    assert store.key('hour', grouped.copy()) == key
+    assert store.key('hour', changed) != key
+    assert store.key('day', grouped) != key
+    assert ModelStore(str(tmp_path), params={'contamination': 0.2}).key('hour', grouped) != key
+
+def test_gc_drops_other_versions_and_least_recently_used(tmp_path):   #entries of other library versions go at once, current ones beyond max_entries oldest first
+    store = ModelStore(str(tmp_path))
+    (tmp_path / "0123456789abcdef-old.joblib").write_bytes(b"stale")
+    keys = [store.key('hour', make_grouped(seed=i)) for i in range(3)]
+    for i, key in enumerate(keys):
+        store.save(key, i)
+        os.utime(tmp_path / f"{key}.joblib", (1000 + i, 1000 + i))
+    assert store.load(keys[0]) == 0   #a hit counts as a use
+    store.max_entries = 2
+    store.gc()
+
+    assert sorted(os.listdir(tmp_path)) == sorted([f"{keys[0]}.joblib", f"{keys[2]}.joblib"])
+
+def test_unreadable_entry_is_refitted(tmp_path):   #a truncated file is discarded rather than failing the fit
+    store = ModelStore(str(tmp_path))
+    key = store.key('hour', make_grouped())
+    (tmp_path / f"{key}.joblib").write_bytes(b"truncated")
+
+    assert store.load(key) is None
+    assert not (tmp_path / f"{key}.joblib").exists()
@@ -0,0 +1,97 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from notifier import TelegramNotifier, TokenBucket
+
+@pytest.fixture
+def stub_server():   #local stand-in for the Telegram Bot API; replies with the queued status codes, then 200
+    received = []
+    statuses = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            received.append((self.path, json.loads(body)))
+            status = statuses.pop(0) if statuses else 200
+            reply = json.dumps({"ok": status == 200, "parameters": {"retry_after": 0}}).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", received, statuses
+    server.shutdown()
+    server.server_close()
+
+def make_notifier(api_base, **kwargs):   #notifier with no rate limit or backoff so tests run instantly
+    return TelegramNotifier(api_base=api_base, backoff=0, rate_limiter=TokenBucket(rate=1e6, capacity=1e6), **kwargs)
+
+def test_notifier_delivers_in_background(monkeypatch, stub_server):   #submit returns immediately and the worker posts the Markdown payload
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "fake-token")
+    monkeypatch.setenv("TELEGRAM_CHAT_ID", "fake-chat")
+    api_base, received, _ = stub_server
+    notifier = make_notifier(api_base)
+
+    assert notifier.submit("hello") is True
+    assert notifier.wait_idle(5)
+
+    path, payload = received[0]
+    assert path == "/botfake-token/sendMessage"
+    assert payload == {"chat_id": "fake-chat", "text": "hello", "parse_mode": "Markdown"}
+    assert notifier.stats["sent"] == 1
+
+def test_notifier_retries_rate_limited_and_server_errors(monkeypatch, stub_server):   #429 and 5xx responses are retried until the send succeeds
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "fake-token")
+    monkeypatch.setenv("TELEGRAM_CHAT_ID", "fake-chat")
+    api_base, received, statuses = stub_server
+    statuses.extend([429, 502])
+    notifier = make_notifier(api_base)
+
+    notifier.submit("retry me")
+    assert notifier.wait_idle(5)
+
+    assert len(received) == 3
+    assert notifier.stats["retries"] == 2
+    assert notifier.stats["sent"] == 1
+    assert notifier.stats["failed"] == 0
+
+def test_notifier_drops_when_queue_is_full(monkeypatch):   #a stalled transport fills the bounded queue and later alerts are counted as dropped
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "fake-token")
+    monkeypatch.setenv("TELEGRAM_CHAT_ID", "fake-chat")
+    release = threading.Event()
+    started = threading.Event()
+
+    def stalled_transport(url, payload, timeout):
+        started.set()
+        release.wait(5)
+
+        class Resp:
+            status_code = 200
+        return Resp()
+
+    notifier = make_notifier("http://unused", transport=stalled_transport, max_queue=1)
+    notifier.submit("first")
+    assert started.wait(5)              #worker is now stuck on the first message
+    assert notifier.submit("second") is True
+    assert notifier.submit("third") is False
+
+    release.set()
+    assert notifier.wait_idle(5)
+    assert notifier.stats["dropped"] == 1
+    assert notifier.stats["sent"] == 2
+
+def test_notifier_skips_without_credentials(monkeypatch):   #nothing is queued when the bot token or chat ID is missing
+    monkeypatch.delenv("TELEGRAM_BOT_TOKEN", raising=False)
+    monkeypatch.delenv("TELEGRAM_CHAT_ID", raising=False)
+    notifier = make_notifier("http://unused")
+
+    assert notifier.submit("hello") is False
+    assert notifier.stats["queued"] == 0
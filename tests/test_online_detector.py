@@ -0,0 +1,198 @@
+import threading
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+from aggregates import AggregatePyramid
+from anomaly_detector import ScoredSeries
+from model_registry import ModelRegistry
+from online_detector import LiveScores, LiveScoring, RollingZScore
+
+def flat_series(values):   #ScoredSeries calling every period normal, standing in for a full fit
+    return ScoredSeries(None, np.ones(len(values), dtype=int), np.full(len(values), 0.5))
+
+def test_rolling_zscore_flags_spikes_but_not_noise():   #seeded from history, normal values score positive and a spike scores negative
+    rng = np.random.default_rng(0)
+    history = rng.normal(1.0, 0.1, 500)
+    detector = RollingZScore.seeded(history)
+
+    assert detector.score(1.05) > 0
+    assert detector.score(3.0) < 0
+    assert detector.score(0.5, partial=True) > 0   #an open bucket is never flagged for being low
+
+    center = detector.center
+    detector.update(50.0)   #clipped, so one spike barely moves the baseline
+    assert abs(detector.center - center) < 0.01
+
+def test_live_scores_learn_closed_periods_only_once():   #the last period stays open and is rescored as it fills, earlier ones are learned exactly once
+    values = np.ones(100)
+    live = LiveScores(flat_series(values), values)
+    count = live.detector.count
+
+    values = np.concatenate((values, [1.0, 1.1]))
+    live.update(values, 100)
+    assert len(live.labels) == 102 and live.closed == 101
+    assert live.detector.count == count + 1
+
+    values[101] = 20.0   #the open period grows into a spike
+    live.update(values, 101)
+    assert live.labels[101] == -1 and live.detector.count == count + 1
+
+def test_ingest_scores_online_and_refit_catches_up():   #ingested minutes are scored without a refit; refit() then fits the new version once
+    raw = pd.DataFrame({
+        'datetime':    pd.date_range("2025-01-01", periods=600, freq='min'),
+        'total_power': np.random.default_rng(1).normal(1.0, 0.05, 600),
+    })
+    pyramid = AggregatePyramid.from_frame(raw)
+    fits = []
+    registry = ModelRegistry(lambda grouped: fits.append(len(grouped)) or flat_series(grouped['total_power']))
+    scoring = LiveScoring(pyramid, registry, refit_interval=3600)
+    registry.warm(pyramid, ['minute'])['minute'].result(5)
+    grouped, live = scoring.series('minute').grouped, scoring.series('minute').fitted
+    assert len(grouped) == 600
+
+    changed, accepted = scoring.ingest(pd.to_datetime(["2025-01-01 10:00", "2025-01-01 10:01"]), [1.0, 9.0])
+    assert changed['minute'] == 600 and accepted.all()
+    grouped, windows, live, _ = scoring.series('minute')
+    assert len(grouped) == len(live.labels) == len(windows) == 602
+    assert live.labels[601] == -1   #the spike, still in its open minute
+    assert fits == [600]            #no refit on ingestion
+
+    changed, accepted = scoring.ingest(pd.to_datetime(["2025-01-01 03:00"]), [5.0])   #backfill before the newest minute
+    assert changed == {} and not accepted.any()
+    assert len(scoring.series('minute')[2].labels) == 602
+
+    assert scoring.refit(timeout=5)
+    assert scoring.fit_version == pyramid.version
+    assert not scoring.refit(timeout=5)   #nothing new since
+    assert len(scoring.series('minute')[2].labels) == 602
+
+def test_refits_use_their_own_registry():   #periodic refits may fit with other parameters (a trailing window) than the first fits, which stay on the whole history
+    raw = pd.DataFrame({'datetime': pd.date_range("2025-01-01", periods=120, freq='min'), 'total_power': np.ones(120)})
+    pyramid = AggregatePyramid.from_frame(raw)
+    first, later = [], []
+    registry = ModelRegistry(lambda grouped: first.append(len(grouped)) or flat_series(grouped['total_power']))
+    refits = ModelRegistry(lambda grouped: later.append(len(grouped)) or flat_series(grouped['total_power']))
+    scoring = LiveScoring(pyramid, registry, refits=refits)
+    registry.warm(pyramid, ['minute'])['minute'].result(5)
+
+    scoring.ingest(pd.to_datetime(["2025-01-01 02:00"]), [1.0])
+    assert scoring.refit(timeout=5)
+    assert first == [120] and 121 in later
+
+class PendingRegistry:   #hands out fits as futures the test resolves by hand
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, resolution, version, grouped):
+        self.futures.append(Future())
+        return self.futures[-1]
+
+def test_warming_requests_share_one_pending_fit():   #polls of a resolution whose first fit is running attach one adopt callback between them; a failed fit is asked for again
+    raw = pd.DataFrame({'datetime': pd.date_range("2025-01-01", periods=120, freq='min'), 'total_power': np.ones(120)})
+    registry = PendingRegistry()
+    scoring = LiveScoring(AggregatePyramid.from_frame(raw), registry)
+
+    assert all(scoring.series('minute') is None for _ in range(50))
+    assert len(registry.futures) == 1
+
+    registry.futures[0].set_exception(RuntimeError("fit failed"))
+    assert scoring.series('minute') is None
+    assert len(registry.futures) == 2
+
+    registry.futures[1].set_result(flat_series(raw['total_power']))
+    assert len(scoring.series('minute').fitted.labels) == 120
+    assert len(registry.futures) == 2
+
+def test_snapshots_are_immutable_while_readings_arrive():   #a snapshot taken before ingestion keeps its length and labels; readers in other threads always see matching lengths
+    raw = pd.DataFrame({
+        'datetime':    pd.date_range("2025-01-01", periods=300, freq='min'),
+        'total_power': np.ones(300),
+    })
+    pyramid = AggregatePyramid.from_frame(raw)
+    registry = ModelRegistry(lambda grouped: flat_series(grouped['total_power']))
+    scoring = LiveScoring(pyramid, registry, refit_interval=3600)
+    registry.warm(pyramid, ['minute'])['minute'].result(5)
+    before = scoring.series('minute')
+    labels = before.fitted.labels.copy()
+    assert not before.fitted.labels.flags.writeable
+
+    mismatched = []
+    def read():
+        for _ in range(300):
+            grouped, windows, fitted, _ = scoring.series('minute')
+            if not len(grouped) == len(windows) == len(fitted.labels) == len(fitted.scores):
+                mismatched.append(len(grouped))
+    reader = threading.Thread(target=read)
+    reader.start()
+    start = pd.Timestamp("2025-01-01 05:00")
+    for i in range(100):
+        scoring.ingest([start + pd.Timedelta(minutes=i)], [50.0 if i % 10 == 9 else 1.0])
+    reader.join()
+
+    assert not mismatched
+    assert len(before.grouped) == len(before.fitted.labels) == 300
+    assert (before.fitted.labels == labels).all()
+    assert len(scoring.series('minute').fitted.labels) == 400
+
+def test_ingest_grows_snapshots_without_copying_history():   #after the first growth, a reading copies only the periods it changed into the frames, prefix sums and labels, never the whole level
+    n = 200_000
+    raw = pd.DataFrame({
+        'datetime':    pd.date_range("2025-01-01", periods=n, freq='min'),
+        'total_power': np.ones(n),
+    })
+    pyramid = AggregatePyramid.from_frame(raw)
+    registry = ModelRegistry(lambda grouped: flat_series(grouped['total_power']))
+    scoring = LiveScoring(pyramid, registry, refit_interval=3600)
+    for res in ['minute', 'hour']:
+        registry.warm(pyramid, [res])[res].result(5)
+        scoring.series(res)
+    start = raw['datetime'].iat[-1] + pd.Timedelta(minutes=1)
+    for i in range(3):   #the first readings and rewrites grow both generations of every buffer once
+        scoring.ingest([start + pd.Timedelta(minutes=i)], [0.5])
+        scoring.ingest([start + pd.Timedelta(minutes=i, seconds=30)], [0.5])
+
+    buffers = [frame._buffer for frame in scoring._frames.values()] + [live._buffer for live in scoring._live.values()]
+    copied = [b.copied for b in buffers]
+    before = scoring.series('hour')
+    scoring.ingest([start + pd.Timedelta(minutes=3)], [5.0])   #a new minute, rewriting the open hour and day
+    assert before.grouped['total_power'].iat[-1] == 23.0         #the open hour as it was, in the older snapshot
+    del before   #a generation a request still reads is copied rather than reused
+    scoring.ingest([start + pd.Timedelta(minutes=3, seconds=30)], [5.0])   #the same, still open minute
+    assert all(b.copied - c <= 2 for b, c in zip(buffers, copied))
+
+    after = scoring.series('hour')
+    assert after.windows.window_sum(len(after.windows), 1) == after.grouped['total_power'].iat[-1] == 33.0   #20 recorded minutes, three ingested ones and two 5 kW readings
+    assert after.windows.cumsum[-1] == after.grouped['total_power'].sum()
+
+def test_a_column_kept_from_a_dropped_snapshot_is_never_rewritten():   #readers often keep only a slice of a snapshot; its generation stays held until that slice goes too
+    raw = pd.DataFrame({
+        'datetime':    pd.date_range("2025-01-01", periods=630, freq='min'),
+        'total_power': np.ones(630),
+    })
+    pyramid = AggregatePyramid.from_frame(raw)
+    registry = ModelRegistry(lambda grouped: flat_series(grouped['total_power']))
+    scoring = LiveScoring(pyramid, registry, refit_interval=3600)
+    registry.warm(pyramid, ['hour'])['hour'].result(5)
+    start = raw['datetime'].iat[-1] + pd.Timedelta(minutes=1)
+    kept = scoring.series('hour').grouped['total_power'].to_numpy()[-1:]   #the snapshot itself is dropped at once
+    for i in range(4):   #each reading rewrites the open hour, switching generations back and forth
+        scoring.ingest([start + pd.Timedelta(minutes=i)], [5.0])
+    assert kept[0] == 30.0
+    assert scoring.series('hour').grouped['total_power'].iat[-1] == 30.0 + 4 * 5.0
+
+def test_online_scores_spare_a_routine_peak_but_flag_a_spike():   #a reading far above the recent level is normal if its weekday and time of day always look like that, and still an anomaly if it is far above that too
+    minutes = pd.date_range("2025-01-06", "2025-01-27 17:59", freq='min')   #three weeks up to just before a Monday evening
+    values = np.where(minutes.hour == 18, 4.0, 1.0) + np.random.default_rng(2).normal(0, 0.05, len(minutes))
+    pyramid = AggregatePyramid.from_frame(pd.DataFrame({'datetime': minutes, 'total_power': values}))
+    registry = ModelRegistry(lambda grouped: flat_series(grouped['total_power']))
+    scoring = LiveScoring(pyramid, registry, refit_interval=3600)
+    registry.warm(pyramid, ['minute'])['minute'].result(5)
+    scoring.series('minute')
+
+    evening = pd.Timestamp("2025-01-27 18:00")
+    scoring.ingest([evening + pd.Timedelta(minutes=i) for i in range(5)], [4.0, 4.05, 3.95, 4.0, 4.1])
+    assert (scoring.series('minute').fitted.labels[-5:] == 1).all()   #the evening peak of every earlier day
+
+    scoring.ingest([evening + pd.Timedelta(minutes=5)], [20.0])
+    live = scoring.series('minute').fitted
+    assert live.labels[-1] == -1 and live.scores[-1] < 0
@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+from aggregates import AggregatePyramid
+from replay import ReplayClock, parse_speed
+
+def make_pyramid(minutes=10):
+    return AggregatePyramid.from_frame(pd.DataFrame({
+        'datetime':    pd.date_range("2025-01-01", periods=minutes, freq='min'),
+        'total_power': range(minutes),
+    }))
+
+@pytest.mark.parametrize("value, speed", [("60x", 60.0), ("3600X", 3600.0), ("2.5", 2.5), ("", 0.0), (None, 0.0)])
+def test_parse_speed(value, speed):
+    assert parse_speed(value) == speed
+
+def test_clock_maps_wall_time_to_a_position_and_wraps():   #at 60x a wall second is a virtual minute, and the replay starts over after the last one
+    now = [0.0]
+    pyramid = make_pyramid()
+    clock = ReplayClock(pyramid, speed=60, clock=lambda: now[0])
+    keys = pyramid.frame('minute')['group'].to_numpy()
+
+    assert clock.position(keys) == 0
+    now[0] = 3.5
+    assert clock.position(keys) == 3
+    assert clock.position(pyramid.frame('hour')['group'].to_numpy()) == 0
+    now[0] = 12.0
+    assert clock.position(keys) == 2   #10 recorded minutes, then around again
+
+def test_clock_can_start_mid_recording():
+    pyramid = make_pyramid()
+    clock = ReplayClock(pyramid, speed=1, start=pd.Timestamp("2025-01-01 00:07").value, clock=lambda: 0.0)
+    assert clock.position(pyramid.frame('minute')['group'].to_numpy()) == 7
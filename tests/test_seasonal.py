@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from seasonal import SeasonalProfile, last_week, seasonal_insights
+
+HOUR = pd.Timedelta("1h").value
+
+def weekly_series(weeks=4, seed=0):   #hourly usage with an evening peak every day and noise
+    keys = pd.date_range("2025-01-06", periods=weeks * 168, freq='h')   #starts on a Monday
+    values = 1.0 + 2.0 * (keys.hour == 18) + np.random.default_rng(seed).normal(0, 0.05, len(keys))
+    return keys.to_numpy(), values
+
+def test_incremental_profile_matches_one_pass():   #extending with new periods gives the same profile as building from the whole series; the open last period is left out
+    keys, values = weekly_series()
+    whole = SeasonalProfile.from_series(keys, values, HOUR)
+    grown = SeasonalProfile.from_series(keys[:300], values[:300], HOUR)
+    for end in (301, 450, len(keys)):
+        grown = grown.extend(keys[:end], values[:end])
+
+    assert grown.n == whole.n == len(keys) - 1
+    assert np.allclose(grown.total, whole.total) and np.array_equal(grown.count, whole.count)
+    assert grown.extend(keys, values) is grown   #nothing new to fold in
+
+def test_typical_tuesday_evening_and_last_week():   #O(1) lookups of a bucket's mean and spread, and of the period a week earlier, across a gap
+    keys, values = weekly_series()
+    profile = SeasonalProfile.from_series(keys, values, HOUR)
+    mean, std = profile.expected(pd.Timestamp("2025-03-04 18:00"))   #a Tuesday
+    assert abs(mean - 3.0) < 0.05 and 0 < std < 0.1
+    assert profile.label(pd.Timestamp("2025-03-04 18:20")) == "Tuesday 18:00"
+
+    grouped = pd.DataFrame({'group': keys, 'total_power': values})
+    idx = 3 * 168 + 18   #Monday 18:00 of the fourth week
+    assert last_week(grouped, idx, HOUR) == values[idx - 168]
+    gappy = grouped.drop(index=5).reset_index(drop=True)   #one missing hour before it shifts the positions
+    assert last_week(gappy, idx - 1, HOUR) == values[idx - 168]
+
+    insight = seasonal_insights(profile, grouped, idx)
+    assert insight["typicalLabel"] == "Monday 18:00" and abs(insight["typicalPctChange"]) < 5
+    assert insight["lastWeekPower"] == round(values[idx - 168], 3)
+
+def test_typical_value_only_counts_earlier_periods():   #a period is compared with its bucket's earlier weeks, never with itself or later ones, however far the series runs ahead of it
+    keys, values = weekly_series(weeks=4)
+    profile = SeasonalProfile.from_series(keys, values, HOUR)
+    tuesday = 168 + 24 + 18   #Tuesday 18:00 of the second week: one earlier Tuesday evening only
+    assert profile.expected(keys[tuesday], tuesday) is None
+    mean, _ = profile.expected(keys[tuesday + 168], tuesday + 168)   #third week: the first two
+    assert mean == pytest.approx((values[tuesday - 168] + values[tuesday]) / 2)
+
+    values = values.copy()
+    values[tuesday + 168] = 50.0   #a spike is judged against the weeks before it, undiluted by itself
+    grouped = pd.DataFrame({'group': keys, 'total_power': values})
+    insight = seasonal_insights(SeasonalProfile.from_series(keys, values, HOUR), grouped, tuesday + 168)
+    assert insight["typicalPower"] == round(mean, 3) and insight["seasonalZ"] > 100
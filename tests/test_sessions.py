@@ -0,0 +1,67 @@
+import threading
+from sessions import SessionStore
+
+class FakeClock:   #manually advanced clock for TTL tests
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_idle_sessions_expire():   #sessions not seen for longer than the TTL are dropped, active ones survive
+    clock = FakeClock()
+    store = SessionStore(ttl=10, clock=clock)
+    store.get("a")
+    clock.now = 5
+    store.get("b")
+    clock.now = 12
+
+    assert store.expire() == 1
+    assert len(store) == 1
+    assert store.get("b").index == 0
+
+def test_expired_session_starts_over():   #a client returning after expiry gets a fresh cursor
+    clock = FakeClock()
+    store = SessionStore(ttl=10, clock=clock)
+    store.get("a").index = 5
+    clock.now = 20
+
+    assert store.get("a").index == 0
+
+def test_session_cap_evicts_least_recently_seen():   #the store never holds more than max_sessions
+    store = SessionStore(max_sessions=2)
+    store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+
+    assert len(store) == 2
+    assert store.get("a").index == 0 and len(store) == 2
+
+def test_touch_keeps_a_streamed_session_past_ttl_and_eviction():   #a session held by an open stream survives both expiry and the cap, keeping its cursor
+    clock = FakeClock()
+    store = SessionStore(ttl=10, max_sessions=1, clock=clock)
+    session = store.get("a")
+    session.index = 5
+    clock.now = 20
+    store.expire()   #"a" has been idle past the TTL
+    store.get("b")   #and "b" now holds the single slot
+
+    store.touch(session)
+    assert len(store) == 1
+    assert store.get("a").index == 5
+
+def test_concurrent_steps_claim_each_position_once():   #requests racing on one client's cursor never serve the same position twice
+    session = SessionStore().get("a")
+    claimed = []
+    def poll():
+        for _ in range(1000):
+            claimed.append(session.step(10**6))
+    threads = [threading.Thread(target=poll) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(claimed) == list(range(4000))
+    assert session.step(4000) == 0   #past the end it wraps to the start
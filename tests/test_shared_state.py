@@ -0,0 +1,48 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from aggregates import AggregatePyramid, RESOLUTIONS
+from memstat import process_memory
+from shared_state import shared_pyramid
+
+def make_raw():   #two days of minute readings
+    return pd.DataFrame({
+        'datetime':    pd.date_range("2025-01-01", periods=2 * 1440, freq='min'),
+        'total_power': np.linspace(0.5, 2.5, 2 * 1440),
+    })
+
+def test_shared_pyramid_attaches_without_rebuilding(tmp_path):   #the second process attaches the memory-mapped export instead of building again
+    src = tmp_path / "source.xlsx"
+    src.write_bytes(b"v1")
+    builds = []
+
+    def build():
+        builds.append(1)
+        return AggregatePyramid.from_frame(make_raw())
+
+    first = shared_pyramid(str(src), str(tmp_path / "shared"), build)
+    second = shared_pyramid(str(src), str(tmp_path / "shared"), build)
+
+    assert len(builds) == 1
+    for res in RESOLUTIONS:
+        assert isinstance(second.levels[res].keys, np.memmap)
+        assert np.array_equal(first.frame(res)['total_power'], second.frame(res)['total_power'])
+
+def test_shared_pyramid_copies_on_extend(tmp_path):   #appending to a read-only attached pyramid copies the level instead of writing to the shared file
+    src = tmp_path / "source.xlsx"
+    src.write_bytes(b"v1")
+    raw = make_raw()
+    pyramid = shared_pyramid(str(src), str(tmp_path / "shared"), lambda: AggregatePyramid.from_frame(raw))
+
+    pyramid.extend([pd.Timestamp("2025-01-03 00:00:00")], [1.0])
+
+    assert len(pyramid.frame('day')) == 3
+    reattached = shared_pyramid(str(src), str(tmp_path / "shared"), lambda: None)
+    assert len(reattached.frame('day')) == 2
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="needs Linux smaps_rollup")
+def test_process_memory_reports_own_process():
+    mem = process_memory()
+    assert mem['pid'] == os.getpid()
+    assert mem['rss'] >= mem['uss'] > 0